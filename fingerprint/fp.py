@@ -13,10 +13,15 @@ import click
 import lib_doctest_pycharm
 
 # PROJECT
-from fp_conf import fp_conf, fp_files_conf, fp_diff_files_conf, fp_reg_conf
+from fp_conf import fp_conf, fp_files_conf, fp_diff_files_conf, fp_diff_reg_conf, fp_export_conf, fp_reg_conf
+import lib_compression
 import lib_diff_files
+import lib_diff_sharded
+import lib_fp_binary
 import lib_fp_files
 import lib_fp_registry
+import lib_fp_store
+import lib_hash
 import lib_helper_functions
 
 logger = logging.getLogger()
@@ -37,7 +42,36 @@ def fp():
 @click.option('--batchmode', is_flag=True, help='no user interactions')
 @click.option('--no_admin', is_flag=True, help='do not check for admin rights, not recommended')
 @click.option('--no_hashing', is_flag=True, help='do not calculate file hashes, not recommended')
+@click.option('--hash_algo', type=click.Choice(lib_hash.HASH_ALGORITHMS), default=lib_hash.HASH_ALGORITHM_DEFAULT,
+              help='hash algorithm, default sha256 - blake2b is faster on most 64 bit cpus, md5 and sha1 are good enough for change detection')
 @click.option('--no_mp', is_flag=True, help='no multiprocessing - preserves ordering of files in the result')
+@click.option('--mp_ordered', is_flag=True, help='multiprocessing, but write the files in the order of the directory walk')
+@click.option('--mp_batch_size', type=click.IntRange(min=1), default=256, help='number of files per multiprocessing task, default 256')
+@click.option('--tiered', is_flag=True, help='size tiered scheduling: small files in threads while walking, then large files largest first')
+@click.option('--large_file_threshold', type=click.IntRange(min=0), default=8388608, help='tiered: files from this size (bytes) are large, default 8 MiB')
+@click.option('--small_file_workers', type=click.IntRange(min=0), default=4, help='tiered: threads for small files, 0 = inline, default 4')
+@click.option('--large_file_pool', type=click.Choice(['thread', 'process']), default='thread', help='tiered: pool type for large files, default thread')
+@click.option('--large_file_workers', type=click.IntRange(min=0), default=0, help='tiered: workers for large files, default 0 = number of cpus')
+@click.option('--hash_cache', type=click.Path(), default='',
+              help='path to a sqlite hash cache, e.g. c:\\results\\fp_hash_cache.sqlite, or "auto" to keep it next to the output file')
+@click.option('--hash_cache_max_entries', type=click.IntRange(min=0), default=10000000,
+              help='maximum number of entries in the hash cache, least recently used entries are evicted, default 10000000')
+@click.option('--rehash', is_flag=True, help='do not use the hashes from the hash cache, but refresh the cache')
+@click.option('--dedup_hard_links', is_flag=True, help='hash every inode only once, hard links get the hash of the first link')
+@click.option('--link_groups', is_flag=True, help='add the column link_group to the fingerprint, implies --dedup_hard_links')
+@click.option('--exclude', multiple=True,
+              help='exclude rule, can be given multiple times - a glob like ".git", "*.tmp", "users/*/appdata/local/temp" or a regex "re:..."')
+@click.option('--include', multiple=True, help='include rule, can be given multiple times - only matching files are fingerprinted')
+@click.option('--rules_file', type=click.Path(), default='', help='file with one rule per line: "exclude <rule>" or "include <rule>"')
+@click.option('--progress_interval', type=click.FloatRange(min=0), default=10.0, help='seconds between progress lines, 0 = off, default 10')
+@click.option('--metrics_out', type=click.Path(), default='',
+              help='write a json report with throughput, phase times, queue depths and the slowest files, e.g. c:\\results\\fp_metrics.json')
+@click.option('--fp_format', type=click.Choice(['csv', 'binary', 'sqlite']), default='csv',
+              help='csv (default), binary (.fpb, smaller and faster to diff, convert it with fp export) '
+                   'or sqlite (.sqlite, every run adds a snapshot to the fingerprint store)')
+@click.option('--sorted', is_flag=True, help='write the files sorted by path - bounded memory, sorted runs are spilled next to the output file')
+@click.option('--sort_run_size', type=click.IntRange(min=1), default=1000000, help='sorted: files kept in memory per sorted run, default 1000000')
+@click.option('--compress', type=click.Choice(lib_compression.COMPRESSIONS), default=None, help='compress the output file, default not compressed')
 def files(**kwargs):
     """
     (fp files --help for more help on that command)
@@ -56,6 +90,28 @@ def files(**kwargs):
     >>> kwargs['no_admin'] = True
     >>> kwargs['no_mp'] = False
     >>> kwargs['no_hashing'] = False
+    >>> kwargs['hash_algo'] = 'sha256'
+    >>> kwargs['mp_ordered'] = False
+    >>> kwargs['mp_batch_size'] = 256
+    >>> kwargs['tiered'] = False
+    >>> kwargs['large_file_threshold'] = 8388608
+    >>> kwargs['small_file_workers'] = 4
+    >>> kwargs['large_file_pool'] = 'thread'
+    >>> kwargs['large_file_workers'] = 0
+    >>> kwargs['hash_cache'] = ''
+    >>> kwargs['hash_cache_max_entries'] = 10000000
+    >>> kwargs['rehash'] = False
+    >>> kwargs['dedup_hard_links'] = False
+    >>> kwargs['link_groups'] = False
+    >>> kwargs['exclude'] = ()
+    >>> kwargs['include'] = ()
+    >>> kwargs['rules_file'] = ''
+    >>> kwargs['progress_interval'] = 10.0
+    >>> kwargs['metrics_out'] = ''
+    >>> kwargs['fp_format'] = 'csv'
+    >>> kwargs['sorted'] = False
+    >>> kwargs['sort_run_size'] = 1000000
+    >>> kwargs['compress'] = ''
 
     >>> logger.level=logging.ERROR
     >>> files(**kwargs)  # +ELLIPSIS, +NORMALIZE_WHITESPACE
@@ -79,12 +135,15 @@ def files(**kwargs):
     lib_helper_functions.setup_console_logger()
     lib_helper_functions.inform_if_not_run_as_admin(exit_if_not_admin=fp_files_conf.exit_if_not_admin, interactive=fp_conf.interactive)
     logger.info('create files fingerprint {}'.format(fp_conf.version))
+    exit_if_store_compressed(fp_format=fp_files_conf.fp_format)
     check_or_request_fp_dir()
-    check_or_request_f_output()
+    check_or_request_f_output(extension=lib_fp_files.get_fp_output_extension())
     lib_helper_functions.SetupFileLogging(f_output=fp_conf.f_output)
     log_files_parameter()
     with lib_fp_files.FingerPrintFiles() as fingerprint_files:
-        if fp_files_conf.multiprocessing:                # test c:\windows : 66 seconds
+        if fp_files_conf.tiered:
+            fingerprint_files.create_fp_tiered()
+        elif fp_files_conf.multiprocessing:              # test c:\windows : 66 seconds
             fingerprint_files.create_fp_mp()
         else:
             fingerprint_files.create_fp()       # test c:\windows : 124 seconds
@@ -95,6 +154,18 @@ def files(**kwargs):
 @click.option('--fp1', type=click.Path(), default='', help='path to the first fingerprint, e.g. c:\\results\\fp_files_result1.csv')
 @click.option('--fp2', type=click.Path(), default='', help='path to the second fingerprint, e.g. c:\\results\\fp_files_result2.csv')
 @click.option('--f_output', type=click.Path(), default='', help='path to the diff file, e.g. c:\\results\\fp_files_diff_1_2.csv')
+@click.option('--snapshot1', type=click.IntRange(min=0), default=0,
+              help='fingerprint store: snapshot of fp1, default the latest (before snapshot2 if fp1 and fp2 are the same store)')
+@click.option('--snapshot2', type=click.IntRange(min=0), default=0, help='fingerprint store: snapshot of fp2, default the latest')
+@click.option('--diff_engine', type=click.Choice(['auto', 'merge_join', 'hash_join', 'columnar']), default='auto',
+              help='auto (default): merge join with constant memory if both fingerprints were made with --sorted, otherwise hash join. '
+                   'columnar: numpy arrays, fast for big fingerprints, needs numpy')
+@click.option('--shards', type=click.IntRange(min=0), default=0,
+              help='sharded diff for big fingerprints: both fingerprints are partitioned into N shards which are diffed in parallel processes')
+@click.option('--shard_workers', type=click.IntRange(min=0), default=0, help='sharded diff: worker processes, default the number of cpus')
+@click.option('--detect_moves', is_flag=True,
+              help='report deleted and added files with the same content as MOVED or RENAMED with the column old_path, needs hashes')
+@click.option('--compress', type=click.Choice(lib_compression.COMPRESSIONS), default=None, help='compress the output file, default not compressed')
 @click.option('--batchmode', is_flag=True, help='no user interactions')
 def files_diff(**kwargs):
     """
@@ -107,6 +178,13 @@ def files_diff(**kwargs):
     >>> kwargs['fp1'] = './testfiles_source/fp_files_result1_difftest.csv'
     >>> kwargs['fp2'] = './testfiles_source/fp_files_result2_difftest.csv'
     >>> kwargs['f_output'] = './testresults/fp_files_diff_1_2.csv'
+    >>> kwargs['snapshot1'] = 0
+    >>> kwargs['snapshot2'] = 0
+    >>> kwargs['diff_engine'] = 'auto'
+    >>> kwargs['shards'] = 0
+    >>> kwargs['shard_workers'] = 0
+    >>> kwargs['detect_moves'] = False
+    >>> kwargs['compress'] = ''
     >>> kwargs['batchmode'] = True
     >>> logger.level=logging.ERROR
     >>> files_diff(**kwargs)  # +ELLIPSIS, +NORMALIZE_WHITESPACE
@@ -127,6 +205,44 @@ def files_diff(**kwargs):
     exit_message()
 
 
+@fp.command()
+@click.option('--fp', type=click.Path(), default='', help='path to the binary fingerprint, e.g. c:\\results\\fp_files_result1.fpb')
+@click.option('--f_output', type=click.Path(), default='', help='path to the csv file, e.g. c:\\results\\fp_files_result1.csv')
+@click.option('--compress', type=click.Choice(lib_compression.COMPRESSIONS), default=None, help='compress the output file, default not compressed')
+@click.option('--batchmode', is_flag=True, help='no user interactions')
+def export(**kwargs):
+    """
+    (fp export --help for more help on that command)
+    """
+
+    """
+    >>> import lib_doctest
+    >>> import lib_data_structures
+    >>> with open('./testresults/fp_files_export_cli.fpb', 'wb') as f_out:
+    ...     binary_writer = lib_fp_binary.FingerPrintBinaryWriter(f_out)
+    ...     binary_writer.write_fileinfo(lib_data_structures.DataStructFileInfo())
+    ...     binary_writer.close()
+    >>> kwargs = dict()
+    >>> kwargs['fp'] = './testresults/fp_files_export_cli.fpb'
+    >>> kwargs['f_output'] = './testresults/fp_files_export_cli.csv'
+    >>> kwargs['compress'] = ''
+    >>> kwargs['batchmode'] = True
+    >>> logger.level=logging.ERROR
+    >>> export(**kwargs)  # +ELLIPSIS, +NORMALIZE_WHITESPACE
+
+    """
+
+    export_save_commandline_options_to_conf(**kwargs)
+    lib_helper_functions.setup_console_logger()
+    logger.info('export binary fingerprint {}'.format(fp_conf.version))
+    fp_export_conf.fp_path = check_or_request_fp_file(f_input_file=fp_export_conf.fp_path, file_number=1)
+    check_or_request_f_output()
+    lib_helper_functions.SetupFileLogging(f_output=fp_conf.f_output)
+    log_export_parameter()
+    lib_fp_binary.export_fingerprint(f_fp_binary=fp_export_conf.fp_path, f_csv=fp_conf.f_output, compress=fp_conf.compress)
+    exit_message()
+
+
 @fp.command()
 @click.option('--f_output', type=click.Path(), default='', help='path to the output file, e.g. c:\\results\\fp_registry_result1.csv')
 @click.option('--field_length_limit', type=click.INT, default=32767,
@@ -134,6 +250,21 @@ def files_diff(**kwargs):
 @click.option('--reg_save_additional_parameters', default='', help='optional reg save parameters, e.g. "/reg:64" or "/reg:32"')
 @click.option('--do_not_delete_hive_copies', is_flag=True, help='do not delete the registry hive files')
 @click.option('--no_admin', is_flag=True, help='do not check for admin rights, not recommended')
+@click.option('--fp_format', type=click.Choice(['csv', 'sqlite']), default='csv',
+              help='csv (default) or sqlite (.sqlite, every run adds a snapshot to the fingerprint store, needed for fp reg_diff)')
+@click.option('--sorted', is_flag=True, help='write the registry sorted by path and value name')
+@click.option('--sort_run_size', type=click.IntRange(min=1), default=1000000, help='sorted: rows kept in memory per sorted run, default 1000000')
+@click.option('--hive_workers', type=click.IntRange(min=0), default=1,
+              help='parse every hive in its own worker process, 0 = the number of cpus, default 1 (sequential)')
+@click.option('--split_depth', type=click.IntRange(min=0), default=0,
+              help='hive workers: split the hives into subtrees at this key depth, e.g. 1 = every top level key, default 0 (whole hives)')
+@click.option('--reg_backend', type=click.Choice(['python-registry', 'mmap']), default='python-registry',
+              help='hive reader: python-registry (default) or mmap (built in, reads the mapped hive file in place)')
+@click.option('--baseline', type=click.Path(), default='',
+              help='a previous registry fingerprint (csv or sqlite), the values of keys with the same last write time are taken from it')
+@click.option('--baseline_verify', type=click.IntRange(min=0), default=0,
+              help='baseline: read every n-th reused key from the hive and compare it with the baseline, default 0 (none)')
+@click.option('--compress', type=click.Choice(lib_compression.COMPRESSIONS), default=None, help='compress the output file, default not compressed')
 @click.option('--batchmode', is_flag=True, help='no user interactions')
 def reg(**kwargs):
     """
@@ -144,7 +275,8 @@ def reg(**kwargs):
     lib_helper_functions.setup_console_logger()
     lib_helper_functions.inform_if_not_run_as_admin(exit_if_not_admin=fp_reg_conf.exit_if_not_admin, interactive=fp_conf.interactive)
     logger.info('create registry fingerprint {}'.format(fp_conf.version))
-    check_or_request_f_output(fp_conf.f_output)
+    exit_if_store_compressed(fp_format=fp_reg_conf.fp_format)
+    check_or_request_f_output(extension=lib_fp_store.FP_STORE_EXTENSION if fp_reg_conf.fp_format == 'sqlite' else '.csv')
     lib_helper_functions.SetupFileLogging(f_output=fp_conf.f_output)
     log_reg_parameter()
     with lib_fp_registry.FingerPrintRegistry() as fingerprint_registry:
@@ -152,18 +284,108 @@ def reg(**kwargs):
     exit_message()
 
 
+@fp.command()
+@click.option('--fp1', type=click.Path(), default='', help='path to the first fingerprint store, e.g. c:\\results\\fp_registry.sqlite')
+@click.option('--fp2', type=click.Path(), default='', help='path to the second fingerprint store, default the first one')
+@click.option('--f_output', type=click.Path(), default='', help='path to the diff file, e.g. c:\\results\\fp_registry_diff_1_2.csv')
+@click.option('--snapshot1', type=click.IntRange(min=0), default=0,
+              help='snapshot of fp1, default the latest (before snapshot2 if fp1 and fp2 are the same store)')
+@click.option('--snapshot2', type=click.IntRange(min=0), default=0, help='snapshot of fp2, default the latest')
+@click.option('--check_modified', is_flag=True, help='report keys whose modified timestamp changed - noisy')
+@click.option('--shards', type=click.IntRange(min=0), default=0,
+              help='sharded diff for big fingerprints: both fingerprints are partitioned into N shards which are diffed in parallel processes')
+@click.option('--shard_workers', type=click.IntRange(min=0), default=0, help='sharded diff: worker processes, default the number of cpus')
+@click.option('--compress', type=click.Choice(lib_compression.COMPRESSIONS), default=None, help='compress the output file, default not compressed')
+@click.option('--batchmode', is_flag=True, help='no user interactions')
+def reg_diff(**kwargs):
+    """
+    (fp reg_diff --help for more help on that command)
+    """
+
+    reg_diff_save_commandline_options_to_conf(**kwargs)
+    lib_helper_functions.setup_console_logger()
+    logger.info('create registry fingerprint diff {}'.format(fp_conf.version))
+    fp_diff_reg_conf.fp1_path = check_or_request_fp_file(f_input_file=fp_diff_reg_conf.fp1_path, file_number=1)
+    fp_diff_reg_conf.fp2_path = check_or_request_fp_file(f_input_file=fp_diff_reg_conf.fp2_path or fp_diff_reg_conf.fp1_path, file_number=2)
+    check_or_request_f_output()
+    lib_helper_functions.SetupFileLogging(f_output=fp_conf.f_output)
+    for f_fingerprint in (fp_diff_reg_conf.fp1_path, fp_diff_reg_conf.fp2_path):
+        if not lib_fp_store.is_fp_store(f_fingerprint):
+            logger.error('{} is not a fingerprint store, registry diffs need fingerprints made with fp reg --fp_format sqlite'.format(f_fingerprint))
+            lib_helper_functions.logger_flush_all_handlers()
+            sys.exit(1)
+    fp_diff_reg_conf.snapshot1, fp_diff_reg_conf.snapshot2 = lib_fp_store.resolve_snapshot_ids(
+        fp_diff_reg_conf.fp1_path, fp_diff_reg_conf.fp2_path, fp_diff_reg_conf.snapshot1, fp_diff_reg_conf.snapshot2, 'registry')
+    log_reg_diff_parameter()
+    if fp_diff_reg_conf.shards > 1:
+        sharded_diff = lib_diff_sharded.ShardedDiff(n_shards=fp_diff_reg_conf.shards, n_workers=fp_diff_reg_conf.shard_workers,
+                                                    tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+        dict_rows = sharded_diff.iter_registry_diff(fp_diff_reg_conf.fp1_path, fp_diff_reg_conf.fp2_path, fp_diff_reg_conf.snapshot1,
+                                                    fp_diff_reg_conf.snapshot2, check_modified=fp_diff_reg_conf.check_modified)
+        n_rows = lib_fp_store.write_registry_diff_rows(dict_rows, fp_conf.f_output, compress=fp_conf.compress)
+    else:
+        n_rows = lib_fp_store.write_registry_diff(fp_diff_reg_conf.fp1_path, fp_diff_reg_conf.fp2_path, fp_diff_reg_conf.snapshot1,
+                                                  fp_diff_reg_conf.snapshot2, fp_conf.f_output, check_modified=fp_diff_reg_conf.check_modified,
+                                                  compress=fp_conf.compress)
+    logger.info('{} registry changes written'.format(n_rows))
+    exit_message()
+
+
 def files_save_commandline_options_to_conf(**kwargs):
     save_common_parameters_to_conf(**kwargs)
     fp_files_conf.fp_dir = kwargs['fp_dir']
     fp_files_conf.exit_if_not_admin = not kwargs['no_admin']
     fp_files_conf.hash_files = not kwargs['no_hashing']
+    fp_files_conf.hash_algo = kwargs['hash_algo']
     fp_files_conf.multiprocessing = not kwargs['no_mp']
+    fp_files_conf.mp_ordered = kwargs['mp_ordered']
+    fp_files_conf.mp_batch_size = kwargs['mp_batch_size']
+    fp_files_conf.tiered = kwargs['tiered']
+    fp_files_conf.large_file_threshold = kwargs['large_file_threshold']
+    fp_files_conf.small_file_workers = kwargs['small_file_workers']
+    fp_files_conf.large_file_pool = kwargs['large_file_pool']
+    fp_files_conf.large_file_workers = kwargs['large_file_workers']
+    fp_files_conf.hash_cache_path = kwargs['hash_cache']
+    fp_files_conf.hash_cache_max_entries = kwargs['hash_cache_max_entries']
+    fp_files_conf.rehash = kwargs['rehash']
+    fp_files_conf.dedup_hard_links = kwargs['dedup_hard_links']
+    fp_files_conf.link_groups = kwargs['link_groups']
+    fp_files_conf.exclude = list(kwargs['exclude'])
+    fp_files_conf.include = list(kwargs['include'])
+    fp_files_conf.rules_file = kwargs['rules_file']
+    fp_files_conf.progress_interval = kwargs['progress_interval']
+    fp_files_conf.metrics_out = kwargs['metrics_out']
+    fp_files_conf.fp_format = kwargs['fp_format']
+    fp_files_conf.sorted = kwargs['sorted']
+    fp_files_conf.sort_run_size = kwargs['sort_run_size']
 
 
 def diff_files_save_commandline_options_to_conf(**kwargs):
     save_common_parameters_to_conf(**kwargs)
     fp_diff_files_conf.fp1_path = kwargs['fp1']
     fp_diff_files_conf.fp2_path = kwargs['fp2']
+    fp_diff_files_conf.snapshot1 = kwargs['snapshot1']
+    fp_diff_files_conf.snapshot2 = kwargs['snapshot2']
+    fp_diff_files_conf.diff_engine = kwargs['diff_engine']
+    fp_diff_files_conf.shards = kwargs['shards']
+    fp_diff_files_conf.shard_workers = kwargs['shard_workers']
+    fp_diff_files_conf.detect_moves = kwargs['detect_moves']
+
+
+def reg_diff_save_commandline_options_to_conf(**kwargs):
+    save_common_parameters_to_conf(**kwargs)
+    fp_diff_reg_conf.fp1_path = kwargs['fp1']
+    fp_diff_reg_conf.fp2_path = kwargs['fp2']
+    fp_diff_reg_conf.snapshot1 = kwargs['snapshot1']
+    fp_diff_reg_conf.snapshot2 = kwargs['snapshot2']
+    fp_diff_reg_conf.check_modified = kwargs['check_modified']
+    fp_diff_reg_conf.shards = kwargs['shards']
+    fp_diff_reg_conf.shard_workers = kwargs['shard_workers']
+
+
+def export_save_commandline_options_to_conf(**kwargs):
+    save_common_parameters_to_conf(**kwargs)
+    fp_export_conf.fp_path = kwargs['fp']
 
 
 def reg_save_commandline_options_to_conf(**kwargs):
@@ -172,11 +394,20 @@ def reg_save_commandline_options_to_conf(**kwargs):
     fp_reg_conf.reg_save_additional_parameters = kwargs['reg_save_additional_parameters']
     fp_reg_conf.delete_hive_copies = not kwargs['do_not_delete_hive_copies']
     fp_reg_conf.exit_if_not_admin = not kwargs['no_admin']
+    fp_reg_conf.fp_format = kwargs['fp_format']
+    fp_reg_conf.sorted = kwargs['sorted']
+    fp_reg_conf.sort_run_size = kwargs['sort_run_size']
+    fp_reg_conf.hive_workers = kwargs['hive_workers']
+    fp_reg_conf.split_depth = kwargs['split_depth']
+    fp_reg_conf.reg_backend = kwargs['reg_backend']
+    fp_reg_conf.baseline = kwargs['baseline']
+    fp_reg_conf.baseline_verify = kwargs['baseline_verify']
 
 
 def save_common_parameters_to_conf(**kwargs):
     fp_conf.f_output = kwargs['f_output']
     fp_conf.interactive = not kwargs['batchmode']
+    fp_conf.compress = kwargs['compress'] or ''
 
 
 def check_or_request_fp_file(f_input_file: str, file_number: int, test_input: str = '') -> str:
@@ -237,7 +468,7 @@ def is_fp_input_file_ok(f_path: str) -> bool:
         return False
 
 
-def check_or_request_f_output(test_input: str = ''):
+def check_or_request_f_output(test_input: str = '', extension: str = '.csv'):
     """
     >>> fp_conf.interactive = False
     >>> fp_conf.f_output = './testresults/fp_files_result1.csv'
@@ -252,15 +483,27 @@ def check_or_request_f_output(test_input: str = ''):
     >>> fp_conf.f_output = 'x:/testresults/fp_files_result_test'
     >>> check_or_request_f_output(test_input='./testresults/fp_files_result1.csv')
 
+    >>> fp_conf.f_output = './testresults/fp_files_result1.csv'
+    >>> check_or_request_f_output(extension='.fpb')
+    >>> fp_conf.f_output
+    './testresults/fp_files_result1.fpb'
+
+    >>> fp_conf.compress = 'gzip'
+    >>> fp_conf.f_output = './testresults/fp_files_result1.csv.bz2'
+    >>> check_or_request_f_output()
+    >>> fp_conf.f_output
+    './testresults/fp_files_result1.csv.gz'
+    >>> fp_conf.compress = ''
     """
-    fp_conf.f_output = lib_helper_functions.strip_extension(fp_conf.f_output) + '.csv'
+    extension = extension + lib_compression.get_compression_extension(fp_conf.compress)
+    fp_conf.f_output = get_f_output_with_extension(fp_conf.f_output, extension)
     while not is_f_output_ok(f_path=fp_conf.f_output):
         if fp_conf.interactive:
             if test_input:
                 fp_conf.f_output = test_input
             else:
-                fp_conf.f_output = input('result filename (e.g. c:\\results\\<f_out>.csv ): ')
-                fp_conf.f_output = lib_helper_functions.strip_extension(fp_conf.f_output) + '.csv'
+                fp_conf.f_output = input('result filename (e.g. c:\\results\\<f_out>{} ): '.format(extension))
+                fp_conf.f_output = get_f_output_with_extension(fp_conf.f_output, extension)
             if not is_f_output_ok(f_path=fp_conf.f_output):
                 logger.info('can not write to {}, probably access rights'.format(fp_conf.f_output))
             else:
@@ -270,6 +513,22 @@ def check_or_request_f_output(test_input: str = ''):
             sys.exit(1)
 
 
+def get_f_output_with_extension(f_output: str, extension: str) -> str:
+    """
+    >>> get_f_output_with_extension('c:/results/fp1.csv.xz', '.fpb.gz')
+    'c:/results/fp1.fpb.gz'
+    """
+    return lib_helper_functions.strip_extension(lib_compression.strip_compression_extension(f_output)) + extension
+
+
+def exit_if_store_compressed(fp_format: str):
+    """ a fingerprint store is a sqlite database, it can not be compressed """
+    if fp_format == 'sqlite' and fp_conf.compress:
+        logger.error('a fingerprint store (--fp_format sqlite) can not be compressed, remove --compress')
+        lib_helper_functions.logger_flush_all_handlers()
+        sys.exit(1)
+
+
 def check_or_request_fp_dir(test_input: str = ''):
     """
     >>> import test
@@ -347,13 +606,58 @@ def is_f_output_ok(f_path: str) -> bool:
 def log_files_parameter():
     logger.info('fingerprinting directory : {}'.format(fp_files_conf.fp_dir))
     logger.info('file hashing             : {}'.format(fp_files_conf.hash_files))
+    logger.info('hash algorithm           : {}'.format(fp_files_conf.hash_algo))
+    logger.info('hash cache               : {}'.format(fp_files_conf.hash_cache_path))
+    logger.info('dedup hard links         : {}'.format(fp_files_conf.dedup_hard_links or fp_files_conf.link_groups))
+    logger.info('link groups              : {}'.format(fp_files_conf.link_groups))
+    logger.info('exclude rules            : {}'.format(', '.join(fp_files_conf.exclude)))
+    logger.info('include rules            : {}'.format(', '.join(fp_files_conf.include)))
+    logger.info('rules file               : {}'.format(fp_files_conf.rules_file))
+    logger.info('progress interval        : {}'.format(fp_files_conf.progress_interval))
+    logger.info('metrics report           : {}'.format(fp_files_conf.metrics_out))
+    logger.info('fingerprint format       : {}'.format(fp_files_conf.fp_format))
+    logger.info('sorted                   : {}'.format(fp_files_conf.sorted))
+    if fp_files_conf.hash_cache_path:
+        logger.info('rehash                   : {}'.format(fp_files_conf.rehash))
+    logger.info('tiered scheduling        : {}'.format(fp_files_conf.tiered))
+    if fp_files_conf.tiered:
+        logger.info('large file threshold     : {}'.format(fp_files_conf.large_file_threshold))
+        logger.info('small file workers       : {}'.format(fp_files_conf.small_file_workers))
+        logger.info('large file pool          : {} ({} workers)'.format(fp_files_conf.large_file_pool, fp_files_conf.large_file_workers or 'cpu_count'))
     logger.info('multiprocessing          : {}'.format(fp_files_conf.multiprocessing))
+    if fp_files_conf.multiprocessing and not fp_files_conf.tiered:
+        logger.info('mp ordered               : {}'.format(fp_files_conf.mp_ordered))
+        logger.info('mp batch size            : {}'.format(fp_files_conf.mp_batch_size))
     log_common_parameter()
 
 
 def log_files_diff_parameter():
     logger.info('fp1       : {}'.format(fp_diff_files_conf.fp1_path))
     logger.info('fp2       : {}'.format(fp_diff_files_conf.fp2_path))
+    if fp_diff_files_conf.snapshot1 or fp_diff_files_conf.snapshot2:
+        logger.info('snapshot1 : {}'.format(fp_diff_files_conf.snapshot1))
+        logger.info('snapshot2 : {}'.format(fp_diff_files_conf.snapshot2))
+    logger.info('engine    : {}'.format(fp_diff_files_conf.diff_engine))
+    if fp_diff_files_conf.shards > 1:
+        logger.info('shards    : {} ({} workers)'.format(fp_diff_files_conf.shards, fp_diff_files_conf.shard_workers or 'cpu_count'))
+    if fp_diff_files_conf.detect_moves:
+        logger.info('moves     : detect moved and renamed files')
+    log_common_parameter()
+
+
+def log_reg_diff_parameter():
+    logger.info('fp1            : {}'.format(fp_diff_reg_conf.fp1_path))
+    logger.info('snapshot1      : {}'.format(fp_diff_reg_conf.snapshot1))
+    logger.info('fp2            : {}'.format(fp_diff_reg_conf.fp2_path))
+    logger.info('snapshot2      : {}'.format(fp_diff_reg_conf.snapshot2))
+    logger.info('check_modified : {}'.format(fp_diff_reg_conf.check_modified))
+    if fp_diff_reg_conf.shards > 1:
+        logger.info('shards         : {} ({} workers)'.format(fp_diff_reg_conf.shards, fp_diff_reg_conf.shard_workers or 'cpu_count'))
+    log_common_parameter()
+
+
+def log_export_parameter():
+    logger.info('fp        : {}'.format(fp_export_conf.fp_path))
     log_common_parameter()
 
 
@@ -361,12 +665,23 @@ def log_reg_parameter():
     logger.info('field_length_limit             : {}'.format(fp_reg_conf.field_length_limit))
     logger.info('reg_save_additional_parameters : {}'.format(fp_reg_conf.reg_save_additional_parameters))
     logger.info('delete_hives                   : {}'.format(fp_reg_conf.delete_hive_copies))
+    logger.info('fingerprint format             : {}'.format(fp_reg_conf.fp_format))
+    logger.info('sorted                         : {}'.format(fp_reg_conf.sorted))
+    logger.info('hive workers                   : {}'.format(fp_reg_conf.hive_workers or 'cpu_count'))
+    if fp_reg_conf.hive_workers != 1:
+        logger.info('split depth                    : {}'.format(fp_reg_conf.split_depth or 'whole hives'))
+    logger.info('registry backend               : {}'.format(fp_reg_conf.reg_backend))
+    logger.info('baseline                       : {}'.format(fp_reg_conf.baseline or 'none'))
+    if fp_reg_conf.baseline:
+        baseline_verify = 'every {}. reused key'.format(fp_reg_conf.baseline_verify) if fp_reg_conf.baseline_verify else 'none'
+        logger.info('baseline verify                : {}'.format(baseline_verify))
     log_common_parameter()
 
 
 def log_common_parameter():
     logger.info('f_output                       : {}'.format(fp_conf.f_output))
     logger.info('batchmode                      : {}'.format(not fp_conf.interactive))
+    logger.info('compress                       : {}'.format(fp_conf.compress or 'no'))
 
 
 def exit_message():
@@ -1,30 +1,85 @@
+from typing import List
+
 class FPConf(object):
     def __init__(self):
         self.f_output: str = ''
         self.version:str = '2.0.3 Prerelease'
         self.interactive:bool = True
+        self.compress:str = ''                  # compression of the output file, 'gzip', 'bz2', 'lzma' or '' = none, see lib_compression
 
 class FPFilesConf(object):
     def __init__(self):
         self.fp_dir:str = ''
         self.exit_if_not_admin:bool = True
         self.hash_files:bool = True
+        self.hash_algo:str = 'sha256'           # see lib_hash.HASH_ALGORITHMS
         self.multiprocessing:bool = True
+        self.mp_batch_size:int = 256            # files per multiprocessing task
+        self.mp_max_in_flight:int = 0           # batches submitted but not yet written, 0 = 4 * workers
+        self.mp_ordered:bool = False            # write multiprocessing results in the order of the directory walk
+        self.tiered:bool = False                # size tiered scheduling, see lib_fp_files.FingerPrintFiles.create_fp_tiered()
+        self.large_file_threshold:int = 8388608
+        self.small_file_workers:int = 4         # threads for small files, 0 = inline
+        self.large_file_pool:str = 'thread'     # 'thread' or 'process'
+        self.large_file_workers:int = 0         # 0 = cpu_count
+        self.hash_cache_path:str = ''           # sqlite hash cache, '' = no cache, 'auto' = next to the output file
+        self.hash_cache_max_entries:int = 10000000
+        self.rehash:bool = False                # do not use cached hashes, but refresh the cache
+        self.dedup_hard_links:bool = False      # hash every inode only once, hard links get the hash of the first link
+        self.link_groups:bool = False           # add the column link_group to the fingerprint, implies dedup_hard_links
+        self.exclude:List[str] = list()         # exclude rules for the directory walk, see lib_walk_rules
+        self.include:List[str] = list()         # include rules for the directory walk
+        self.rules_file:str = ''                # file with include / exclude rules
+        self.progress_interval:float = 10.0     # seconds between progress lines, 0 = no progress lines
+        self.metrics_out:str = ''               # path of the json metrics report, '' = no report
+        self.fp_format:str = 'csv'              # 'csv', 'binary' (see lib_fp_binary) or 'sqlite' (see lib_fp_store)
+        self.sorted:bool = False                # write the files sorted by path, see lib_external_sort
+        self.sort_run_size:int = 1000000        # files kept in memory while sorting, more are spilled to sorted runs
 
 class FPDiffFilesConf(object):
     def __init__(self):
         self.fp1_path:str = ''
         self.fp2_path:str = ''
+        self.snapshot1:int = 0                  # snapshots of a fingerprint store, 0 = default, see lib_fp_store
+        self.snapshot2:int = 0
+        self.diff_engine:str = 'auto'           # 'auto', 'merge_join' (sorted fingerprints), 'hash_join' or 'columnar' (numpy), see lib_diff_files
+        self.shards:int = 0                     # > 1 : sharded diff in parallel processes, see lib_diff_sharded
+        self.shard_workers:int = 0              # worker processes of the sharded diff, 0 = cpu_count
+        self.detect_moves:bool = False          # pair DELETED and ADDED files with the same content to MOVED / RENAMED, see lib_diff_moves
         self.logfile_fullpath:str = ''
 
+class FPDiffRegConf(object):
+    def __init__(self):
+        self.fp1_path:str = ''                  # registry diffs need fingerprint stores, see lib_fp_store
+        self.fp2_path:str = ''
+        self.snapshot1:int = 0
+        self.snapshot2:int = 0
+        self.check_modified:bool = False        # report keys whose modified timestamp changed - noisy
+        self.shards:int = 0                     # > 1 : sharded diff in parallel processes, see lib_diff_sharded
+        self.shard_workers:int = 0              # worker processes of the sharded diff, 0 = cpu_count
+
+class FPExportConf(object):
+    def __init__(self):
+        self.fp_path:str = ''                   # the binary fingerprint to export as csv
+
 class FPRegConf(object):
     def __init__(self):
         self.field_length_limit:int = 32767
         self.reg_save_additional_parameters:str = ''
         self.delete_hive_copies:bool = True
         self.exit_if_not_admin: bool = True
+        self.fp_format:str = 'csv'              # 'csv' or 'sqlite' (see lib_fp_store)
+        self.sorted:bool = False                # write the registry sorted by path and value name, see lib_external_sort
+        self.sort_run_size:int = 1000000        # rows kept in memory while sorting, more are spilled to sorted runs
+        self.hive_workers:int = 1               # worker processes parsing the hives, 1 = sequential, 0 = cpu_count (see lib_fp_registry_parallel)
+        self.split_depth:int = 0                # hive workers : the hives are split into subtrees at this key depth, 0 = one unit per hive
+        self.reg_backend:str = 'python-registry'  # hive reader : 'python-registry' or 'mmap' (see lib_regf)
+        self.baseline:str = ''                  # a previous registry fingerprint, the values of unchanged keys are reused (see lib_fp_registry_baseline)
+        self.baseline_verify:int = 0            # baseline : every n-th reused key is read from the hive and compared, 0 = none
 
 fp_conf:FPConf = FPConf()
 fp_files_conf:FPFilesConf = FPFilesConf()
 fp_diff_files_conf:FPDiffFilesConf = FPDiffFilesConf()
+fp_diff_reg_conf:FPDiffRegConf = FPDiffRegConf()
+fp_export_conf:FPExportConf = FPExportConf()
 fp_reg_conf:FPRegConf = FPRegConf()
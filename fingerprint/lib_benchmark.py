@@ -0,0 +1,593 @@
+import lib_data_structures
+import lib_detect_encoding
+import lib_diff_files
+import lib_diff_sharded
+import lib_doctest_pycharm
+import lib_fp_binary
+import lib_fp_registry
+import lib_fp_registry_baseline
+import lib_fp_registry_parallel
+import lib_hash
+import lib_helper_functions
+import lib_hive_writer
+import lib_reg_decode
+import logging
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# micro benchmarks for the hot paths - run with : python lib_benchmark.py
+# results are logged and returned, so they can be compared between versions
+
+BENCHMARK_HIVE_DEPTH: int = 64          # keys per chain of the deep synthetic hive - windows allows 512 levels
+BENCHMARK_HIVE_SAM: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'test_registry_hklm_sam.hive')
+
+
+def measure(function: Callable, repeat: int = 3) -> float:
+    """
+    returns the best wall time of repeat runs in seconds
+
+    >>> measure(lambda: None) >= 0
+    True
+    """
+    l_seconds = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        l_seconds.append(time.perf_counter() - start)
+    return min(l_seconds)
+
+
+def create_benchmark_files(f_dir: str, l_file_sizes: List[int]) -> List[str]:
+    """
+    >>> f_dir = tempfile.mkdtemp()
+    >>> l_files = create_benchmark_files(f_dir, [0, 10])
+    >>> [os.path.getsize(f_name) for f_name in l_files]
+    [0, 10]
+    >>> shutil.rmtree(f_dir)
+    """
+    l_files = list()
+    for n, file_size in enumerate(l_file_sizes):
+        f_name = os.path.join(f_dir, 'benchmark_{}_{}.bin'.format(n, file_size))
+        with open(f_name, 'wb') as f_out:
+            f_out.write(os.urandom(file_size))
+        l_files.append(f_name)
+    return l_files
+
+
+def benchmark_file_hashing(l_file_sizes: List[int] = None, hash_algo: str = 'sha256', repeat: int = 3) -> Dict[str, float]:
+    """
+    compares the old generator based hashing (a new bytes object per block) with lib_hash.FileHasher
+    (one reused buffer + readinto, mmap for large files). returns MiB/s per implementation
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_file_hashing(l_file_sizes=[0, 1000, 100000], repeat=1)
+    >>> sorted(dict_results.keys())
+    ['blockiter_mib_s', 'file_hasher_mib_s', 'speedup']
+    """
+    if l_file_sizes is None:
+        # many small files, some medium sized, one file above the mmap threshold
+        l_file_sizes = [4096] * 2000 + [1048576 * 4] * 16 + [lib_hash.MMAP_THRESHOLD * 2]
+
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+    try:
+        l_files = create_benchmark_files(f_dir, l_file_sizes)
+        mib_total = max(sum(l_file_sizes), 1) / 1048576
+
+        # warm the page cache, we want to measure the hashing and not the disk
+        [lib_hash.get_file_hash_blockiter(f_name, hash_algo) for f_name in l_files]
+
+        seconds_blockiter = measure(lambda: [lib_hash.get_file_hash_blockiter(f_name, hash_algo) for f_name in l_files], repeat)
+        seconds_file_hasher = measure(lambda: [lib_hash.get_file_hash(f_name, hash_algo) for f_name in l_files], repeat)
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+
+    dict_results = dict()
+    dict_results['blockiter_mib_s'] = mib_total / max(seconds_blockiter, 1e-9)
+    dict_results['file_hasher_mib_s'] = mib_total / max(seconds_file_hasher, 1e-9)
+    dict_results['speedup'] = seconds_blockiter / max(seconds_file_hasher, 1e-9)
+    logger.info('file hashing ({}, {} files, {:.1f} MiB): generator {:.1f} MiB/s, FileHasher {:.1f} MiB/s, speedup {:.2f}'.format(
+        hash_algo, len(l_file_sizes), mib_total, dict_results['blockiter_mib_s'], dict_results['file_hasher_mib_s'], dict_results['speedup']))
+    return dict_results
+
+
+class DataStructFileInfoEager(object):
+    """ lib_data_structures.DataStructFileInfo before it got __slots__ and lazy timestamps - the baseline for benchmark_fileinfo """
+    def __init__(self):
+        self.path = ''
+        self.size = 0
+        self._created_float, self._created = 0.0, lib_data_structures.DATETIME_DEFAULT
+        self._modified_float, self._modified = 0.0, lib_data_structures.DATETIME_DEFAULT
+        self._accessed_float, self._accessed = 0.0, lib_data_structures.DATETIME_DEFAULT
+        self.hash = ''
+        self.change = ''
+        self.remark = ''
+
+    def set_stat_result(self, stat_result):
+        self.accessed_float = stat_result.st_atime
+        self.modified_float = stat_result.st_mtime
+        self.created_float = stat_result.st_ctime
+        self.size = stat_result.st_size
+
+    @property
+    def created(self):
+        return self._created
+
+    @created.setter
+    def created(self, created):
+        self._created, self._created_float = created, lib_helper_functions.convert_datetime_or_datestr_to_float(created)
+
+    @property
+    def created_float(self):
+        return self._created_float
+
+    @created_float.setter
+    def created_float(self, created):
+        self._created_float, self._created = created, lib_helper_functions.convert_float_to_datetime(created)
+
+    @property
+    def modified(self):
+        return self._modified
+
+    @modified.setter
+    def modified(self, modified):
+        self._modified, self._modified_float = modified, lib_helper_functions.convert_datetime_or_datestr_to_float(modified)
+
+    @property
+    def modified_float(self):
+        return self._modified_float
+
+    @modified_float.setter
+    def modified_float(self, modified):
+        self._modified_float, self._modified = modified, lib_helper_functions.convert_float_to_datetime(modified)
+
+    @property
+    def accessed(self):
+        return self._accessed
+
+    @accessed.setter
+    def accessed(self, accessed):
+        self._accessed, self._accessed_float = accessed, lib_helper_functions.convert_datetime_or_datestr_to_float(accessed)
+
+    @property
+    def accessed_float(self):
+        return self._accessed_float
+
+    @accessed_float.setter
+    def accessed_float(self, accessed):
+        self._accessed_float, self._accessed = accessed, lib_helper_functions.convert_float_to_datetime(accessed)
+
+    def get_data_dict(self) -> dict:
+        return {'path': self.path, 'size': self.size, 'created': self._created, 'modified': self._modified, 'accessed': self._accessed,
+                'hash': self.hash, 'change': self.change, 'remark': self.remark}
+
+
+def benchmark_fileinfo(n_rows: int = 100000, repeat: int = 3) -> Dict[str, float]:
+    """
+    per row costs of the fileinfo record, eager (DataStructFileInfoEager) against lib_data_structures.DataStructFileInfo :
+        scan : fileinfo from a stat result, written as csv row (get_data_dict)
+        diff : fileinfo from a csv row (datestr), created and modified compared - like lib_diff_files does it, three per row
+        memory : bytes per fileinfo made from a stat result
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_fileinfo(n_rows=100, repeat=1)
+    >>> sorted(dict_results.keys())  # doctest: +NORMALIZE_WHITESPACE
+    ['diff_us_eager', 'diff_us_slotted', 'memory_bytes_eager', 'memory_bytes_slotted', 'scan_us_eager', 'scan_us_slotted']
+    """
+    stat_result = os.stat(__file__)
+    dict_csv_row = {'path': __file__, 'size': '1234', 'created': '2018-11-14 19:46:58.076271', 'modified': '2018-11-14 19:46:58.076271',
+                    'accessed': '2018-11-14 19:46:58.076271', 'hash': 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+                    'change': '', 'remark': ''}
+
+    def scan(fileinfo_class):
+        for _ in range(n_rows):
+            fileinfo = fileinfo_class()
+            fileinfo.path = __file__
+            fileinfo.set_stat_result(stat_result)
+            fileinfo.get_data_dict()
+
+    def diff(fileinfo_class):
+        for _ in range(n_rows):
+            l_fileinfo = list()
+            for _ in range(3):
+                fileinfo = fileinfo_class()
+                for key, data in dict_csv_row.items():
+                    setattr(fileinfo, key, data)
+                l_fileinfo.append(fileinfo)
+            _ = l_fileinfo[0].created != l_fileinfo[1].created or l_fileinfo[0].modified != l_fileinfo[1].modified
+
+    def get_memory_bytes(fileinfo_class) -> float:
+        tracemalloc.start()
+        snapshot_start = tracemalloc.take_snapshot()
+        l_fileinfo = list()
+        for _ in range(n_rows):
+            fileinfo = fileinfo_class()
+            fileinfo.set_stat_result(stat_result)
+            l_fileinfo.append(fileinfo)
+        snapshot_stop = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        n_bytes = sum(stat.size_diff for stat in snapshot_stop.compare_to(snapshot_start, 'filename'))
+        return n_bytes / n_rows
+
+    dict_results = dict()
+    for name, fileinfo_class in (('eager', DataStructFileInfoEager), ('slotted', lib_data_structures.DataStructFileInfo)):
+        dict_results['scan_us_' + name] = measure(lambda: scan(fileinfo_class), repeat) / n_rows * 1E6
+        dict_results['diff_us_' + name] = measure(lambda: diff(fileinfo_class), repeat) / n_rows * 1E6
+        dict_results['memory_bytes_' + name] = get_memory_bytes(fileinfo_class)
+    logger.info('fileinfo per row ({} rows): scan {:.2f} us -> {:.2f} us, diff {:.2f} us -> {:.2f} us, memory {:.0f} bytes -> {:.0f} bytes'.format(
+        n_rows, dict_results['scan_us_eager'], dict_results['scan_us_slotted'], dict_results['diff_us_eager'], dict_results['diff_us_slotted'],
+        dict_results['memory_bytes_eager'], dict_results['memory_bytes_slotted']))
+    return dict_results
+
+
+def benchmark_sharded_diff(n_rows: int = 1000000, n_shards: int = 0, n_workers: int = 0) -> Dict[str, float]:
+    """
+    the hash join against the sharded diff (lib_diff_sharded) of two binary fingerprints with 1% changed, 1% added and 1% deleted files.
+    every diff runs in a new process, so the peak rss is the one of the diff. n_shards 0 = the number of cpus
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_sharded_diff(n_rows=1000, n_shards=2, n_workers=2)
+    >>> sorted(dict_results.keys())  # doctest: +NORMALIZE_WHITESPACE
+    ['peak_rss_mib_hash_join', 'peak_rss_mib_sharded_main', 'peak_rss_mib_sharded_worker', 'seconds_hash_join', 'seconds_sharded', 'speedup']
+    """
+    n_shards = n_shards or os.cpu_count() or 1
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+    try:
+        f_fp_1, f_fp_2 = os.path.join(f_dir, 'fp1.fpb'), os.path.join(f_dir, 'fp2.fpb')
+        create_benchmark_fingerprint(f_fp_1, n_rows, seed=1)
+        create_benchmark_fingerprint(f_fp_2, n_rows, seed=2)
+        dict_hash_join = run_in_new_process(run_files_diff, f_fp_1, f_fp_2, os.path.join(f_dir, 'diff_hash_join.csv'), 0, 0)
+        dict_sharded = run_in_new_process(run_files_diff, f_fp_1, f_fp_2, os.path.join(f_dir, 'diff_sharded.csv'), n_shards, n_workers)
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+
+    dict_results = dict()
+    dict_results['seconds_hash_join'] = dict_hash_join['seconds']
+    dict_results['seconds_sharded'] = dict_sharded['seconds']
+    dict_results['speedup'] = dict_hash_join['seconds'] / max(dict_sharded['seconds'], 1e-9)
+    dict_results['peak_rss_mib_hash_join'] = dict_hash_join['peak_rss_main'] / 1048576
+    dict_results['peak_rss_mib_sharded_main'] = dict_sharded['peak_rss_main'] / 1048576
+    dict_results['peak_rss_mib_sharded_worker'] = dict_sharded['peak_rss_worker'] / 1048576
+    logger.info('files diff ({} rows, {} shards, {} workers): hash join {:.1f} s, {:.0f} MiB - sharded {:.1f} s, main {:.0f} MiB, '
+                'worker {:.0f} MiB, speedup {:.2f}'.format(
+                    n_rows, n_shards, dict_sharded['n_workers'], dict_results['seconds_hash_join'], dict_results['peak_rss_mib_hash_join'],
+                    dict_results['seconds_sharded'], dict_results['peak_rss_mib_sharded_main'], dict_results['peak_rss_mib_sharded_worker'],
+                    dict_results['speedup']))
+    return dict_results
+
+
+def create_benchmark_fingerprint(f_fp_binary: str, n_rows: int, seed: int):
+    """ seed 1 : the original, other seeds : 1% of the files changed, 1% deleted and 1% added """
+    random.seed(seed)
+    with open(f_fp_binary, 'wb') as f_out:
+        binary_writer = lib_fp_binary.FingerPrintBinaryWriter(f_out)
+        fileinfo = lib_data_structures.DataStructFileInfo()
+        for n in range(n_rows):
+            change = random.random() if seed != 1 else 1.0
+            fileinfo.path = 'C:\\benchmark\\dir_{}\\file_{}.txt'.format(n % 1000, n if change >= 0.01 else 'added_{}'.format(n))
+            fileinfo.size = n + (1 if 0.01 <= change < 0.02 else 0)
+            fileinfo.created_ns = fileinfo.modified_ns = fileinfo.accessed_ns = 1500000000000000000 + n
+            fileinfo.hash = '{:064x}'.format(n)
+            if not 0.02 <= change < 0.03:
+                binary_writer.write_fileinfo(fileinfo)
+        binary_writer.close()
+
+
+def run_files_diff(f_fp_1: str, f_fp_2: str, f_output: str, n_shards: int, n_workers: int) -> dict:
+    """ the diff without (n_shards 0) or with shards - seconds and peak rss """
+    lib_diff_files.fp_diff_files_conf.fp1_path, lib_diff_files.fp_diff_files_conf.fp2_path = f_fp_1, f_fp_2
+    lib_diff_files.fp_conf.f_output = f_output
+    time_start = time.perf_counter()
+    if n_shards:
+        sharded_diff = lib_diff_sharded.ShardedDiff(n_shards=n_shards, n_workers=n_workers, tmp_dir=os.path.dirname(f_output))
+        lib_diff_files.FileDiff.write_diff_csv_file(sharded_diff.iter_files_diff(f_fp_1, f_fp_2, 0, 0, compare_hashes=True))
+        dict_report = sharded_diff.get_report()
+    else:
+        lib_diff_files.FileDiff.write_diff_csv_file(lib_diff_files.FileDiff().iter_diff_fileinfo_hash_join())
+        dict_report = {'n_workers': 1, 'peak_rss_main': lib_helper_functions.get_peak_rss_bytes(), 'peak_rss_worker': 0}
+    dict_report['seconds'] = time.perf_counter() - time_start
+    return dict_report
+
+
+def run_in_new_process(function: Callable, *args):
+    """
+    the result of function(*args), run in a new process - not in a process pool, the workers of a pool can not start processes on python < 3.9
+
+    >>> run_in_new_process(max, 1, 2)
+    2
+    """
+    connection_receive, connection_send = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=send_result, args=(connection_send, function, args))
+    process.start()
+    result = connection_receive.recv()
+    process.join()
+    return result
+
+
+def send_result(connection, function: Callable, args: tuple):
+    connection.send(function(*args))
+    connection.close()
+
+
+def benchmark_registry_traversal(f_hive: str = BENCHMARK_HIVE_SAM, n_keys: int = 8000, repeat: int = 1) -> Dict[str, float]:
+    """
+    microseconds per key of the registry traversal (lib_fp_registry.FingerPrintRegistry.iter_registry_entries) against the recursive
+    one it replaced (get_registry_entries_recursive), on the hive f_hive and on synthetic wide and deep hives of n_keys / 4, n_keys / 2
+    and n_keys keys - linear time if the microseconds per key stay the same when the hive grows
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_registry_traversal(f_hive='', n_keys=400)
+    >>> sorted(dict_results.keys())  # doctest: +NORMALIZE_WHITESPACE
+    ['deep_100_us_iterative', 'deep_100_us_recursive', 'deep_200_us_iterative', 'deep_200_us_recursive', 'deep_400_us_iterative',
+     'deep_400_us_recursive', 'wide_100_us_iterative', 'wide_100_us_recursive', 'wide_200_us_iterative', 'wide_200_us_recursive',
+     'wide_400_us_iterative', 'wide_400_us_recursive']
+    """
+    fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    registry_file_info.hive_name = 'HKLM\\BENCHMARK'
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+    try:
+        l_hives = [('hive', f_hive)] if f_hive else list()
+        for shape in ('wide', 'deep'):
+            for n_keys_hive in (n_keys // 4, n_keys // 2, n_keys):
+                f_hive_synthetic = os.path.join(f_dir, '{}_{}.hive'.format(shape, n_keys_hive))
+                create_benchmark_hive(f_hive_synthetic, n_keys_hive, shape)
+                l_hives.append(('{}_{}'.format(shape, n_keys_hive), f_hive_synthetic))
+
+        dict_results = dict()
+        for name, f_hive_benchmark in l_hives:
+            key_root = lib_fp_registry.Registry.Registry(f_hive_benchmark).root()
+            n_keys_hive = sum(1 for _ in fingerprint_registry.iter_registry_entries(key_root, registry_file_info))
+            dict_results[name + '_us_iterative'] = measure(lambda: sum(1 for _ in fingerprint_registry.iter_registry_entries(
+                key_root, registry_file_info)), repeat) / n_keys_hive * 1E6
+            dict_results[name + '_us_recursive'] = measure(lambda: get_registry_entries_recursive(
+                fingerprint_registry, key_root, registry_file_info), repeat) / n_keys_hive * 1E6
+            logger.info('registry traversal {} ({} keys): recursive {:.1f} us per key, iterative {:.1f} us per key'.format(
+                name, n_keys_hive, dict_results[name + '_us_recursive'], dict_results[name + '_us_iterative']))
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+    return dict_results
+
+
+def get_registry_entries_recursive(fingerprint_registry: lib_fp_registry.FingerPrintRegistry, key,
+                                   registry_file_info: lib_data_structures.DataStructRegistryFileInfo) -> List[lib_data_structures.DataStructRegistryEntry]:
+    """ FingerPrintRegistry.get_registry_entries before the explicit stack - the baseline for benchmark_registry_traversal """
+    l_reg_entries = [fingerprint_registry.get_registry_entry(key=key, key_path=key.path(), registry_file_info=registry_file_info)]
+    for subkey in key.subkeys():
+        l_subkeys = get_registry_entries_recursive(fingerprint_registry, subkey, registry_file_info)
+        l_reg_entries = l_reg_entries + l_subkeys
+    return l_reg_entries
+
+
+def benchmark_hive_workers(n_keys: int = 40000, n_workers: int = 0, split_depth: int = 0) -> Dict[str, float]:
+    """
+    the registry csv fingerprint of four wide synthetic hives of n_keys, n_keys / 2, n_keys / 4 and n_keys / 8 keys, sequential against
+    one worker per hive (lib_fp_registry_parallel) - the parallel wall time drops towards the time of the largest hive alone.
+    with split_depth the hives are split into subtrees, the wall time drops below the largest hive. n_workers 0 = the number of cpus
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_hive_workers(n_keys=400, n_workers=2)
+    >>> sorted(dict_results.keys())
+    ['identical', 'seconds_largest_hive', 'seconds_parallel', 'seconds_sequential', 'speedup']
+    >>> dict_results['identical'], benchmark_hive_workers(n_keys=400, n_workers=2, split_depth=1)['identical']
+    (True, True)
+    """
+    fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+    try:
+        l_registry_files = list()
+        for n_hive in range(4):
+            registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+            registry_file_info.hive_name = 'HKLM\\BENCHMARK_{}'.format(n_hive)
+            registry_file_info.filename = os.path.join(f_dir, 'hive_{}.hive'.format(n_hive))
+            create_benchmark_hive(registry_file_info.filename, max(n_keys >> n_hive, 1), 'wide')
+            l_registry_files.append(registry_file_info)
+
+        def write_sequential(l_registry_files_sequential: List[lib_data_structures.DataStructRegistryFileInfo], f_output: str):
+            lib_fp_registry.fp_conf.f_output = f_output
+            fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_all_hives(l_registry_files_sequential))
+
+        def write_parallel(f_output: str):
+            lib_fp_registry.fp_conf.f_output = f_output
+            lib_fp_registry_parallel.write_hives_parallel(l_registry_files, n_workers=n_workers, split_depth=split_depth)
+
+        f_sequential, f_parallel = os.path.join(f_dir, 'reg_sequential.csv'), os.path.join(f_dir, 'reg_parallel.csv')
+        dict_results = dict()
+        dict_results['seconds_sequential'] = measure(lambda: write_sequential(l_registry_files, f_sequential), repeat=1)
+        dict_results['seconds_parallel'] = measure(lambda: write_parallel(f_parallel), repeat=1)
+        dict_results['seconds_largest_hive'] = measure(lambda: write_sequential(l_registry_files[:1], os.path.join(f_dir, 'reg_largest.csv')), repeat=1)
+        dict_results['speedup'] = dict_results['seconds_sequential'] / max(dict_results['seconds_parallel'], 1e-9)
+        with open(f_sequential, 'rb') as f_in_sequential, open(f_parallel, 'rb') as f_in_parallel:
+            dict_results['identical'] = f_in_sequential.read() == f_in_parallel.read()
+        logger.info('registry fingerprint of 4 hives ({} keys in the largest): sequential {:.1f} s, {} hive workers (split depth {}) {:.1f} s, '
+                    'largest hive alone {:.1f} s, speedup {:.2f}, identical {}'.format(
+                        n_keys, dict_results['seconds_sequential'], n_workers or os.cpu_count(), split_depth, dict_results['seconds_parallel'],
+                        dict_results['seconds_largest_hive'], dict_results['speedup'], dict_results['identical']))
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+    return dict_results
+
+
+def benchmark_reg_backend(f_hive: str = BENCHMARK_HIVE_SAM, n_keys: int = 40000, repeat: int = 1) -> Dict[str, float]:
+    """
+    microseconds per key of the registry entries read with python-registry against the mmap backend (lib_regf), hive opened and
+    parsed, on the hive f_hive and on a synthetic wide hive of n_keys keys - and if both backends give the same entries
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_reg_backend(f_hive='', n_keys=400)
+    >>> sorted(dict_results.keys())
+    ['wide_400_identical', 'wide_400_speedup', 'wide_400_us_mmap', 'wide_400_us_python_registry']
+    >>> dict_results['wide_400_identical']
+    True
+    """
+    fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    registry_file_info.hive_name = 'HKLM\\BENCHMARK'
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+
+    def get_rows(reg_backend: str) -> list:
+        return [(registry_entry.path, registry_entry.modified, [(registry_value.name, registry_value.type, registry_value.value)
+                 for registry_value in registry_entry.l_registry_values])
+                for registry_entry in fingerprint_registry.parse_hive(registry_file_info, reg_backend=reg_backend)]
+
+    try:
+        l_hives = [('hive', f_hive)] if f_hive else list()
+        f_hive_synthetic = os.path.join(f_dir, 'wide_{}.hive'.format(n_keys))
+        create_benchmark_hive(f_hive_synthetic, n_keys, 'wide')
+        l_hives.append(('wide_{}'.format(n_keys), f_hive_synthetic))
+
+        dict_results: Dict[str, float] = dict()
+        for name, registry_file_info.filename in l_hives:
+            l_rows = get_rows('python-registry')
+            dict_results[name + '_identical'] = get_rows('mmap') == l_rows
+            for reg_backend in ('python-registry', 'mmap'):
+                dict_results['{}_us_{}'.format(name, reg_backend.replace('-', '_'))] = measure(
+                    lambda: sum(1 for _ in fingerprint_registry.parse_hive(registry_file_info, reg_backend=reg_backend)), repeat) / len(l_rows) * 1E6
+            dict_results[name + '_speedup'] = dict_results[name + '_us_python_registry'] / max(dict_results[name + '_us_mmap'], 1e-9)
+            logger.info('registry backend {} ({} keys): python-registry {:.1f} us per key, mmap {:.1f} us per key, speedup {:.2f}, identical {}'.format(
+                name, len(l_rows), dict_results[name + '_us_python_registry'], dict_results[name + '_us_mmap'], dict_results[name + '_speedup'],
+                dict_results[name + '_identical']))
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+    return dict_results
+
+
+def benchmark_value_decoding(n_values: int = 6000, repeat: int = 1) -> Dict[str, float]:
+    """
+    microseconds per value the registry backend could not decode : lib_reg_decode.ValueDecoder against the charset detection of
+    every value with a traceback for every failure (decode_value_detect_encoding). a third each : utf-16le strings with a lone
+    surrogate, 8 bit strings in 20 subtrees, values of an unknown type
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_value_decoding(n_values=30)
+    >>> sorted(dict_results.keys())
+    ['speedup', 'us_detect_encoding', 'us_value_decoder']
+    """
+    l_values = list()
+    for n in range(n_values):
+        key_path = 'HKLM\\SOFTWARE\\Vendor_{}\\Product\\Key_{}'.format(n % 20, n)
+        if n % 3 == 0:
+            l_values.append((key_path, 'RegSZ', 'value {} '.format(n).encode('utf-16le') * 10 + b'\x00\xd8' + bytes(2)))
+        elif n % 3 == 1:
+            l_values.append((key_path, 'RegSZ', 'valeur {} très bien '.format(n).encode('windows-1252') * 10 + bytes(1)))
+        else:
+            l_values.append((key_path, 'Unknown type: 0x12', random.Random(n).getrandbits(2048).to_bytes(256, 'little')))
+
+    def decode_values_value_decoder():
+        value_decoder = lib_reg_decode.ValueDecoder()
+        for key_path, value_type, raw_data in l_values:
+            value_decoder.decode(key_path, value_type, raw_data)
+
+    dict_results = dict()
+    dict_results['us_detect_encoding'] = measure(lambda: [decode_value_detect_encoding(*value) for value in l_values], repeat) / n_values * 1E6
+    dict_results['us_value_decoder'] = measure(decode_values_value_decoder, repeat) / n_values * 1E6
+    dict_results['speedup'] = dict_results['us_detect_encoding'] / max(dict_results['us_value_decoder'], 1e-9)
+    logger.info('registry value decoding ({} values): charset detection {:.1f} us per value, value decoder {:.1f} us per value, speedup {:.2f}'.format(
+        n_values, dict_results['us_detect_encoding'], dict_results['us_value_decoder'], dict_results['speedup']))
+    return dict_results
+
+
+def decode_value_detect_encoding(key_path: str, value_type: str, raw_data: bytes) -> str:
+    """ FingerPrintRegistry.get_registry_value before lib_reg_decode - the baseline for benchmark_value_decoding """
+    try:
+        return raw_data.decode(lib_detect_encoding.get_file_encoding(raw_data))
+    except (AttributeError, TypeError, UnicodeDecodeError):
+        s_error = 'can not read the value of key "{}", value type "{}"'.format(key_path, value_type)
+        lib_helper_functions.log_exception_traceback(s_error=s_error)
+        return 'ERROR: can not be parsed or access denied'
+
+
+def benchmark_registry_baseline(n_keys: int = 40000, reg_backend: str = 'mmap') -> Dict[str, float]:
+    """
+    the registry csv fingerprint of a wide synthetic hive of n_keys keys, read from the hive against the values reused from the
+    unchanged baseline (lib_fp_registry_baseline) - the seconds to spool the baseline are measured on their own
+
+    >>> logger.level = logging.ERROR
+    >>> dict_results = benchmark_registry_baseline(n_keys=400)
+    >>> sorted(dict_results.keys())
+    ['identical', 'seconds_baseline', 'seconds_full', 'seconds_spool', 'speedup']
+    >>> dict_results['identical']
+    True
+    """
+    fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    registry_file_info.hive_name = 'HKLM\\BENCHMARK'
+    f_dir = tempfile.mkdtemp(prefix='fp_benchmark_')
+    try:
+        registry_file_info.filename = os.path.join(f_dir, 'wide_{}.hive'.format(n_keys))
+        create_benchmark_hive(registry_file_info.filename, n_keys, 'wide')
+        f_full, f_baseline = os.path.join(f_dir, 'reg_full.csv'), os.path.join(f_dir, 'reg_baseline.csv')
+
+        def write_csv(f_output: str):
+            lib_fp_registry.fp_conf.f_output = f_output
+            fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_hive(registry_file_info, reg_backend=reg_backend))
+
+        dict_results = dict()
+        dict_results['seconds_full'] = measure(lambda: write_csv(f_full), repeat=1)
+        baseline_dir = os.path.join(f_dir, 'baseline')
+        os.makedirs(baseline_dir)
+        dict_results['seconds_spool'] = measure(lambda: lib_fp_registry_baseline.create_baseline(f_full, baseline_dir), repeat=1)
+        with lib_fp_registry_baseline.RegistryBaseline(baseline_dir) as fingerprint_registry.registry_baseline:
+            dict_results['seconds_baseline'] = measure(lambda: write_csv(f_baseline), repeat=1)
+        fingerprint_registry.registry_baseline = None
+        dict_results['speedup'] = dict_results['seconds_full'] / max(dict_results['seconds_baseline'], 1e-9)
+        with open(f_full, 'rb') as f_in_full, open(f_baseline, 'rb') as f_in_baseline:
+            dict_results['identical'] = f_in_full.read() == f_in_baseline.read()
+        logger.info('registry baseline ({} keys, {}): read from the hive {:.1f} s, reused from the baseline {:.1f} s (spooled in {:.1f} s), '
+                    'speedup {:.2f}, identical {}'.format(n_keys, reg_backend, dict_results['seconds_full'], dict_results['seconds_baseline'],
+                                                          dict_results['seconds_spool'], dict_results['speedup'], dict_results['identical']))
+    finally:
+        shutil.rmtree(f_dir, ignore_errors=True)
+    return dict_results
+
+
+def create_benchmark_hive(f_hive: str, n_keys: int, shape: str):
+    """ wide : two levels of sqrt(n_keys) subkeys, deep : chains of BENCHMARK_HIVE_DEPTH keys below the root - two values per key """
+    with lib_hive_writer.HiveWriter(f_hive) as hive_writer:
+        for depth, name, l_values in iter_benchmark_hive_keys(n_keys, shape):
+            hive_writer.add_key(depth, name, l_values)
+
+
+def iter_benchmark_hive_keys(n_keys: int, shape: str) -> Iterator[Tuple[int, str, List[lib_hive_writer.RegistryValueRaw]]]:
+    """
+    >>> [(depth, name) for depth, name, _ in iter_benchmark_hive_keys(5, 'wide')]
+    [(0, 'ROOT'), (1, 'key_00000'), (2, 'key_00000'), (2, 'key_00001'), (2, 'key_00002')]
+    """
+    def get_values(n: int) -> List[lib_hive_writer.RegistryValueRaw]:
+        return [('name', lib_hive_writer.REG_SZ, lib_hive_writer.encode_sz('value {}'.format(n))),
+                ('number', lib_hive_writer.REG_DWORD, n.to_bytes(4, 'little'))]
+
+    yield 0, 'ROOT', get_values(0)
+    fanout = math.ceil(math.sqrt(n_keys))
+    for n in range(1, n_keys):
+        if shape == 'wide':
+            parent, child = divmod(n - 1, fanout + 1)
+            yield (1, 'key_{:05}'.format(parent), get_values(n)) if child == 0 else (2, 'key_{:05}'.format(child - 1), get_values(n))
+        else:
+            yield (n - 1) % BENCHMARK_HIVE_DEPTH + 1, 'key_{:05}'.format(n), get_values(n)
+
+
+def run_all_benchmarks():
+    benchmark_file_hashing()
+    benchmark_fileinfo()
+    benchmark_sharded_diff()
+    benchmark_registry_traversal()
+    benchmark_hive_workers()
+    benchmark_reg_backend()
+    benchmark_value_decoding()
+    benchmark_registry_baseline()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    run_all_benchmarks()
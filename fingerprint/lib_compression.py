@@ -0,0 +1,184 @@
+import bz2
+import gzip
+import io
+import lib_doctest_pycharm
+import logging
+import lzma
+import queue
+import threading
+import zlib
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# compressed fingerprints (--compress gzip|bz2|lzma) - the writers compress on a background thread, so the compression
+# overlaps with scanning / diffing (zlib, bz2 and lzma release the GIL while they compress).
+# the readers detect compressed input by the magic bytes, the file extension does not matter.
+
+COMPRESSIONS = ('gzip', 'bz2', 'lzma')
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz'}
+COMPRESSION_MAGIC = {'gzip': b'\x1f\x8b', 'bz2': b'BZh', 'lzma': b'\xfd7zXZ\x00'}
+
+COMPRESSION_CHUNK_SIZE: int = 1048576       # bytes handed to the compressor thread at once
+COMPRESSION_QUEUE_CHUNKS: int = 16          # chunks waiting for the compressor thread - the writer blocks if it falls behind
+
+
+class BackgroundCompressor(io.RawIOBase):
+    """
+    a writable binary stream, the data is compressed and written to the file on a background thread
+
+    >>> with open_output('./testresults/fp_compression_test.csv.gz', 'w', compress='gzip') as f_out:
+    ...     _ = f_out.write('path,size\\n' * 1000)
+    >>> detect_compression('./testresults/fp_compression_test.csv.gz')
+    'gzip'
+    >>> with open_input('./testresults/fp_compression_test.csv.gz') as f_in:
+    ...     f_in.read() == 'path,size\\n' * 1000
+    True
+    """
+    def __init__(self, f_path: str, compress: str):
+        super().__init__()
+        self.f_path = f_path
+        self.compressor = get_compressor(compress)
+        self.f_out = open(f_path, 'wb')
+        self.queue_chunks: queue.Queue = queue.Queue(maxsize=COMPRESSION_QUEUE_CHUNKS)
+        self.exception: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self.compress_chunks, name='fp_compressor', daemon=True)
+        self.thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.raise_thread_exception()
+        self.queue_chunks.put(bytes(data))
+        return len(data)
+
+    def compress_chunks(self):
+        """
+        the errors are raised by the next write() or by close() - also if the final flush fails (disk full)
+
+        >>> class CompressorDiskFull(object):
+        ...     def compress(self, chunk): return b''
+        ...     def flush(self): raise OSError(28, 'No space left on device')
+        >>> f_out = BackgroundCompressor('./testresults/fp_compression_test_flush.csv.gz', 'gzip')
+        >>> f_out.compressor = CompressorDiskFull()
+        >>> _ = f_out.write(b'path,size\\n')
+        >>> f_out.close()
+        Traceback (most recent call last):
+        ...
+        OSError: can not write the compressed file ./testresults/fp_compression_test_flush.csv.gz
+        """
+        sentinel_received = False
+        try:
+            while True:
+                chunk = self.queue_chunks.get()
+                if chunk is None:
+                    sentinel_received = True
+                    break
+                self.f_out.write(self.compressor.compress(chunk))
+            self.f_out.write(self.compressor.flush())
+        except BaseException as exc:
+            self.exception = exc
+            # keep draining up to the sentinel of close(), so the writer does not block on a full queue
+            while not sentinel_received:
+                sentinel_received = self.queue_chunks.get() is None
+
+    def raise_thread_exception(self):
+        if self.exception is not None:
+            raise OSError('can not write the compressed file {}'.format(self.f_path)) from self.exception
+
+    def close(self):
+        if self.closed:
+            return
+        self.queue_chunks.put(None)
+        self.thread.join()
+        self.f_out.close()
+        super().close()
+        self.raise_thread_exception()
+
+
+def get_compressor(compress: str):
+    """ gzip through zlib (wbits=31 writes the gzip container), so the compressor has the same interface as bz2 and lzma """
+    if compress == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compress == 'bz2':
+        return bz2.BZ2Compressor(9)
+    if compress == 'lzma':
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ)
+    raise ValueError('unknown compression "{}", possible values: {}'.format(compress, ', '.join(COMPRESSIONS)))
+
+
+def open_output(f_path: str, mode: str = 'w', compress: str = '', encoding: str = 'utf-8', newline: Optional[str] = ''):
+    """
+    opens a fingerprint for writing - mode 'w' (text, utf-8, no newline translation like the csv module wants it) or 'wb'
+
+    >>> with open_output('./testresults/fp_compression_test.fpb.xz', 'wb', compress='lzma') as f_out:
+    ...     _ = f_out.write(b'FPFILES')
+    >>> detect_compression('./testresults/fp_compression_test.fpb.xz')
+    'lzma'
+    >>> with open_input('./testresults/fp_compression_test.fpb.xz', 'rb') as f_in:
+    ...     f_in.read()
+    b'FPFILES'
+    """
+    if not compress:
+        if mode == 'wb':
+            return open(f_path, 'wb')
+        return open(f_path, mode, encoding=encoding, newline=newline)
+    f_out = io.BufferedWriter(BackgroundCompressor(f_path, compress), buffer_size=COMPRESSION_CHUNK_SIZE)
+    if mode == 'wb':
+        return f_out
+    return io.TextIOWrapper(f_out, encoding=encoding, newline=newline)
+
+
+def open_input(f_path: str, mode: str = 'r', encoding: str = 'utf-8-sig', newline: Optional[str] = ''):
+    """ opens a fingerprint for reading, compressed or not - mode 'r' (text) or 'rb' """
+    compress = detect_compression(f_path)
+    if not compress:
+        if mode == 'rb':
+            return open(f_path, 'rb')
+        return open(f_path, mode, encoding=encoding, newline=newline)
+    dict_open_functions: Dict[str, Callable] = {'gzip': gzip.open, 'bz2': bz2.open, 'lzma': lzma.open}
+    open_function = dict_open_functions[compress]
+    if mode == 'rb':
+        return open_function(f_path, 'rb')
+    return open_function(f_path, 'rt', encoding=encoding, newline=newline)
+
+
+def detect_compression(f_path: str) -> str:
+    """
+    returns the compression by the magic bytes, '' if the file is not compressed
+
+    >>> detect_compression('./testfiles_source/fp_files_result1_difftest.csv')
+    ''
+    """
+    with open(f_path, 'rb') as f_in:
+        magic = f_in.read(6)
+    for compress, compress_magic in COMPRESSION_MAGIC.items():
+        if magic.startswith(compress_magic):
+            return compress
+    return ''
+
+
+def get_compression_extension(compress: str) -> str:
+    """
+    >>> get_compression_extension('lzma'), get_compression_extension('')
+    ('.xz', '')
+    """
+    return COMPRESSION_EXTENSIONS.get(compress, '')
+
+
+def strip_compression_extension(f_path: str) -> str:
+    """
+    >>> strip_compression_extension('c:/fp/fp1.csv.gz'), strip_compression_extension('c:/fp/fp1.csv')
+    ('c:/fp/fp1.csv', 'c:/fp/fp1.csv')
+    """
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if f_path.lower().endswith(extension):
+            return f_path[:-len(extension)]
+    return f_path
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
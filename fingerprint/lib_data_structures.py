@@ -2,12 +2,22 @@ from datetime import datetime
 import time
 import lib_doctest_pycharm
 import lib_helper_functions
+import logging
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger()
+
+DATETIME_DEFAULT = datetime(1980, 1, 1, 0, 0, 0)
 
 
 lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
 
 
 class DataStructFileInfo(object):
+    # one instance per file (up to three per row in the diff) - no __dict__, and the datetimes are only made if they are read
+    __slots__ = ('path', 'size', '_created_ns', '_created', '_modified_ns', '_modified', '_accessed_ns', '_accessed',
+                 'hash', 'change', 'remark', 'link_group', 'old_path')
+
     def __init__(self):
         """
         >>> ## DataStructFileInfo creation
@@ -58,71 +68,127 @@ class DataStructFileInfo(object):
         """
         self.path:str = ''
         self.size:int = 0
-        self._created_float:float = 0.0
-        self._created:datetime = datetime(1980, 1, 1, 0, 0, 0)
-        self._modified_float:float = 0.0
-        self._modified:datetime = datetime(1980, 1, 1, 0, 0, 0)
-        self._accessed_float: float = 0.0
-        self._accessed: datetime = datetime(1980, 1, 1, 0, 0, 0)
+        # the timestamps are stored as they come in : epoch nanoseconds (from stat, float setters) or datetime / datestr
+        # (from the datetime setters, csv). the other representation is converted on first access and kept
+        self._created_ns:Optional[int] = 0
+        self._created:Union[datetime, str, None] = DATETIME_DEFAULT
+        self._modified_ns:Optional[int] = 0
+        self._modified:Union[datetime, str, None] = DATETIME_DEFAULT
+        self._accessed_ns:Optional[int] = 0
+        self._accessed:Union[datetime, str, None] = DATETIME_DEFAULT
         self.hash:str = ''
-        self.change:str = ''    # ADDED, DELETED, CHANGED, CHANGED_SILENT (Data changed without updating the Filedates)
+        self.change:str = ''    # ADDED, DELETED, CHANGED, CHANGED_SILENT (Data changed without updating the Filedates), MOVED, RENAMED
         self.remark:str = ''
+        self.link_group:str = ''    # files with the same link_group are hard links to the same inode, optional csv column
+        self.old_path:str = ''      # the path in the first fingerprint of a MOVED or RENAMED file, optional diff column
+
+    def set_stat_result(self, stat_result):
+        """
+        >>> import os
+        >>> fileinfo = DataStructFileInfo()
+        >>> fileinfo.set_stat_result(os.stat_result((0, 0, 0, 1, 0, 0, 123, 1, 2, 3, 1.0, 2.0, 3.0, 1000000000, 2000000000, 3500000000)))
+        >>> fileinfo.size, fileinfo.accessed_float, fileinfo.modified_float, fileinfo.created_float
+        (123, 1.0, 2.0, 3.5)
+        >>> fileinfo.created_ns
+        3500000000
+        """
+        # hot path - the slots are set directly, not through the property setters
+        self._accessed_ns, self._accessed = stat_result.st_atime_ns, None
+        self._modified_ns, self._modified = stat_result.st_mtime_ns, None
+        self._created_ns, self._created = stat_result.st_ctime_ns, None
+        self.size = stat_result.st_size
+
+    @property
+    def created_ns(self)->int:
+        if self._created_ns is None:
+            self._created_ns = lib_helper_functions.convert_float_to_ns(lib_helper_functions.convert_datetime_or_datestr_to_float(self._created))
+        return self._created_ns
+
+    @created_ns.setter
+    def created_ns(self, created:int):
+        self._created_ns = created
+        self._created = None
 
     @property
     def created_float(self)->float:
-        return self._created_float
+        return lib_helper_functions.convert_ns_to_float(self.created_ns)
 
     @created_float.setter
     def created_float(self, created:float):
-        self._created_float = created
-        self._created = lib_helper_functions.convert_float_to_datetime(created)
+        self.created_ns = lib_helper_functions.convert_float_to_ns(created)
 
     @property
-    def created(self)->datetime:
+    def created(self)->Union[datetime, str]:
+        if self._created is None:
+            self._created = datetime.fromtimestamp(lib_helper_functions.convert_ns_to_float(self._created_ns))
         return self._created
 
     @created.setter
-    def created(self,created:datetime):
+    def created(self, created:Union[datetime, str]):
         self._created = created
-        self._created_float = lib_helper_functions.convert_datetime_or_datestr_to_float(created)
+        self._created_ns = None
+
+    @property
+    def modified_ns(self)->int:
+        if self._modified_ns is None:
+            self._modified_ns = lib_helper_functions.convert_float_to_ns(lib_helper_functions.convert_datetime_or_datestr_to_float(self._modified))
+        return self._modified_ns
+
+    @modified_ns.setter
+    def modified_ns(self, modified:int):
+        self._modified_ns = modified
+        self._modified = None
 
     @property
     def modified_float(self)->float:
-        return self._modified_float
+        return lib_helper_functions.convert_ns_to_float(self.modified_ns)
 
     @modified_float.setter
     def modified_float(self, modified:float):
-        self._modified_float = modified
-        self._modified = lib_helper_functions.convert_float_to_datetime(modified)
+        self.modified_ns = lib_helper_functions.convert_float_to_ns(modified)
 
     @property
-    def modified(self)->datetime:
+    def modified(self)->Union[datetime, str]:
+        if self._modified is None:
+            self._modified = datetime.fromtimestamp(lib_helper_functions.convert_ns_to_float(self._modified_ns))
         return self._modified
 
     @modified.setter
-    def modified(self,modified:datetime):
+    def modified(self, modified:Union[datetime, str]):
         self._modified = modified
-        self._modified_float = lib_helper_functions.convert_datetime_or_datestr_to_float(modified)
+        self._modified_ns = None
+
+    @property
+    def accessed_ns(self)->int:
+        if self._accessed_ns is None:
+            self._accessed_ns = lib_helper_functions.convert_float_to_ns(lib_helper_functions.convert_datetime_or_datestr_to_float(self._accessed))
+        return self._accessed_ns
+
+    @accessed_ns.setter
+    def accessed_ns(self, accessed:int):
+        self._accessed_ns = accessed
+        self._accessed = None
 
     @property
     def accessed_float(self)->float:
-        return self._accessed_float
+        return lib_helper_functions.convert_ns_to_float(self.accessed_ns)
 
     @accessed_float.setter
     def accessed_float(self, accessed:float):
-        self._accessed_float = accessed
-        self._accessed = lib_helper_functions.convert_float_to_datetime(accessed)
+        self.accessed_ns = lib_helper_functions.convert_float_to_ns(accessed)
 
     @property
-    def accessed(self)->datetime:
+    def accessed(self)->Union[datetime, str]:
+        if self._accessed is None:
+            self._accessed = datetime.fromtimestamp(lib_helper_functions.convert_ns_to_float(self._accessed_ns))
         return self._accessed
 
     @accessed.setter
-    def accessed(self,accessed:datetime):
+    def accessed(self, accessed:Union[datetime, str]):
         self._accessed = accessed
-        self._accessed_float = lib_helper_functions.convert_datetime_or_datestr_to_float(accessed)
+        self._accessed_ns = None
 
-    def get_data_dict(self)->dict:
+    def get_data_dict(self, with_link_group:bool = False, with_old_path:bool = False)->dict:
         """
         >>> import time
         >>> fileinfo = DataStructFileInfo()
@@ -157,28 +223,61 @@ class DataStructFileInfo(object):
         True
         >>> data_dict['remark'] == fileinfo.remark == 'Remark'
         True
+        >>> 'link_group' in data_dict, 'link_group' in fileinfo.get_data_dict(with_link_group=True)
+        (False, True)
+        >>> 'old_path' in data_dict, 'old_path' in fileinfo.get_data_dict(with_old_path=True)
+        (False, True)
         """
-        data_dict = dict()
+        data_dict: Dict[str, Any] = dict()
         data_dict['path'] = self.path
         data_dict['size'] = self.size
-        data_dict['created'] = self._created
-        data_dict['modified'] = self._modified
-        data_dict['accessed'] = self._accessed
+        data_dict['created'] = self.created
+        data_dict['modified'] = self.modified
+        data_dict['accessed'] = self.accessed
         data_dict['hash'] = self.hash
         data_dict['change'] = self.change
         data_dict['remark'] = self.remark
+        if with_link_group:
+            data_dict['link_group'] = self.link_group
+        if with_old_path:
+            data_dict['old_path'] = self.old_path
 
         return data_dict
 
-    def get_data_dict_fieldnames(self):
+    def get_data_dict_fieldnames(self, with_link_group:bool = False, with_old_path:bool = False):
         """
         >>> fileinfo = DataStructFileInfo()
         >>> fileinfo.get_data_dict_fieldnames()
         ['path', 'size', 'created', 'modified', 'accessed', 'hash', 'change', 'remark']
+        >>> fileinfo.get_data_dict_fieldnames(with_link_group=True)[-1]
+        'link_group'
+        >>> fileinfo.get_data_dict_fieldnames(with_old_path=True)[-1]
+        'old_path'
         """
-        l_fieldnames = list(self.get_data_dict().keys())
+        l_fieldnames = list(self.get_data_dict(with_link_group=with_link_group, with_old_path=with_old_path).keys())
         return l_fieldnames
 
+    def is_timestamp_changed(self, other:'DataStructFileInfo', timestamp_name:str)->bool:
+        """
+        compares the nanoseconds if both have them (binary fingerprints), otherwise the csv representation (microseconds),
+        without converting csv datestrings
+
+        >>> fileinfo_1, fileinfo_2 = DataStructFileInfo(), DataStructFileInfo()
+        >>> fileinfo_1.modified_ns, fileinfo_2.modified_ns = 1000000001, 1000000002
+        >>> fileinfo_1.is_timestamp_changed(fileinfo_2, 'modified')
+        True
+        >>> fileinfo_2.modified = str(fileinfo_1.modified)
+        >>> fileinfo_1.is_timestamp_changed(fileinfo_2, 'modified'), fileinfo_2.is_timestamp_changed(fileinfo_1, 'modified')
+        (False, False)
+        """
+        value_ns_1, value_ns_2 = getattr(self, '_' + timestamp_name + '_ns'), getattr(other, '_' + timestamp_name + '_ns')
+        if value_ns_1 is not None and value_ns_2 is not None:
+            return value_ns_1 != value_ns_2
+        value_1, value_2 = getattr(self, timestamp_name), getattr(other, timestamp_name)
+        if type(value_1) is type(value_2):
+            return value_1 != value_2
+        return str(value_1) != str(value_2)
+
     """
     # interesting option only to modify the setter :
     # https://stackoverflow.com/questions/17576009/python-class-property-use-setter-but-evade-getter
@@ -191,6 +290,54 @@ class DataStructFileInfo(object):
         super(MyClass, self).__setattr__(name, value)
     """
 
+class DataStructFileInfoBatch(object):
+    def __init__(self):
+        """
+        the result of one multiprocessing task, see lib_fp_files.get_fileinfo_batch()
+
+        >>> fileinfo_batch = DataStructFileInfoBatch()
+        """
+        self.l_fileinfo:[DataStructFileInfo] = list()          # aligned with the file records of the task, vanished files are None
+        self.l_hash_cache_entries:[tuple] = list()              # new or used hash cache entries, to be written by the main process
+        self.n_hash_cache_hits:int = 0
+        self.n_hash_cache_misses:int = 0
+        self.l_seconds:[float] = list()                         # seconds per file, aligned with l_fileinfo
+        self.seconds:float = 0.0                                # busy time of the worker for this task
+
+class DataStructFileTier(object):
+    def __init__(self, name:str):
+        """
+        files and bytes of one size tier of lib_fp_files.FingerPrintFiles.create_fp_tiered()
+
+        >>> file_tier = DataStructFileTier('small files')
+        >>> file_tier.start()
+        >>> file_tier.add_file(None)
+        >>> file_tier.stop()
+        >>> file_tier.n_files, file_tier.n_bytes
+        (1, 0)
+        """
+        self.name:str = name
+        self.n_files:int = 0
+        self.n_bytes:int = 0
+        self.time_start:float = 0.0
+        self.seconds:float = 0.0
+
+    def start(self):
+        self.time_start = time.perf_counter()
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.time_start
+
+    def add_file(self, stat_result):
+        self.n_files += 1
+        if stat_result is not None:
+            self.n_bytes += stat_result.st_size
+
+    def log_throughput(self):
+        seconds = max(self.seconds, 1e-6)
+        logger.info('{}: {} files, {:.1f} MiB in {:.1f} seconds, {:.1f} files/s, {:.1f} MiB/s'.format(
+            self.name, self.n_files, self.n_bytes / 1048576, self.seconds, self.n_files / seconds, self.n_bytes / 1048576 / seconds))
+
 class DataStructRegistryFileInfo(object):
     def __init__(self):
         """
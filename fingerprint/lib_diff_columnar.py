@@ -0,0 +1,336 @@
+import array
+import csv
+from datetime import datetime
+import lib_compression
+import lib_data_structures
+import lib_diff_files
+import lib_doctest_pycharm
+import lib_fp_binary
+import lib_fp_store
+import lib_helper_functions
+import logging
+import mmap
+from typing import Callable, Dict, Iterator, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:     # numpy is optional, it is only needed for fp files_diff --diff_engine columnar
+    np = None
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# columnar files diff (fp files_diff --diff_engine columnar) - both fingerprints are loaded into numpy columns
+# (size, the timestamps as int64 nanoseconds or as datestrings, the hex digest as fixed width bytes), the paths are joined
+# through a dict path -> row of fingerprint 1, and the size / created / modified / hash changes are computed as array operations.
+# DataStructFileInfo objects are only made for the rows which go into the diff, so the output is the same as the hash join.
+# binary and csv fingerprints are read column by column, other fingerprints (a snapshot of a fingerprint store) through the fileinfos.
+
+HEX_DIGITS = np.array(['{:02x}'.format(value).encode('ascii') for value in range(256)], dtype='S2') if np is not None else None
+TIMESTAMP_NAMES = ('created', 'modified')      # the compared timestamps
+
+
+class FingerPrintColumns(object):
+    """
+    one fingerprint as columns - materialize(row) makes the DataStructFileInfo of a row, exactly like lib_diff_files.iter_fp_fileinfo()
+
+    >>> columns = load_columns('./testfiles_source/fp_files_result1_difftest.csv')
+    >>> columns.n_rows, columns.timestamp_kind, columns.size.dtype
+    (7, 'str', dtype('int64'))
+    >>> columns.materialize(0).path == columns.l_paths[0]
+    True
+    >>> columns.close()
+    """
+    def __init__(self):
+        self.l_paths: List[str] = list()
+        self.size = None                                    # int64
+        self.dict_timestamps: Dict[str, 'np.ndarray'] = dict()   # int64 nanoseconds or datestrings, see timestamp_kind
+        self.timestamp_kind: str = 'ns'                     # 'ns' or 'str'
+        self.hash = None                                    # hex digest, fixed width bytes
+        self.materialize: Callable[[int], lib_data_structures.DataStructFileInfo] = None
+        self.buffer = None                                  # the mmap of a binary fingerprint, needed to materialize rows
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.l_paths)
+
+    def get_timestamps_as_str(self, timestamp_name: str) -> 'np.ndarray':
+        """ datestrings like the csv fingerprint has them - str(DataStructFileInfo.created) """
+        timestamps = self.dict_timestamps[timestamp_name]
+        if self.timestamp_kind == 'str':
+            return timestamps
+        return get_string_array([str(datetime.fromtimestamp(lib_helper_functions.convert_ns_to_float(timestamp_ns)))
+                                 for timestamp_ns in timestamps.tolist()])
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.buffer = None
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+def iter_diff_rows(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, compare_hashes: bool,
+                   get_fileinfo_changed: Callable) -> Iterator[lib_data_structures.DataStructFileInfo]:
+    """
+    the diff rows in the order of the hash join : added and changed files in the order of fingerprint 2, then the deleted files.
+    get_fileinfo_changed(fileinfo_fp_1, fileinfo_fp_2, size_changed, created_changed, modified_changed, hash_changed) makes the diff row
+    """
+    columns_1 = load_columns(f_fp_1, snapshot_1)
+    columns_2 = load_columns(f_fp_2, snapshot_2)
+    try:
+        logger.info('columnar diff of {} and {} files'.format(columns_1.n_rows, columns_2.n_rows))
+        rows_1, rows_1_deleted = join_paths(columns_1.l_paths, columns_2.l_paths)
+        matched = rows_1 >= 0
+        rows_2_matched = np.flatnonzero(matched)
+        rows_1_matched = rows_1[rows_2_matched]
+
+        size_changed = columns_1.size[rows_1_matched] != columns_2.size[rows_2_matched]
+        created_changed = get_timestamp_changed(columns_1, columns_2, 'created', rows_1_matched, rows_2_matched)
+        modified_changed = get_timestamp_changed(columns_1, columns_2, 'modified', rows_1_matched, rows_2_matched)
+        if compare_hashes:
+            hash_changed = get_not_equal(columns_1.hash[rows_1_matched], columns_2.hash[rows_2_matched])
+        else:
+            hash_changed = np.zeros(len(rows_2_matched), dtype=bool)
+        changed = size_changed | created_changed | modified_changed | hash_changed
+
+        # the rows of fingerprint 2 which go into the diff - added or changed
+        in_diff = ~matched
+        in_diff[rows_2_matched[changed]] = True
+        # index into the change masks for every row of fingerprint 2
+        matched_index = np.full(columns_2.n_rows, -1, dtype=np.int64)
+        matched_index[rows_2_matched] = np.arange(len(rows_2_matched))
+        logger.info('{} files added, {} changed, {} deleted'.format(int(np.count_nonzero(~matched)), int(np.count_nonzero(changed)),
+                                                                    len(rows_1_deleted)))
+
+        for row_2 in np.flatnonzero(in_diff).tolist():
+            fileinfo_fp_2 = columns_2.materialize(row_2)
+            index = int(matched_index[row_2])
+            if index < 0:
+                fileinfo_fp_2.change = 'ADDED'
+                yield fileinfo_fp_2
+            else:
+                yield get_fileinfo_changed(columns_1.materialize(int(rows_1_matched[index])), fileinfo_fp_2,
+                                           bool(size_changed[index]), bool(created_changed[index]), bool(modified_changed[index]),
+                                           bool(hash_changed[index]))
+        for row_1 in rows_1_deleted.tolist():
+            fileinfo_fp_1 = columns_1.materialize(row_1)
+            fileinfo_fp_1.change = 'DELETED'
+            yield fileinfo_fp_1
+    finally:
+        columns_1.close()
+        columns_2.close()
+
+
+def join_paths(l_paths_1: List[str], l_paths_2: List[str]) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    returns the row of fingerprint 1 for every row of fingerprint 2 (-1 = added), and the deleted rows of fingerprint 1.
+    duplicate paths are resolved like the hash join : the last row of fingerprint 1 wins, only the first row of fingerprint 2 matches
+
+    >>> rows_1, rows_1_deleted = join_paths(['a', 'b', 'c', 'b'], ['c', 'x', 'b', 'b'])
+    >>> rows_1.tolist(), rows_1_deleted.tolist()
+    ([2, -1, 3, -1], [0])
+    """
+    dict_path_row_1 = dict(zip(l_paths_1, range(len(l_paths_1))))
+    rows_1 = np.fromiter((dict_path_row_1.get(path, -1) for path in l_paths_2), dtype=np.int64, count=len(l_paths_2))
+    rows_2_matched = np.flatnonzero(rows_1 >= 0)
+    rows_1_unique, index_first = np.unique(rows_1[rows_2_matched], return_index=True)
+    if len(rows_1_unique) < len(rows_2_matched):
+        duplicate = np.ones(len(rows_2_matched), dtype=bool)
+        duplicate[index_first] = False
+        rows_1[rows_2_matched[duplicate]] = -1
+    # the deleted files in the order of the dict, like the hash join
+    rows_1_in_dict = np.fromiter(dict_path_row_1.values(), dtype=np.int64, count=len(dict_path_row_1))
+    matched_1 = np.zeros(len(l_paths_1), dtype=bool)
+    matched_1[rows_1[rows_1 >= 0]] = True
+    return rows_1, rows_1_in_dict[~matched_1[rows_1_in_dict]]
+
+
+def get_timestamp_changed(columns_1: FingerPrintColumns, columns_2: FingerPrintColumns, timestamp_name: str,
+                          rows_1: 'np.ndarray', rows_2: 'np.ndarray') -> 'np.ndarray':
+    """ the nanoseconds if both fingerprints have them (binary), otherwise the datestrings - see DataStructFileInfo.is_timestamp_changed() """
+    if columns_1.timestamp_kind == columns_2.timestamp_kind:
+        return get_not_equal(columns_1.dict_timestamps[timestamp_name][rows_1], columns_2.dict_timestamps[timestamp_name][rows_2])
+    return get_not_equal(columns_1.get_timestamps_as_str(timestamp_name)[rows_1], columns_2.get_timestamps_as_str(timestamp_name)[rows_2])
+
+
+def get_not_equal(values_1: 'np.ndarray', values_2: 'np.ndarray') -> 'np.ndarray':
+    """
+    elementwise !=, bytes and str columns are compared as str
+
+    >>> get_not_equal(np.array([b'a', b'b']), np.array(['a', 'ä'])).tolist()
+    [False, True]
+    """
+    if values_1.dtype.kind != values_2.dtype.kind and {values_1.dtype.kind, values_2.dtype.kind} == {'S', 'U'}:
+        values_1, values_2 = values_1.astype(np.str_), values_2.astype(np.str_)
+    return values_1 != values_2
+
+
+def get_string_array(l_values: List[str]) -> 'np.ndarray':
+    """
+    ascii strings (datestrings, hex digests) as compact bytes, anything else as str
+
+    >>> get_string_array(['2018-11-14 19:46:58.076271', '']).dtype, get_string_array(['ä']).dtype
+    (dtype('S26'), dtype('<U1'))
+    """
+    try:
+        return np.array(l_values, dtype=np.bytes_).reshape(-1)
+    except UnicodeEncodeError:
+        return np.array(l_values, dtype=np.str_).reshape(-1)
+
+
+def load_columns(f_fingerprint: str, snapshot_id: int = 0) -> FingerPrintColumns:
+    if lib_fp_binary.is_binary_fingerprint(f_fingerprint):
+        return load_columns_from_binary(f_fingerprint)
+    if lib_fp_store.is_fp_store(f_fingerprint):
+        return load_columns_from_fileinfos(f_fingerprint, snapshot_id)
+    return load_columns_from_csv(f_fingerprint)
+
+
+def load_columns_from_binary(f_fp_binary: str) -> FingerPrintColumns:
+    """
+    the record offsets are collected in one pass, the fixed size fields are gathered from the buffer as arrays
+
+    >>> fileinfo = lib_data_structures.DataStructFileInfo()
+    >>> fileinfo.path, fileinfo.size, fileinfo.hash, fileinfo.modified_ns = './testresults/sub/file.txt', 3, 'e3b0c4', 2000000002
+    >>> with open('./testresults/fp_files_columnar_test.fpb', 'wb') as f_out:
+    ...     binary_writer = lib_fp_binary.FingerPrintBinaryWriter(f_out)
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     fileinfo.path, fileinfo.hash = './testresults/file.txt', ''
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     binary_writer.close()
+    >>> columns = load_columns_from_binary('./testresults/fp_files_columnar_test.fpb')
+    >>> columns.l_paths, columns.size.tolist(), columns.hash.tolist(), columns.dict_timestamps['modified'].tolist()
+    (['./testresults/sub/file.txt', './testresults/file.txt'], [3, 3], [b'e3b0c4', b''], [2000000002, 2000000002])
+    >>> fileinfo_materialized = columns.materialize(1)
+    >>> fileinfo_materialized.path, fileinfo_materialized.size, fileinfo_materialized.modified_ns
+    ('./testresults/file.txt', 3, 2000000002)
+    >>> columns.close()
+    """
+    columns = FingerPrintColumns()
+    if lib_compression.detect_compression(f_fp_binary):
+        with lib_compression.open_input(f_fp_binary, 'rb') as f_in:
+            buffer = f_in.read()
+    else:
+        with open(f_fp_binary, 'rb') as f_in:
+            buffer = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+    columns.buffer = buffer
+    with_link_group = lib_fp_binary.read_header(buffer, f_fp_binary)
+    l_dir_paths: List[str] = list()
+    offsets = get_file_record_offsets(buffer, l_dir_paths, f_fp_binary)
+
+    buffer_array = np.frombuffer(buffer, dtype=np.uint8)
+    offsets_array = np.frombuffer(offsets, dtype=np.int64) if len(offsets) else np.zeros(0, dtype=np.int64)
+    file_dtype = np.dtype([('dir_index', '<u4'), ('size', '<u8'), ('created_ns', '<i8'), ('modified_ns', '<i8'), ('accessed_ns', '<i8'),
+                           ('digest_length', 'u1')])
+    file_fields = gather(buffer_array, offsets_array, file_dtype.itemsize).view(file_dtype).reshape(-1)
+    columns.size = file_fields['size'].astype(np.int64)
+    for timestamp_name in TIMESTAMP_NAMES:
+        columns.dict_timestamps[timestamp_name] = file_fields[timestamp_name + '_ns'].astype(np.int64)
+    columns.timestamp_kind = 'ns'
+
+    # the digests, hex encoded - shorter digests (not hashed : 0) are padded with NUL, which numpy strips from bytes
+    digest_length = file_fields['digest_length'].astype(np.int64)
+    max_digest_length = int(digest_length.max()) if len(digest_length) else 0
+    offsets_digest = offsets_array + file_dtype.itemsize
+    if max_digest_length:
+        digests = gather(buffer_array, offsets_digest, max_digest_length)
+        hex_digits = HEX_DIGITS[digests]
+        hex_digits[np.arange(max_digest_length) >= digest_length[:, None]] = b''
+        columns.hash = np.ascontiguousarray(hex_digits).view('S{}'.format(2 * max_digest_length)).reshape(-1)
+    else:
+        columns.hash = np.zeros(len(offsets_array), dtype='S1')
+
+    # the paths - the directory of the string table + the name
+    offsets_name = offsets_digest + digest_length
+    name_length = gather(buffer_array, offsets_name, 2).view('<u2').reshape(-1).astype(np.int64)
+    offsets_name += 2
+    decode_str = lib_fp_binary.decode_str
+    columns.l_paths = [l_dir_paths[dir_index] + decode_str(buffer[offset:offset + length])
+                       for dir_index, offset, length in zip(file_fields['dir_index'].tolist(), offsets_name.tolist(), name_length.tolist())]
+
+    def materialize(row: int) -> lib_data_structures.DataStructFileInfo:
+        return lib_fp_binary.get_fileinfo_from_record(buffer, int(offsets_array[row]), l_dir_paths, with_link_group)
+    columns.materialize = materialize
+    return columns
+
+
+def get_file_record_offsets(buffer, l_dir_paths: List[str], f_fp_binary: str = '') -> array.array:
+    """ the payload offsets of the file records - the directory records are decoded into l_dir_paths """
+    offsets = array.array('q')
+    offset = lib_fp_binary.HEADER_STRUCT.size
+    buffer_size = len(buffer)
+    unpack_record_header = lib_fp_binary.RECORD_HEADER_STRUCT.unpack_from
+    record_header_size = lib_fp_binary.RECORD_HEADER_STRUCT.size
+    while offset + record_header_size <= buffer_size:
+        record_length, record_type = unpack_record_header(buffer, offset)
+        offset_payload = offset + record_header_size
+        offset = offset_payload + record_length - 1
+        if offset > buffer_size:
+            break
+        if record_type == lib_fp_binary.RECORD_FILE:
+            offsets.append(offset_payload)
+        elif record_type == lib_fp_binary.RECORD_DIR:
+            l_dir_paths.append(lib_fp_binary.decode_str(buffer[offset_payload:offset]))
+        elif record_type == lib_fp_binary.RECORD_END:
+            return offsets
+    logger.warning('the binary fingerprint {} is incomplete, the run which made it was probably aborted'.format(f_fp_binary))
+    return offsets
+
+
+def gather(buffer_array: 'np.ndarray', offsets: 'np.ndarray', length: int) -> 'np.ndarray':
+    """ (n, length) uint8 - the bytes at offsets, beyond the end of the buffer 0 """
+    indexes = offsets[:, None] + np.arange(length)
+    np.minimum(indexes, len(buffer_array) - 1, out=indexes)
+    return buffer_array[indexes]
+
+
+def load_columns_from_csv(f_fp_csv: str) -> FingerPrintColumns:
+    """ the timestamps stay datestrings, like lib_diff_files.FileDiff.get_fileinfo_from_dict() keeps them """
+    columns = FingerPrintColumns()
+    with lib_compression.open_input(f_fp_csv) as csvfile:
+        csv_reader = csv.reader(csvfile, dialect='excel')
+        fieldnames = next(csv_reader, [])
+        index_of = {fieldname: index for index, fieldname in enumerate(fieldnames)}
+        l_rows = [tuple(row) for row in csv_reader]
+    n_rows = len(l_rows)
+
+    def get_column(fieldname: str) -> list:
+        index = index_of.get(fieldname)
+        if index is None:
+            return [''] * n_rows
+        return [row[index] if index < len(row) else '' for row in l_rows]
+
+    columns.l_paths = get_column('path')
+    columns.size = np.fromiter((int(size) if size.isdigit() else -1 for size in get_column('size')), dtype=np.int64, count=n_rows)
+    for timestamp_name in TIMESTAMP_NAMES:
+        columns.dict_timestamps[timestamp_name] = get_string_array(get_column(timestamp_name))
+    columns.timestamp_kind = 'str'
+    columns.hash = get_string_array(get_column('hash'))
+
+    def materialize(row: int) -> lib_data_structures.DataStructFileInfo:
+        return lib_diff_files.FileDiff.get_fileinfo_from_dict(dict(zip(fieldnames, l_rows[row])))
+    columns.materialize = materialize
+    return columns
+
+
+def load_columns_from_fileinfos(f_fingerprint: str, snapshot_id: int = 0) -> FingerPrintColumns:
+    """ any fingerprint lib_diff_files.iter_fp_fileinfo() can read - the fileinfos are kept to materialize the rows """
+    columns = FingerPrintColumns()
+    l_fileinfo = list(lib_diff_files.iter_fp_fileinfo(f_fingerprint, snapshot_id))
+    columns.l_paths = [fileinfo.path for fileinfo in l_fileinfo]
+    columns.size = np.fromiter((fileinfo.size for fileinfo in l_fileinfo), dtype=np.int64, count=len(l_fileinfo))
+    for timestamp_name in TIMESTAMP_NAMES:
+        columns.dict_timestamps[timestamp_name] = np.fromiter((getattr(fileinfo, timestamp_name + '_ns') for fileinfo in l_fileinfo),
+                                                              dtype=np.int64, count=len(l_fileinfo))
+    columns.timestamp_kind = 'ns'
+    columns.hash = get_string_array([fileinfo.hash for fileinfo in l_fileinfo])
+    columns.materialize = l_fileinfo.__getitem__
+    return columns
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
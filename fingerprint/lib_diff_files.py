@@ -1,15 +1,25 @@
 import csv
+import lib_compression
 import lib_data_structures
+import lib_diff_columnar
+import lib_diff_moves
+import lib_diff_sharded
 import lib_doctest_pycharm
+import lib_external_sort
+import lib_fp_binary
+import lib_fp_metadata
+import lib_fp_store
 import logging
+import os
 from fp_conf import fp_diff_files_conf, fp_conf
+from typing import Iterator, Optional, Tuple
 
 logger = logging.getLogger()
 lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
 
 class FileDiff(object):
     def __init__(self):
-        pass
+        self.compare_hashes:bool = True
 
     def __enter__(self):
         return self
@@ -27,105 +37,334 @@ class FileDiff(object):
 
         """
 
-        l_fileinfo:[lib_data_structures.DataStructFileInfo] = self.get_l_diff_fileinfo()
-        self.write_diff_csv_file(l_fileinfo=l_fileinfo)
-
-    def get_l_diff_fileinfo(self)->[lib_data_structures.DataStructFileInfo]:
+        resolve_snapshot_ids()
+        if fp_diff_files_conf.shards > 1:
+            l_fileinfo = self.iter_diff_fileinfo_sharded()
+        elif fp_diff_files_conf.diff_engine == 'columnar':
+            l_fileinfo = self.iter_diff_fileinfo_columnar()
+        elif lib_fp_store.is_fp_store(fp_diff_files_conf.fp1_path) and lib_fp_store.is_fp_store(fp_diff_files_conf.fp2_path):
+            # both in a fingerprint store - the diff runs as indexed joins in sqlite and is streamed to the diff file
+            l_fileinfo = self.iter_diff_fileinfo_from_store()
+        elif is_merge_join_possible():
+            # both sorted by path - the fingerprints are walked in lockstep, constant memory
+            l_fileinfo = self.iter_diff_fileinfo_merge_join()
+        else:
+            l_fileinfo = self.iter_diff_fileinfo_hash_join()
+        if fp_diff_files_conf.detect_moves:
+            l_fileinfo = self.iter_diff_fileinfo_with_moves(l_fileinfo)
+        self.write_diff_csv_file(l_fileinfo=l_fileinfo, with_old_path=fp_diff_files_conf.detect_moves)
 
+    def iter_diff_fileinfo_hash_join(self)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """ the first fingerprint is held in a dict, the second one is streamed - the remaining files of the first one were deleted """
+        logger.info('diff engine: hash join')
+        self.compare_hashes = is_hash_algo_matching()
         hashed_dict_fp_1 = get_hashed_dict_fp_1()
 
-        l_fileinfo:[lib_data_structures.DataStructFileInfo] = list()
-
-        with open(fp_diff_files_conf.fp2_path, newline='', encoding='utf-8-sig') as csv_fp_2:
-            csv_reader_fp_2 = csv.DictReader(csv_fp_2, dialect='excel')
-            # iterate new file fingerprints
-            for dict_data_fp_2 in csv_reader_fp_2:
-                # if new fingerprint
-                if dict_data_fp_2['path'] in hashed_dict_fp_1:     # file was there before
-                    # if size or modified timestamp has been changed
-                    fileinfo_fp_2 = self.get_fileinfo_from_dict(dict_data_fp_2)
-                    fileinfo_fp_1 = self.get_fileinfo_from_dict(hashed_dict_fp_1[fileinfo_fp_2.path])
-                    fileinfo_fp_diff:lib_data_structures.DataStructFileInfo = self.get_fileinfo_from_dict(dict_data_fp_2)
-
-                    b_changed:bool = False
-                    b_changed_silent:bool = True
-                    l_remark:[str] = list()
-
-                    if fileinfo_fp_1.size != fileinfo_fp_2.size:
-                        l_remark.append('Size changed from {} to {}'.format(fileinfo_fp_1.size, fileinfo_fp_2.size))
-                        b_changed = True
-                    if fileinfo_fp_1.created != fileinfo_fp_2.created:
-                        l_remark.append('created changed from {} to {}'.format(fileinfo_fp_1.created, fileinfo_fp_2.created))
-                        b_changed = True
-                        b_changed_silent = False
-                    if fileinfo_fp_1.modified != fileinfo_fp_2.modified:
-                        l_remark.append('modified changed from {} to {}'.format(fileinfo_fp_1.modified, fileinfo_fp_2.modified))
-                        b_changed = True
-                        b_changed_silent = False
-                    if fileinfo_fp_1.hash != fileinfo_fp_2.hash:
-                        l_remark.append('hash (data) changed')
-                        b_changed = True
-
-                    if b_changed_silent:
-                        fileinfo_fp_diff.change = 'CHANGED_SILENT'
-                    elif b_changed:
-                        fileinfo_fp_diff.change = 'CHANGED'
-                    if l_remark:
-                        fileinfo_fp_diff.remark = ', '.join(l_remark)
-                        l_fileinfo.append(fileinfo_fp_diff)
-
-                    # delete the file from hashed_dict_fp_1
-                    hashed_dict_fp_1.pop(dict_data_fp_2['path'])
-                else:                                                                           # new file
-                    # add the new file to the result list
-                    fileinfo_fp_diff = self.get_fileinfo_from_dict(dict_data_fp_2)
-                    fileinfo_fp_diff.change = 'ADDED'
-                    l_fileinfo.append(fileinfo_fp_diff)
-
-            # add the deleted files from fingerprint_1
-            l_fileinfo = l_fileinfo + self.get_l_deleted_file_info(hashed_dict_fp_1)
-        return l_fileinfo
-
-    def get_l_deleted_file_info(self, hashed_dict_fp_1)->[lib_data_structures.DataStructFileInfo]:
-        l_fileinfo:[lib_data_structures.DataStructFileInfo] = list()
+        # iterate new file fingerprints
+        for fileinfo_fp_2 in iter_fp_fileinfo(fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot2):
+            fileinfo_fp_1 = hashed_dict_fp_1.pop(fileinfo_fp_2.path, None)
+            fileinfo_fp_diff = self.get_fileinfo_diff(fileinfo_fp_1, fileinfo_fp_2)
+            if fileinfo_fp_diff is not None:
+                yield fileinfo_fp_diff
+
+        # add the deleted files from fingerprint_1
+        yield from self.iter_deleted_file_info(hashed_dict_fp_1.values())
+
+    def iter_diff_fileinfo_sharded(self)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """ a hash join per shard in parallel processes, see lib_diff_sharded - the same output as the hash join """
+        self.compare_hashes = is_hash_algo_matching()
+        sharded_diff = lib_diff_sharded.ShardedDiff(n_shards=fp_diff_files_conf.shards, n_workers=fp_diff_files_conf.shard_workers,
+                                                    tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+        yield from sharded_diff.iter_files_diff(fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path,
+                                                fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2, compare_hashes=self.compare_hashes)
+
+    def iter_diff_fileinfo_with_moves(self, fileinfos)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """
+        pairs DELETED and ADDED files with the same content to MOVED / RENAMED rows, see lib_diff_moves.
+        the diff rows of any engine are streamed once, the fingerprints are not read again
+        """
+        with lib_diff_moves.MoveDetector(tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output))) as move_detector:
+            for fileinfo in fileinfos:
+                move_detector.add(fileinfo)
+            # the engines set compare_hashes when they start
+            if self.compare_hashes:
+                move_detector.pair_moves()
+            else:
+                logger.warning('moved and renamed files can not be detected without comparable hashes')
+            yield from move_detector
+            logger.info('detected {} moved and {} renamed files'.format(move_detector.n_moved, move_detector.n_renamed))
+
+    def iter_diff_fileinfo_columnar(self)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """
+        both fingerprints as numpy columns, see lib_diff_columnar - the same output as the hash join
+
+        >>> fp_diff_files_conf.fp1_path = './testfiles_source/fp_files_result1_difftest.csv'
+        >>> fp_diff_files_conf.fp2_path = './testfiles_source/fp_files_result2_difftest.csv'
+        >>> l_diff_hash_join = [fileinfo.get_data_dict() for fileinfo in FileDiff().iter_diff_fileinfo_hash_join()]
+        >>> l_diff_columnar = [fileinfo.get_data_dict() for fileinfo in FileDiff().iter_diff_fileinfo_columnar()]
+        >>> l_diff_columnar == l_diff_hash_join, len(l_diff_columnar)
+        (True, 5)
+        """
+        if not lib_diff_columnar.is_available():
+            raise RuntimeError('the columnar diff engine needs numpy - install it with "pip install numpy" or use another --diff_engine')
+        logger.info('diff engine: columnar')
+        self.compare_hashes = is_hash_algo_matching()
+        yield from lib_diff_columnar.iter_diff_rows(fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path,
+                                                    fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2,
+                                                    compare_hashes=self.compare_hashes, get_fileinfo_changed=self.get_fileinfo_changed)
+
+    def iter_diff_fileinfo_merge_join(self)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """
+        both fingerprints sorted by lib_external_sort.get_path_sort_key (fp files --sorted) are walked in lockstep.
+        the deleted files are spilled to a temporary file and written at the end - the same output as the hash join
+
+        >>> # the test fingerprints, sorted
+        >>> for f_fingerprint in ('fp_files_result1_difftest.csv', 'fp_files_result2_difftest.csv'):
+        ...     l_rows = sorted(csv.DictReader(open('./testfiles_source/' + f_fingerprint, encoding='utf-8-sig')),
+        ...                     key=lambda row: lib_external_sort.get_path_sort_key(row['path']))
+        ...     with open('./testresults/sorted_' + f_fingerprint, 'w', encoding='utf-8', newline='') as f_out:
+        ...         csv_writer = csv.DictWriter(f_out, fieldnames=list(l_rows[0].keys()), dialect='excel')
+        ...         _ = csv_writer.writeheader()
+        ...         csv_writer.writerows(l_rows)
+        ...     lib_fp_metadata.write_fp_metadata('./testresults/sorted_' + f_fingerprint, {'sorted': lib_external_sort.SORT_ORDER_FILES})
+        >>> fp_diff_files_conf.fp1_path = './testresults/sorted_fp_files_result1_difftest.csv'
+        >>> fp_diff_files_conf.fp2_path = './testresults/sorted_fp_files_result2_difftest.csv'
+        >>> is_merge_join_possible()
+        True
+        >>> for fp_diff_files_conf.diff_engine in ('hash_join', 'merge_join'):
+        ...     fp_conf.f_output = './testresults/fp_files_diff_1_2_{}.csv'.format(fp_diff_files_conf.diff_engine)
+        ...     FileDiff().create_diff_file()
+        >>> fp_diff_files_conf.diff_engine = 'auto'
+        >>> open('./testresults/fp_files_diff_1_2_hash_join.csv').read() == open('./testresults/fp_files_diff_1_2_merge_join.csv').read()
+        True
+        >>> len(open('./testresults/fp_files_diff_1_2_merge_join.csv').readlines())
+        6
+        """
+        logger.info('diff engine: merge join')
+        self.compare_hashes = is_hash_algo_matching()
+        iter_fp_1 = iter_sorted_fp_fileinfo(fp_diff_files_conf.fp1_path, fp_diff_files_conf.snapshot1)
+        iter_fp_2 = iter_sorted_fp_fileinfo(fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot2)
+        fileinfo_fp_1, sort_key_1 = next(iter_fp_1, (None, None))
+        fileinfo_fp_2, sort_key_2 = next(iter_fp_2, (None, None))
+        with lib_external_sort.SpillFile(tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output))) as deleted_files:
+            while fileinfo_fp_1 is not None or fileinfo_fp_2 is not None:
+                if fileinfo_fp_2 is None or (fileinfo_fp_1 is not None and sort_key_1 < sort_key_2):
+                    deleted_files.add(fileinfo_fp_1)
+                    fileinfo_fp_1, sort_key_1 = next(iter_fp_1, (None, None))
+                    continue
+                if fileinfo_fp_1 is None or sort_key_2 < sort_key_1:
+                    fileinfo_fp_diff = self.get_fileinfo_diff(None, fileinfo_fp_2)
+                else:
+                    fileinfo_fp_diff = self.get_fileinfo_diff(fileinfo_fp_1, fileinfo_fp_2)
+                    fileinfo_fp_1, sort_key_1 = next(iter_fp_1, (None, None))
+                if fileinfo_fp_diff is not None:
+                    yield fileinfo_fp_diff
+                fileinfo_fp_2, sort_key_2 = next(iter_fp_2, (None, None))
+            yield from self.iter_deleted_file_info(deleted_files)
+
+    def iter_diff_fileinfo_from_store(self)->Iterator[lib_data_structures.DataStructFileInfo]:
+        """
+        >>> import os
+        >>> if os.path.exists('./testresults/fp_files_store_difftest.sqlite'): os.remove('./testresults/fp_files_store_difftest.sqlite')
+        >>> with lib_fp_store.FingerPrintStore('./testresults/fp_files_store_difftest.sqlite') as fp_store:
+        ...     for f_csv in ('./testfiles_source/fp_files_result1_difftest.csv', './testfiles_source/fp_files_result2_difftest.csv'):
+        ...         snapshot_writer = fp_store.create_snapshot('files', {'hash_algo': 'sha256'})
+        ...         for fileinfo in iter_fp_fileinfo(f_csv):
+        ...             snapshot_writer.write_fileinfo(fileinfo)
+        ...         snapshot_writer.close()
+        >>> fp_diff_files_conf.fp1_path = './testfiles_source/fp_files_result1_difftest.csv'
+        >>> fp_diff_files_conf.fp2_path = './testfiles_source/fp_files_result2_difftest.csv'
+        >>> l_diff_csv = [(fileinfo.path, fileinfo.change, fileinfo.remark) for fileinfo in FileDiff().iter_diff_fileinfo_hash_join()]
+        >>> fp_diff_files_conf.fp1_path = fp_diff_files_conf.fp2_path = './testresults/fp_files_store_difftest.sqlite'
+        >>> fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2 = 1, 2
+        >>> l_diff_store = [(fileinfo.path, fileinfo.change, fileinfo.remark) for fileinfo in FileDiff().iter_diff_fileinfo_from_store()]
+        >>> fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2 = 0, 0
+        >>> l_diff_store == l_diff_csv, len(l_diff_store)
+        (True, 5)
+        """
+        self.compare_hashes = is_hash_algo_matching()
+        for fileinfo_fp_1, fileinfo_fp_2 in lib_fp_store.iter_files_diff_candidates(
+                fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2,
+                compare_hashes=self.compare_hashes):
+            fileinfo_fp_diff = self.get_fileinfo_diff(fileinfo_fp_1, fileinfo_fp_2)
+            if fileinfo_fp_diff is not None:
+                yield fileinfo_fp_diff
+        for fileinfo_fp_1 in lib_fp_store.iter_files_deleted(fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path,
+                                                             fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2):
+            fileinfo_fp_1.change = 'DELETED'
+            yield fileinfo_fp_1
+
+    def get_fileinfo_diff(self, fileinfo_fp_1:Optional[lib_data_structures.DataStructFileInfo],
+                          fileinfo_fp_2:lib_data_structures.DataStructFileInfo)->Optional[lib_data_structures.DataStructFileInfo]:
+        """ the diff row for a file of fp2 - fileinfo_fp_1 is None for new files, returns None if nothing changed """
+        if fileinfo_fp_1 is None:                                               # new file
+            fileinfo_fp_2.change = 'ADDED'
+            return fileinfo_fp_2
+
+        # file was there before
+        return self.get_fileinfo_changed(fileinfo_fp_1, fileinfo_fp_2,
+                                         size_changed=fileinfo_fp_1.size != fileinfo_fp_2.size,
+                                         created_changed=fileinfo_fp_1.is_timestamp_changed(fileinfo_fp_2, 'created'),
+                                         modified_changed=fileinfo_fp_1.is_timestamp_changed(fileinfo_fp_2, 'modified'),
+                                         hash_changed=self.compare_hashes and fileinfo_fp_1.hash != fileinfo_fp_2.hash)
+
+    @staticmethod
+    def get_fileinfo_changed(fileinfo_fp_1:lib_data_structures.DataStructFileInfo, fileinfo_fp_2:lib_data_structures.DataStructFileInfo,
+                             size_changed:bool, created_changed:bool, modified_changed:bool,
+                             hash_changed:bool)->Optional[lib_data_structures.DataStructFileInfo]:
+        """ the fileinfo of the new fingerprint becomes the diff row - CHANGED_SILENT : the data changed, but not the timestamps """
+        l_remark:[str] = list()
+        if size_changed:
+            l_remark.append('Size changed from {} to {}'.format(fileinfo_fp_1.size, fileinfo_fp_2.size))
+        if created_changed:
+            l_remark.append('created changed from {} to {}'.format(fileinfo_fp_1.created, fileinfo_fp_2.created))
+        if modified_changed:
+            l_remark.append('modified changed from {} to {}'.format(fileinfo_fp_1.modified, fileinfo_fp_2.modified))
+        if hash_changed:
+            l_remark.append('hash (data) changed')
+        if not l_remark:
+            return None
+        fileinfo_fp_2.change = 'CHANGED' if created_changed or modified_changed else 'CHANGED_SILENT'
+        fileinfo_fp_2.remark = ', '.join(l_remark)
+        return fileinfo_fp_2
+
+    @staticmethod
+    def iter_deleted_file_info(fileinfos_fp_1)->Iterator[lib_data_structures.DataStructFileInfo]:
         # remaining Files were deleted
-        for path, dict_file_info in hashed_dict_fp_1.items():
-            fileinfo_fp_diff = self.get_fileinfo_from_dict(dict_file_info)
-            fileinfo_fp_diff.change = 'DELETED'
-            l_fileinfo.append(fileinfo_fp_diff)
-        return l_fileinfo
+        for fileinfo_fp_1 in fileinfos_fp_1:
+            fileinfo_fp_1.change = 'DELETED'
+            yield fileinfo_fp_1
 
     @staticmethod
     def get_fileinfo_from_dict(dict_file_info)->lib_data_structures.DataStructFileInfo:
         fileinfo = lib_data_structures.DataStructFileInfo()
         for key, data in dict_file_info.items():
-            setattr(fileinfo, key, data)
+            try:
+                setattr(fileinfo, key, data)
+            except AttributeError:
+                # a column we do not know - DataStructFileInfo has __slots__, so it can not take arbitrary attributes
+                pass
+        if isinstance(fileinfo.size, str) and fileinfo.size.isdigit():
+            # binary fingerprints deliver the size as int - csv and binary fingerprints can be compared
+            fileinfo.size = int(fileinfo.size)
         return fileinfo
 
     @staticmethod
-    def write_diff_csv_file(l_fileinfo:[lib_data_structures.DataStructFileInfo]):
-        with open(fp_conf.f_output, 'w', encoding='utf-8',newline='') as f_out:
-            fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames()
+    def write_diff_csv_file(l_fileinfo:[lib_data_structures.DataStructFileInfo], with_old_path:bool = False):
+        with lib_compression.open_output(fp_conf.f_output, 'w', compress=fp_conf.compress) as f_out:
+            fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames(with_old_path=with_old_path)
             csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames)
             csv_writer.writeheader()
             for fileinfo in l_fileinfo:
-                csv_writer.writerow(fileinfo.get_data_dict())
+                csv_writer.writerow(fileinfo.get_data_dict(with_old_path=with_old_path))
+
+
+def is_hash_algo_matching()->bool:
+    """
+    hashes made with different algorithms (or without hashing) can not be compared - we diff without them and warn.
+    fingerprints without metadata were made by older versions, always with sha256
+
+    >>> fp_diff_files_conf.fp1_path = './testfiles_source/fp_files_result1_difftest.csv'
+    >>> fp_diff_files_conf.fp2_path = './testfiles_source/fp_files_result2_difftest.csv'
+    >>> is_hash_algo_matching()
+    True
+    >>> lib_fp_metadata.write_fp_metadata('./testresults/fp_files_result_blake2b.csv', {'hash_algo': 'blake2b'})
+    >>> fp_diff_files_conf.fp2_path = './testresults/fp_files_result_blake2b.csv'
+    >>> is_hash_algo_matching()
+    False
+    """
+    hash_algo_1 = get_fp_metadata(fp_diff_files_conf.fp1_path, fp_diff_files_conf.snapshot1).get('hash_algo', 'sha256')
+    hash_algo_2 = get_fp_metadata(fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot2).get('hash_algo', 'sha256')
+    if hash_algo_1 != hash_algo_2:
+        logger.warning('the fingerprints were hashed with different algorithms ("{}", "{}") - file hashes are not compared, '
+                       'silent data changes can not be detected'.format(hash_algo_1, hash_algo_2))
+        return False
+    if not hash_algo_1:
+        logger.warning('the fingerprints were made without hashing - file hashes are not compared, silent data changes can not be detected')
+        return False
+    return True
+
+
+def get_fp_metadata(f_fingerprint:str, snapshot_id:int = 0)->dict:
+    """ the metadata sidecar, or the metadata of the snapshot for a fingerprint store """
+    if snapshot_id and lib_fp_store.is_fp_store(f_fingerprint):
+        return lib_fp_store.read_snapshot_metadata(f_fingerprint, snapshot_id)
+    return lib_fp_metadata.read_fp_metadata(f_fingerprint)
+
+
+def resolve_snapshot_ids():
+    """ the snapshots to diff, if the fingerprints are in a fingerprint store, see lib_fp_store.resolve_snapshot_ids() """
+    fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2 = lib_fp_store.resolve_snapshot_ids(
+        fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2, 'files')
+    if fp_diff_files_conf.snapshot1 or fp_diff_files_conf.snapshot2:
+        logger.info('diff of snapshot {} and snapshot {}'.format(fp_diff_files_conf.snapshot1, fp_diff_files_conf.snapshot2))
+
+
+def is_merge_join_possible()->bool:
+    """ fp_diff_files_conf.diff_engine 'auto' : the merge join if both fingerprints are marked as sorted """
+    if fp_diff_files_conf.diff_engine != 'auto':
+        return fp_diff_files_conf.diff_engine == 'merge_join'
+    return is_sorted_fingerprint(fp_diff_files_conf.fp1_path, fp_diff_files_conf.snapshot1) and \
+        is_sorted_fingerprint(fp_diff_files_conf.fp2_path, fp_diff_files_conf.snapshot2)
+
+
+def is_sorted_fingerprint(f_fingerprint:str, snapshot_id:int = 0)->bool:
+    """
+    the sorted flag in the header of binary fingerprints, the sort order in the metadata of csv fingerprints and snapshots
+
+    >>> is_sorted_fingerprint('./testfiles_source/fp_files_result1_difftest.csv')
+    False
+    """
+    if lib_fp_binary.is_binary_fingerprint(f_fingerprint):
+        return lib_fp_binary.is_sorted(f_fingerprint)
+    return get_fp_metadata(f_fingerprint, snapshot_id).get('sorted', '') == lib_external_sort.SORT_ORDER_FILES
+
+
+def iter_sorted_fp_fileinfo(f_fingerprint:str, snapshot_id:int = 0)->Iterator[Tuple[lib_data_structures.DataStructFileInfo, str]]:
+    """ (fileinfo, sort key) - we trust the sorted marker, but check the order on the way """
+    sort_key_last = ''
+    for fileinfo in iter_fp_fileinfo(f_fingerprint, snapshot_id):
+        sort_key = lib_external_sort.get_path_sort_key(fileinfo.path)
+        if sort_key < sort_key_last:
+            raise ValueError('{} is not sorted by path, "{}" after "{}" - create it with --sorted or use --diff_engine hash_join'.format(
+                f_fingerprint, fileinfo.path, sort_key_last.split('\x00', 1)[-1]))
+        sort_key_last = sort_key
+        yield fileinfo, sort_key
+
 
 def get_hashed_dict_fp_1()->{}:
     """
-    :return:
+    :return: path -> fileinfo of the first fingerprint
 
     >>> fp_diff_files_conf.fp1_path = './testfiles_source/fp_files_result1_difftest.csv'
     >>> hashed_dict = get_hashed_dict_fp_1()
     >>> hashed_dict  # doctest: +ELLIPSIS, +NORMALIZE_WHITESPACE
-    {'.\\\\testfiles\\\\file1_no_changes.txt': OrderedDict([...])}
+    {'.\\\\testfiles\\\\file1_no_changes.txt': <lib_data_structures.DataStructFileInfo object at ...>, ...}
     """
     hashed_dict = dict()
-    with open(fp_diff_files_conf.fp1_path, newline='', encoding='utf-8-sig') as csvfile:
+    for fileinfo in iter_fp_fileinfo(fp_diff_files_conf.fp1_path, fp_diff_files_conf.snapshot1):
+        hashed_dict[fileinfo.path] = fileinfo
+    return hashed_dict
+
+
+def iter_fp_fileinfo(f_fingerprint:str, snapshot_id:int = 0)->Iterator[lib_data_structures.DataStructFileInfo]:
+    """
+    reads csv and binary fingerprints (see lib_fp_binary), compressed or not, and snapshots of a fingerprint store
+    (see lib_fp_store) - the format and the compression are detected by the magic bytes
+
+    >>> [fileinfo.size for fileinfo in iter_fp_fileinfo('./testfiles_source/fp_files_result1_difftest.csv')][:1]
+    [0]
+    """
+    if lib_fp_binary.is_binary_fingerprint(f_fingerprint):
+        yield from lib_fp_binary.iter_fileinfo(f_fingerprint)
+        return
+    if lib_fp_store.is_fp_store(f_fingerprint):
+        yield from lib_fp_store.iter_fileinfo(f_fingerprint, snapshot_id)
+        return
+    with lib_compression.open_input(f_fingerprint) as csvfile:
         csv_reader = csv.DictReader(csvfile, dialect='excel')
         for dict_data in csv_reader:
-            hashed_dict[dict_data['path']] = dict_data.copy()
-    return hashed_dict
+            yield FileDiff.get_fileinfo_from_dict(dict_data)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,147 @@
+import lib_data_structures
+import lib_doctest_pycharm
+import lib_external_sort
+import lib_fp_binary
+import logging
+from typing import Dict, Iterator, List, Set, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# move and rename detection (fp files_diff --detect_moves) - a moved or renamed file is a DELETED and an ADDED row with the same content.
+# the diff rows of any diff engine are streamed once : the ADDED rows with a hash are indexed by (hash, size) and by
+# (hash, size, name), the index holds only their positions. the rows are kept in order in SpillFiles, not in memory.
+# then every DELETED row (in the order of fp1) takes the first unpaired ADDED row (in the order of fp2) of the same content
+# with the same name, otherwise the first one with any name - many to many groups are paired deterministically by the order of the fingerprints.
+# empty files are never paired, they all have the same hash.
+#
+# MOVED   : the directory changed, the name may have changed too
+# RENAMED : the same directory, another name
+#
+# the paired ADDED row becomes the MOVED / RENAMED row at its place, with old_path = the path in fp1, the paired DELETED row is dropped.
+
+
+class MoveDetector(object):
+    """
+    >>> def get_fileinfo(path, change, hash_value='', size=1):
+    ...     fileinfo = lib_data_structures.DataStructFileInfo()
+    ...     fileinfo.path, fileinfo.change, fileinfo.hash, fileinfo.size = path, change, hash_value, size
+    ...     return fileinfo
+    >>> l_fileinfo = [get_fileinfo('/new/a.txt', 'ADDED', 'h1'), get_fileinfo('/c.txt', 'CHANGED', 'h9'),
+    ...               get_fileinfo('/b/y.txt', 'ADDED', 'h2'), get_fileinfo('/d/copy_1', 'ADDED', 'h3'),
+    ...               get_fileinfo('/d/copy_2', 'ADDED', 'h3'), get_fileinfo('/e/empty', 'ADDED', 'h0', 0),
+    ...               get_fileinfo('/old/a.txt', 'DELETED', 'h1'), get_fileinfo('/b/x.txt', 'DELETED', 'h2'),
+    ...               get_fileinfo('/x/copy_2', 'DELETED', 'h3'), get_fileinfo('/x/other', 'DELETED', 'h3'),
+    ...               get_fileinfo('/x/third', 'DELETED', 'h3'), get_fileinfo('/f/empty', 'DELETED', 'h0', 0)]
+    >>> with MoveDetector() as move_detector:
+    ...     for fileinfo in l_fileinfo:
+    ...         move_detector.add(fileinfo)
+    ...     move_detector.pair_moves()
+    ...     for fileinfo in move_detector:
+    ...         print((fileinfo.path, fileinfo.change, fileinfo.old_path))
+    ('/new/a.txt', 'MOVED', '/old/a.txt')
+    ('/c.txt', 'CHANGED', '')
+    ('/b/y.txt', 'RENAMED', '/b/x.txt')
+    ('/d/copy_1', 'MOVED', '/x/other')
+    ('/d/copy_2', 'MOVED', '/x/copy_2')
+    ('/e/empty', 'ADDED', '')
+    ('/x/third', 'DELETED', '')
+    ('/f/empty', 'DELETED', '')
+    >>> move_detector.n_moved, move_detector.n_renamed
+    (3, 1)
+    """
+    def __init__(self, tmp_dir: str = ''):
+        self.rows = lib_external_sort.SpillFile(tmp_dir=tmp_dir)           # all rows but the deleted ones, in order
+        self.deleted_rows = lib_external_sort.SpillFile(tmp_dir=tmp_dir)   # the deleted rows, in order
+        # positions of the ADDED candidates, by content and by content and name
+        self.dict_added_by_content: Dict[Tuple, List[int]] = dict()
+        self.dict_added_by_content_and_name: Dict[Tuple, List[int]] = dict()
+        self.dict_old_path: Dict[int, str] = dict()         # position of a paired ADDED row : the path of the DELETED row
+        self.set_paired_deleted: Set[int] = set()           # positions of the paired DELETED rows
+        self.n_moved: int = 0
+        self.n_renamed: int = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, fileinfo: lib_data_structures.DataStructFileInfo):
+        if fileinfo.change == 'DELETED':
+            self.deleted_rows.add(fileinfo)
+            return
+        if fileinfo.change == 'ADDED' and is_move_candidate(fileinfo):
+            content_key = (fileinfo.hash, fileinfo.size)
+            name = lib_fp_binary.split_path(fileinfo.path)[1]
+            self.dict_added_by_content.setdefault(content_key, list()).append(self.rows.n_items)
+            self.dict_added_by_content_and_name.setdefault(content_key + (name, ), list()).append(self.rows.n_items)
+        self.rows.add(fileinfo)
+
+    def pair_moves(self):
+        """ pairs the DELETED rows with the ADDED rows - after all rows were added """
+        # reversed, so pop() delivers the positions in the order of fp2
+        for l_positions in self.dict_added_by_content.values():
+            l_positions.reverse()
+        for l_positions in self.dict_added_by_content_and_name.values():
+            l_positions.reverse()
+
+        for position_deleted, fileinfo in enumerate(self.deleted_rows):
+            if not is_move_candidate(fileinfo):
+                continue
+            content_key = (fileinfo.hash, fileinfo.size)
+            name = lib_fp_binary.split_path(fileinfo.path)[1]
+            position_added = self.pop_unpaired(self.dict_added_by_content_and_name.get(content_key + (name, )))
+            if position_added < 0:
+                position_added = self.pop_unpaired(self.dict_added_by_content.get(content_key))
+            if position_added >= 0:
+                self.dict_old_path[position_added] = fileinfo.path
+                self.set_paired_deleted.add(position_deleted)
+
+        self.dict_added_by_content = dict()
+        self.dict_added_by_content_and_name = dict()
+
+    def pop_unpaired(self, l_positions: List[int]) -> int:
+        """ the next unpaired position of the list or -1 - a position is in two lists, the paired ones are skipped here """
+        while l_positions:
+            position = l_positions.pop()
+            if position not in self.dict_old_path:
+                return position
+        return -1
+
+    def __iter__(self) -> Iterator[lib_data_structures.DataStructFileInfo]:
+        for position, fileinfo in enumerate(self.rows):
+            old_path = self.dict_old_path.get(position)
+            if old_path is not None:
+                self.set_moved(fileinfo, old_path)
+            yield fileinfo
+        for position, fileinfo in enumerate(self.deleted_rows):
+            if position not in self.set_paired_deleted:
+                yield fileinfo
+
+    def set_moved(self, fileinfo: lib_data_structures.DataStructFileInfo, old_path: str):
+        old_dir, old_name = lib_fp_binary.split_path(old_path)
+        new_dir, new_name = lib_fp_binary.split_path(fileinfo.path)
+        fileinfo.old_path = old_path
+        if old_dir == new_dir:
+            fileinfo.change = 'RENAMED'
+            self.n_renamed += 1
+        else:
+            fileinfo.change = 'MOVED'
+            if old_name != new_name:
+                fileinfo.remark = 'moved and renamed'
+            self.n_moved += 1
+
+    def close(self):
+        self.rows.close()
+        self.deleted_rows.close()
+
+
+def is_move_candidate(fileinfo: lib_data_structures.DataStructFileInfo) -> bool:
+    """ only files with a hash and content can be paired - a size from a csv fingerprint might be a string """
+    return bool(fileinfo.hash) and fileinfo.size not in (0, '0', '')
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
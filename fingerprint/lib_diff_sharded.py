@@ -0,0 +1,364 @@
+import concurrent.futures
+import csv
+import heapq
+import lib_compression
+import lib_data_structures
+import lib_diff_files
+import lib_doctest_pycharm
+import lib_external_sort
+import lib_fp_binary
+import lib_fp_store
+import lib_helper_functions
+import logging
+import operator
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# sharded diff (fp files_diff / fp reg_diff --shards N) - diffs of big fingerprints on all cores.
+# a pre-pass partitions both fingerprints by a stable hash of the key (the path, for the registry path and value name)
+# into N shard files, every row keeps its position in the fingerprint. the pre-pass does not decode the rows, it moves the
+# records of binary fingerprints, the csv rows and the rows of a store as they are - the workers decode them (see get_fileinfo_decoder).
+# both fingerprints are partitioned in parallel, then N worker processes diff the shards independently,
+# a worker holds one shard of fp1 in memory, not the whole fingerprint. the diffs of the shards are k-way merged by position,
+# so the diff file is the same as without shards : changed and added rows in the order of fp2, then the deleted rows in the order of fp1.
+#
+# shard files : pickled chunks of (position, raw row) like the sorted runs of lib_external_sort, in a temporary directory next to the diff file
+
+SHARD_CHUNK_SIZE: int = 1024        # rows per pickled chunk - the partition pass buffers one chunk per shard
+
+
+class ShardedDiff(object):
+    """
+    >>> fp_diff_files_conf = lib_diff_files.fp_diff_files_conf
+    >>> fp_diff_files_conf.fp1_path = './testfiles_source/fp_files_result1_difftest.csv'
+    >>> fp_diff_files_conf.fp2_path = './testfiles_source/fp_files_result2_difftest.csv'
+    >>> l_diff_hash_join = [fileinfo.get_data_dict() for fileinfo in lib_diff_files.FileDiff().iter_diff_fileinfo_hash_join()]
+    >>> sharded_diff = ShardedDiff(n_shards=3, n_workers=2, tmp_dir='./testresults')
+    >>> l_diff_sharded = [fileinfo.get_data_dict() for fileinfo in sharded_diff.iter_files_diff(
+    ...     fp_diff_files_conf.fp1_path, fp_diff_files_conf.fp2_path, 0, 0, compare_hashes=True)]
+    >>> l_diff_sharded == l_diff_hash_join, len(l_diff_sharded)
+    (True, 5)
+    >>> dict_report = sharded_diff.get_report()
+    >>> dict_report['n_shards'], dict_report['n_workers'], dict_report['n_rows_fp1'], dict_report['n_rows_diff']
+    (3, 2, 7, 5)
+    >>> os.path.exists(sharded_diff.shard_dir)
+    False
+    """
+    def __init__(self, n_shards: int, n_workers: int = 0, tmp_dir: str = ''):
+        """
+        n_workers : worker processes, 0 = cpu_count, never more than n_shards
+        tmp_dir   : where the shards are written to, '' = the temp directory of the system
+        """
+        self.n_shards = max(n_shards, 1)
+        self.n_workers = min(n_workers or os.cpu_count() or 1, self.n_shards)
+        self.tmp_dir = tmp_dir
+        self.shard_dir: str = ''
+        self.n_rows_fp1: int = 0
+        self.n_rows_fp2: int = 0
+        self.n_rows_diff: int = 0
+        self.n_rows_shard_max: int = 0
+        self.dict_phase_seconds = {'partition': 0.0, 'diff': 0.0, 'merge': 0.0}
+        self.worker_busy_seconds: float = 0.0
+        self.peak_rss_worker: int = 0
+
+    def iter_files_diff(self, f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int,
+                        compare_hashes: bool) -> Iterator[lib_data_structures.DataStructFileInfo]:
+        """ the files diff - the same rows in the same order as lib_diff_files.FileDiff.iter_diff_fileinfo_hash_join() """
+        logger.info('diff engine: hash join, {} shards, {} workers'.format(self.n_shards, self.n_workers))
+        yield from self.iter_diff(partition_files, (f_fp_1, snapshot_1), (f_fp_2, snapshot_2), diff_shard=diff_files_shard, args=(compare_hashes, ))
+
+    def iter_registry_diff(self, f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, check_modified: bool = False) -> Iterator[dict]:
+        """
+        the registry diff of two snapshots - the same rows in the same order as lib_fp_store.iter_registry_diff()
+
+        >>> f_fp_store = './testresults/fp_store_reg_diff_sharded.sqlite'
+        >>> if os.path.exists(f_fp_store): os.remove(f_fp_store)
+        >>> with lib_fp_store.FingerPrintStore(f_fp_store) as fp_store:
+        ...     for l_values in (['active', '1', ''], ['ended', '', '2']):
+        ...         snapshot_writer = fp_store.create_snapshot('registry', {})
+        ...         for value_name, value in zip(('trial', 'old', 'new'), l_values):
+        ...             if value:
+        ...                 snapshot_writer.write_registry_row('HKLM\\SOFTWARE\\Test', '2018-11-14 22:49:05', value_name, 'RegSZ', value)
+        ...         snapshot_writer.close()
+        >>> l_diff_store = list(lib_fp_store.iter_registry_diff(f_fp_store, f_fp_store, 1, 2))
+        >>> l_diff_sharded = list(ShardedDiff(n_shards=2, n_workers=2, tmp_dir='./testresults').iter_registry_diff(f_fp_store, f_fp_store, 1, 2))
+        >>> l_diff_sharded == l_diff_store, len(l_diff_sharded)
+        (True, 3)
+        """
+        logger.info('registry diff: {} shards, {} workers'.format(self.n_shards, self.n_workers))
+        yield from self.iter_diff(partition_registry, (f_fp_1, snapshot_1), (f_fp_2, snapshot_2), diff_shard=diff_registry_shard,
+                                  args=(check_modified, ))
+
+    def iter_diff(self, partition_fingerprint: Callable[..., int], args_fp_1: tuple, args_fp_2: tuple,
+                  diff_shard: Callable[..., Tuple[int, float, int]], args: tuple) -> Iterator[Any]:
+        """
+        partition - diff the shards - merge, the partition and the diff run in the worker processes.
+        partition_fingerprint(*args_fp, shard_dir, name, n_shards) partitions one fingerprint and returns the number of rows,
+        the two fingerprints are partitioned in parallel.
+        diff_shard(shard_dir, shard_index, *args) writes the shard files 'changed' and 'deleted'
+        and returns (number of rows of the fp1 shard, cpu seconds, peak rss)
+        """
+        self.shard_dir = tempfile.mkdtemp(prefix='fp_shards_', dir=self.tmp_dir or None)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                time_start = time.perf_counter()
+                future_fp_1 = executor.submit(partition_fingerprint, *args_fp_1, self.shard_dir, 'fp1', self.n_shards)
+                future_fp_2 = executor.submit(partition_fingerprint, *args_fp_2, self.shard_dir, 'fp2', self.n_shards)
+                self.n_rows_fp1, self.n_rows_fp2 = future_fp_1.result(), future_fp_2.result()
+                self.dict_phase_seconds['partition'] = time.perf_counter() - time_start
+
+                time_start = time.perf_counter()
+                l_futures = [executor.submit(diff_shard, self.shard_dir, shard_index, *args) for shard_index in range(self.n_shards)]
+                for future in concurrent.futures.as_completed(l_futures):
+                    n_rows_shard, seconds, peak_rss = future.result()
+                    self.n_rows_shard_max = max(self.n_rows_shard_max, n_rows_shard)
+                    self.worker_busy_seconds += seconds
+                    self.peak_rss_worker = max(self.peak_rss_worker, peak_rss)
+                self.dict_phase_seconds['diff'] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            for name in ('changed', 'deleted'):
+                l_f_shards = [get_shard_filename(self.shard_dir, name, shard_index) for shard_index in range(self.n_shards)]
+                for _, row in heapq.merge(*[lib_external_sort.iter_run(f_shard) for f_shard in l_f_shards], key=operator.itemgetter(0)):
+                    self.n_rows_diff += 1
+                    yield row
+            self.dict_phase_seconds['merge'] = time.perf_counter() - time_start
+            self.log_report(self.get_report())
+        finally:
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+
+    def get_report(self) -> dict:
+        """ merge : the k-way merge of the shard diffs, including writing the diff file """
+        dict_report: Dict[str, Any] = dict()
+        dict_report['n_shards'] = self.n_shards
+        dict_report['n_workers'] = self.n_workers
+        dict_report['n_rows_fp1'] = self.n_rows_fp1
+        dict_report['n_rows_fp2'] = self.n_rows_fp2
+        dict_report['n_rows_diff'] = self.n_rows_diff
+        dict_report['n_rows_shard_max'] = self.n_rows_shard_max
+        dict_report['phase_seconds'] = {phase: round(seconds, 3) for phase, seconds in self.dict_phase_seconds.items()}
+        dict_report['seconds'] = round(sum(self.dict_phase_seconds.values()), 3)
+        # the cpu time of the workers over the wall time of the diff phase - the speedup of the diff phase over one core
+        dict_report['diff_speedup'] = round(self.worker_busy_seconds / max(self.dict_phase_seconds['diff'], 1e-6), 2)
+        dict_report['peak_rss_main'] = lib_helper_functions.get_peak_rss_bytes()
+        dict_report['peak_rss_worker'] = self.peak_rss_worker
+        return dict_report
+
+    @staticmethod
+    def log_report(dict_report: dict):
+        logger.info('sharded diff : {} + {} rows, {} diff rows in {:.1f} seconds, phase seconds : {}'.format(
+            dict_report['n_rows_fp1'], dict_report['n_rows_fp2'], dict_report['n_rows_diff'], dict_report['seconds'],
+            ', '.join('{} {:.1f}'.format(phase, seconds) for phase, seconds in dict_report['phase_seconds'].items())))
+        logger.info('sharded diff : {} shards (max {} rows of fp1), {} workers, diff speedup {:.1f}x, peak rss main {:.0f} MiB, worker {:.0f} MiB'.format(
+            dict_report['n_shards'], dict_report['n_rows_shard_max'], dict_report['n_workers'], dict_report['diff_speedup'],
+            dict_report['peak_rss_main'] / 1048576, dict_report['peak_rss_worker'] / 1048576))
+
+
+class ChunkWriter(object):
+    """ rows as pickled chunks, readable with lib_external_sort.iter_run() """
+    def __init__(self, f_path: str):
+        self.f_out = open(f_path, 'wb')
+        self.l_rows: List[Any] = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, row: Any):
+        self.l_rows.append(row)
+        if len(self.l_rows) >= SHARD_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.l_rows:
+            pickle.dump(self.l_rows, self.f_out, protocol=pickle.HIGHEST_PROTOCOL)
+            self.l_rows = list()
+
+    def close(self):
+        self.flush()
+        self.f_out.close()
+
+
+def partition_files(f_fingerprint: str, snapshot_id: int, shard_dir: str, name: str, n_shards: int) -> int:
+    """ partitions a files fingerprint, run by the workers - the decoder for the raw rows goes next to the shards """
+    dict_decoder: Dict[str, Any] = dict()
+    n_rows = partition(iter_files_raw_rows(f_fingerprint, snapshot_id, dict_decoder), shard_dir, name, n_shards)
+    with open(get_decoder_filename(shard_dir, name), 'wb') as f_out:
+        pickle.dump(dict_decoder, f_out, protocol=pickle.HIGHEST_PROTOCOL)
+    return n_rows
+
+
+def partition_registry(f_fp_store: str, snapshot_id: int, shard_dir: str, name: str, n_shards: int) -> int:
+    """ partitions the registry rows of a snapshot, run by the workers """
+    return partition(iter_registry_raw_rows(f_fp_store, snapshot_id), shard_dir, name, n_shards)
+
+
+def partition(raw_rows: Iterator[Tuple[str, Any]], shard_dir: str, name: str, n_shards: int) -> int:
+    """
+    spreads the (key, raw row) over n_shards shard files as (position, raw row) - returns the number of rows
+
+    >>> shard_dir = tempfile.mkdtemp(dir='./testresults')
+    >>> partition(((row, row) for row in ['a', 'd', 'b', 'a']), shard_dir, 'fp1', 2)
+    4
+    >>> [list(lib_external_sort.iter_run(get_shard_filename(shard_dir, 'fp1', shard_index))) for shard_index in range(2)]
+    [[(1, 'd')], [(0, 'a'), (2, 'b'), (3, 'a')]]
+    >>> shutil.rmtree(shard_dir)
+    """
+    l_chunk_writers = [ChunkWriter(get_shard_filename(shard_dir, name, shard_index)) for shard_index in range(n_shards)]
+    n_rows = 0
+    try:
+        for n_rows, (key, raw_row) in enumerate(raw_rows, start=1):
+            l_chunk_writers[get_shard_index(key, n_shards)].add((n_rows - 1, raw_row))
+    finally:
+        for chunk_writer in l_chunk_writers:
+            chunk_writer.close()
+    return n_rows
+
+
+def get_shard_index(key: str, n_shards: int) -> int:
+    """
+    a stable hash - the hash() of python is salted per process
+
+    >>> get_shard_index('C:\\\\Windows\\\\notepad.exe', 32)
+    3
+    """
+    return zlib.crc32(key.encode('utf-8', 'surrogatepass')) % n_shards
+
+
+def get_shard_filename(shard_dir: str, name: str, shard_index: int) -> str:
+    return os.path.join(shard_dir, '{}_{}.pickle'.format(name, shard_index))
+
+
+def get_decoder_filename(shard_dir: str, name: str) -> str:
+    return os.path.join(shard_dir, '{}_decoder.pickle'.format(name))
+
+
+def iter_files_raw_rows(f_fingerprint: str, snapshot_id: int, dict_decoder: dict) -> Iterator[Tuple[str, Any]]:
+    """
+    (path, raw row) of any fingerprint lib_diff_files.iter_fp_fileinfo() can read - the raw row is the record of a binary fingerprint,
+    the row of a store or the list of the csv reader
+
+    >>> dict_decoder = dict()
+    >>> l_raw_rows = list(iter_files_raw_rows('./testfiles_source/fp_files_result1_difftest.csv', 0, dict_decoder))
+    >>> get_fileinfo_decoder(dict_decoder)(l_raw_rows[0][1]).path == l_raw_rows[0][0] == next(lib_diff_files.iter_fp_fileinfo(
+    ...     './testfiles_source/fp_files_result1_difftest.csv')).path
+    True
+    """
+    if lib_fp_binary.is_binary_fingerprint(f_fingerprint):
+        dict_decoder['fp_format'] = 'binary'
+        dict_decoder['with_link_group'] = lib_fp_binary.has_link_groups(f_fingerprint)
+        dict_decoder['l_dir_paths'] = list()            # filled while reading, complete at the end
+        yield from lib_fp_binary.iter_file_records(f_fingerprint, dict_decoder['l_dir_paths'])
+        return
+    if lib_fp_store.is_fp_store(f_fingerprint):
+        dict_decoder['fp_format'] = 'sqlite'
+        for store_row in lib_fp_store.iter_files_rows(f_fingerprint, snapshot_id):
+            yield store_row[0], store_row
+        return
+    with lib_compression.open_input(f_fingerprint) as csvfile:
+        csv_reader = csv.reader(csvfile, dialect='excel')
+        fieldnames = next(csv_reader, [])
+        dict_decoder['fp_format'] = 'csv'
+        dict_decoder['fieldnames'] = fieldnames
+        index_path = fieldnames.index('path')
+        for row in csv_reader:
+            if row:                                     # csv.DictReader skips empty lines
+                yield row[index_path], row
+
+
+def get_fileinfo_decoder(dict_decoder: dict) -> Callable[[Any], lib_data_structures.DataStructFileInfo]:
+    """ raw row -> fileinfo, see iter_files_raw_rows() """
+    if dict_decoder['fp_format'] == 'binary':
+        l_dir_paths, with_link_group = dict_decoder['l_dir_paths'], dict_decoder['with_link_group']
+
+        def decode_record(record: bytes) -> lib_data_structures.DataStructFileInfo:
+            return lib_fp_binary.get_fileinfo_from_record(record, 0, l_dir_paths, with_link_group)
+        return decode_record
+    if dict_decoder['fp_format'] == 'sqlite':
+        return lib_fp_store.get_fileinfo_from_row
+    fieldnames = dict_decoder['fieldnames']
+
+    def decode_csv_row(row: List[str]) -> lib_data_structures.DataStructFileInfo:
+        return lib_diff_files.FileDiff.get_fileinfo_from_dict(dict(zip(fieldnames, row)))
+    return decode_csv_row
+
+
+def read_fileinfo_decoder(shard_dir: str, name: str) -> Callable[[Any], lib_data_structures.DataStructFileInfo]:
+    with open(get_decoder_filename(shard_dir, name), 'rb') as f_in:
+        return get_fileinfo_decoder(pickle.load(f_in))
+
+
+def iter_registry_raw_rows(f_fp_store: str, snapshot_id: int) -> Iterator[Tuple[str, tuple]]:
+    for row in lib_fp_store.iter_registry_rows(f_fp_store, snapshot_id):
+        yield get_registry_key(row), row
+
+
+def get_registry_key(row: tuple) -> str:
+    """ path and value name of a registry row (lib_fp_store.REGISTRY_COLUMNS) """
+    return row[0] + '\x00' + row[2]
+
+
+def diff_files_shard(shard_dir: str, shard_index: int, compare_hashes: bool) -> Tuple[int, float, int]:
+    """ the hash join of one shard, run by the workers """
+    time_start = time.process_time()
+    file_diff = lib_diff_files.FileDiff()
+    file_diff.compare_hashes = compare_hashes
+    decode_fp_1, decode_fp_2 = read_fileinfo_decoder(shard_dir, 'fp1'), read_fileinfo_decoder(shard_dir, 'fp2')
+    # path -> (position, fileinfo) : like the dict of the hash join, a path seen twice keeps its first position and the last fileinfo
+    dict_fp_1: Dict[str, Tuple[int, lib_data_structures.DataStructFileInfo]] = dict()
+    for position, raw_row in lib_external_sort.iter_run(get_shard_filename(shard_dir, 'fp1', shard_index)):
+        fileinfo_fp_1 = decode_fp_1(raw_row)
+        position_first, _ = dict_fp_1.get(fileinfo_fp_1.path, (position, None))
+        dict_fp_1[fileinfo_fp_1.path] = (position_first, fileinfo_fp_1)
+    n_rows_shard = len(dict_fp_1)
+
+    with ChunkWriter(get_shard_filename(shard_dir, 'changed', shard_index)) as chunk_writer:
+        for position, raw_row in lib_external_sort.iter_run(get_shard_filename(shard_dir, 'fp2', shard_index)):
+            fileinfo_fp_2 = decode_fp_2(raw_row)
+            _, fileinfo_fp_1 = dict_fp_1.pop(fileinfo_fp_2.path, (None, None))
+            fileinfo_fp_diff = file_diff.get_fileinfo_diff(fileinfo_fp_1, fileinfo_fp_2)
+            if fileinfo_fp_diff is not None:
+                chunk_writer.add((position, fileinfo_fp_diff))
+
+    with ChunkWriter(get_shard_filename(shard_dir, 'deleted', shard_index)) as chunk_writer:
+        for position, fileinfo_fp_1 in sorted(dict_fp_1.values(), key=operator.itemgetter(0)):
+            fileinfo_fp_1.change = 'DELETED'
+            chunk_writer.add((position, fileinfo_fp_1))
+    return n_rows_shard, time.process_time() - time_start, lib_helper_functions.get_peak_rss_bytes()
+
+
+def diff_registry_shard(shard_dir: str, shard_index: int, check_modified: bool) -> Tuple[int, float, int]:
+    """ the registry diff of one shard, run by the workers - the semantics of the joins in lib_fp_store.iter_registry_diff() """
+    time_start = time.process_time()
+    l_rows_1 = list(lib_external_sort.iter_run(get_shard_filename(shard_dir, 'fp1', shard_index)))
+    dict_fp_1 = {get_registry_key(row_1): row_1 for _, row_1 in l_rows_1}
+    set_keys_2 = set()
+
+    with ChunkWriter(get_shard_filename(shard_dir, 'changed', shard_index)) as chunk_writer:
+        for position, row_2 in lib_external_sort.iter_run(get_shard_filename(shard_dir, 'fp2', shard_index)):
+            key = get_registry_key(row_2)
+            set_keys_2.add(key)
+            dict_row = lib_fp_store.get_registry_diff_row(dict_fp_1.get(key), row_2, check_modified=check_modified)
+            if dict_row['change']:
+                chunk_writer.add((position, dict_row))
+
+    with ChunkWriter(get_shard_filename(shard_dir, 'deleted', shard_index)) as chunk_writer:
+        for position, row_1 in l_rows_1:
+            if get_registry_key(row_1) not in set_keys_2:
+                chunk_writer.add((position, lib_fp_store.get_registry_deleted_row(row_1)))
+    return len(l_rows_1), time.process_time() - time_start, lib_helper_functions.get_peak_rss_bytes()
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
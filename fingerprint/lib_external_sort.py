@@ -0,0 +1,198 @@
+import heapq
+import lib_doctest_pycharm
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Callable, Iterator, List, Optional
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# sorted fingerprints (--sorted) - external merge sort with bounded memory. the items are collected up to run_size,
+# sorted in memory and spilled as a sorted run (a stream of pickled chunks) to a temporary directory.
+# the runs are merged with heapq.merge, never more than MERGE_FAN_IN runs at once - the merge is stable,
+# items with the same key keep the order in which they were added.
+
+SORT_RUN_SIZE_DEFAULT: int = 1000000    # items kept in memory before a sorted run is spilled
+RUN_CHUNK_SIZE: int = 4096              # items per pickled chunk - the memory per run during the merge
+MERGE_FAN_IN: int = 64                  # runs merged at once, more runs are merged in several passes
+
+SORT_ORDER_FILES: str = 'path'
+SORT_ORDER_REGISTRY: str = 'path,value_name'
+
+
+class ExternalSorter(object):
+    """
+    >>> with ExternalSorter(key=lambda item: item[0], run_size=3) as sorter:
+    ...     for item in [(5, 'a'), (1, 'b'), (4, 'c'), (1, 'd'), (3, 'e'), (2, 'f'), (5, 'g')]:
+    ...         sorter.add(item)
+    ...     sorter.n_runs
+    ...     list(sorter)
+    2
+    [(1, 'b'), (1, 'd'), (2, 'f'), (3, 'e'), (4, 'c'), (5, 'a'), (5, 'g')]
+
+    >>> # more runs than MERGE_FAN_IN
+    >>> import random
+    >>> l_items = [random.randint(0, 1000) for _ in range(1000)]
+    >>> with ExternalSorter(run_size=7) as sorter:
+    ...     for item in l_items:
+    ...         sorter.add(item)
+    ...     list(sorter) == sorted(l_items)
+    True
+    """
+    def __init__(self, key: Callable[[Any], Any] = None, run_size: int = SORT_RUN_SIZE_DEFAULT, tmp_dir: str = ''):
+        """ tmp_dir : where the runs are spilled to, '' = the temp directory of the system """
+        self.key = key
+        self.run_size = max(run_size, 1)
+        self.tmp_dir = tmp_dir
+        self.run_dir: str = ''
+        self.l_items: List[Any] = list()
+        self.l_runs: List[str] = list()
+        self.n_items: int = 0
+        self.n_runs_written: int = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.l_runs)
+
+    def add(self, item: Any):
+        self.l_items.append(item)
+        self.n_items += 1
+        if len(self.l_items) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        self.l_items.sort(key=self.key)
+        self.l_runs.append(self.write_run(self.l_items))
+        self.l_items = list()
+
+    def write_run(self, items) -> str:
+        if not self.run_dir:
+            self.run_dir = tempfile.mkdtemp(prefix='fp_sort_', dir=self.tmp_dir or None)
+        f_run = os.path.join(self.run_dir, 'run_{}.pickle'.format(self.n_runs_written))
+        self.n_runs_written += 1
+        with open(f_run, 'wb') as f_out:
+            chunk = list()
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= RUN_CHUNK_SIZE:
+                    pickle.dump(chunk, f_out, protocol=pickle.HIGHEST_PROTOCOL)
+                    chunk = list()
+            if chunk:
+                pickle.dump(chunk, f_out, protocol=pickle.HIGHEST_PROTOCOL)
+        return f_run
+
+    def __iter__(self) -> Iterator[Any]:
+        """ the items in sorted order - everything fits into memory if no run was spilled """
+        if not self.l_runs:
+            self.l_items.sort(key=self.key)
+            yield from self.l_items
+            return
+        if self.l_items:
+            self.spill()
+        if len(self.l_runs) > MERGE_FAN_IN:
+            logger.info('merging {} sorted runs of {} items'.format(len(self.l_runs), self.n_items))
+        while len(self.l_runs) > MERGE_FAN_IN:
+            l_runs_merged = list()
+            for index in range(0, len(self.l_runs), MERGE_FAN_IN):
+                l_runs_to_merge = self.l_runs[index:index + MERGE_FAN_IN]
+                l_runs_merged.append(self.write_run(heapq.merge(*[iter_run(f_run) for f_run in l_runs_to_merge], key=self.key)))
+                for f_run in l_runs_to_merge:
+                    os.remove(f_run)
+            self.l_runs = l_runs_merged
+        yield from heapq.merge(*[iter_run(f_run) for f_run in self.l_runs], key=self.key)
+
+    def close(self):
+        """ removes the spilled runs """
+        self.l_items = list()
+        self.l_runs = list()
+        if self.run_dir:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+            self.run_dir = ''
+
+
+class SpillFile(object):
+    """
+    keeps the items in the order they were added - in memory up to RUN_CHUNK_SIZE items, the rest is spilled to a temporary file
+
+    >>> with SpillFile() as spill_file:
+    ...     for item in range(10000):
+    ...         spill_file.add(item)
+    ...     list(spill_file) == list(range(10000))
+    True
+    """
+    def __init__(self, tmp_dir: str = ''):
+        self.tmp_dir = tmp_dir
+        self.f_spill: str = ''
+        self.f_out: Optional[BinaryIO] = None
+        self.l_items: List[Any] = list()
+        self.n_items: int = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, item: Any):
+        self.l_items.append(item)
+        self.n_items += 1
+        if len(self.l_items) >= RUN_CHUNK_SIZE:
+            if self.f_out is None:
+                file_descriptor, self.f_spill = tempfile.mkstemp(prefix='fp_spill_', suffix='.pickle', dir=self.tmp_dir or None)
+                self.f_out = os.fdopen(file_descriptor, 'wb')
+            pickle.dump(self.l_items, self.f_out, protocol=pickle.HIGHEST_PROTOCOL)
+            self.l_items = list()
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.f_out is not None:
+            self.f_out.close()
+            self.f_out = None
+        if self.f_spill:
+            yield from iter_run(self.f_spill)
+        yield from self.l_items
+
+    def close(self):
+        if self.f_out is not None:
+            self.f_out.close()
+            self.f_out = None
+        if self.f_spill:
+            os.remove(self.f_spill)
+            self.f_spill = ''
+        self.l_items = list()
+
+
+def iter_run(f_run: str) -> Iterator[Any]:
+    with open(f_run, 'rb') as f_in:
+        while True:
+            try:
+                chunk = pickle.load(f_in)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def get_path_sort_key(path: str) -> str:
+    """
+    the sort key of a fingerprint path : case folded, '/' as separator - and the path itself after a NUL character,
+    so paths which only differ in case still have a fixed order. every tool which reads sorted fingerprints must use this key.
+
+    >>> get_path_sort_key('C:\\\\Windows\\\\notepad.exe')
+    'c:/windows/notepad.exe\\x00C:\\\\Windows\\\\notepad.exe'
+    >>> sorted(['./b/x', './B.txt', './a/y', './a.txt'], key=get_path_sort_key)
+    ['./a.txt', './a/y', './B.txt', './b/x']
+    """
+    return path.replace('\\', '/').casefold() + '\x00' + path
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
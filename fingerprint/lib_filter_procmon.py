@@ -1,4 +1,5 @@
 import csv
+import lib_compression
 from lib_doctest import *
 from lib_helper_functions import *
 import logging
@@ -145,7 +146,7 @@ class ProcmonDiff(object):
         """
         hashed_dict = dict()
         fingerprint_reg_fullpath:str = os.path.join(self.fingerprint_result_dir, fingerprint_csv)
-        with open(fingerprint_reg_fullpath, newline='', encoding='utf-8-sig') as csvfile:
+        with lib_compression.open_input(fingerprint_reg_fullpath) as csvfile:      # compressed fingerprints are detected by the magic bytes
             csv_reader = csv.DictReader(csvfile, dialect='excel')
             for dict_data in csv_reader:
                 if self.is_registry_dict(dict_data):
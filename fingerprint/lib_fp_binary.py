@@ -0,0 +1,326 @@
+import contextlib
+import csv
+import lib_compression
+import lib_data_structures
+import lib_doctest_pycharm
+import lib_fp_metadata
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# binary files fingerprint (fp files --fp_format binary, extension .fpb) - about a third of the csv size,
+# no datetime or hex parsing when reading. all integers are little endian.
+#
+# header, 16 bytes
+#   magic                8 bytes     b'FPFILES\x00'
+#   layout version       uint16      1
+#   flags                uint16      bit 0 : the file records carry a link group (fp files --link_groups)
+#                                    bit 1 : the file records are sorted by path (fp files --sorted, see lib_external_sort)
+#   reserved             uint32      0
+#
+# records, until the end record
+#   length               uint32      length of the record, without this field (type + payload)
+#   type                 uint8       1 = directory, 2 = file, 255 = end
+#   payload              length - 1 bytes
+#
+# directory record (path string table) - defines the next directory index, counting from 0.
+# a directory is written once, before the first file record which refers to it
+#   path                 utf-8       the directory, including the trailing separator
+#
+# file record - the path of the file is the path of the directory + name
+#   dir_index            uint32
+#   size                 uint64
+#   created_ns           int64       epoch nanoseconds (st_ctime_ns)
+#   modified_ns          int64       epoch nanoseconds (st_mtime_ns)
+#   accessed_ns          int64       epoch nanoseconds (st_atime_ns)
+#   digest_length        uint8       0 if the file was not hashed
+#   digest               bytes       the raw digest (the csv has it hex encoded)
+#   name_length          uint16
+#   name                 utf-8
+#   remark_length        uint16
+#   remark               utf-8
+#   link_group_length    uint8       only if flags bit 0 is set
+#   link_group           ascii
+#
+# end record - a fingerprint without end record is incomplete (the run was aborted)
+#   n_files              uint64
+#
+# strings are encoded with errors='surrogateescape', so undecodable posix filenames survive the round trip.
+# the layout only has forward references to directories, so the file can be read sequentially from a mmap.
+
+FP_BINARY_MAGIC = b'FPFILES\x00'
+FP_BINARY_LAYOUT_VERSION: int = 1
+FP_BINARY_FLAG_LINK_GROUP: int = 1
+FP_BINARY_FLAG_SORTED: int = 2
+FP_BINARY_EXTENSION = '.fpb'
+
+RECORD_DIR: int = 1
+RECORD_FILE: int = 2
+RECORD_END: int = 255
+
+HEADER_STRUCT = struct.Struct('<8sHHI')
+RECORD_HEADER_STRUCT = struct.Struct('<IB')
+FILE_STRUCT = struct.Struct('<IQqqqB')
+UINT8_STRUCT = struct.Struct('<B')
+UINT16_STRUCT = struct.Struct('<H')
+UINT64_STRUCT = struct.Struct('<Q')
+
+
+class FingerPrintBinaryWriter(object):
+    """
+    >>> fileinfo = lib_data_structures.DataStructFileInfo()
+    >>> fileinfo.path, fileinfo.size, fileinfo.hash = './testresults/sub/file.txt', 3, 'e3b0c442'
+    >>> fileinfo.set_stat_result(os.stat_result((0, 0, 0, 1, 0, 0, 3, 1, 2, 3, 1.0, 2.0, 3.0, 1000000001, 2000000002, 3000000003)))
+    >>> with open('./testresults/fp_files_binary_test.fpb', 'wb') as f_out:
+    ...     binary_writer = FingerPrintBinaryWriter(f_out, with_link_group=True)
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     binary_writer.close()
+    >>> l_fileinfo = list(iter_fileinfo('./testresults/fp_files_binary_test.fpb'))
+    >>> len(l_fileinfo), len(binary_writer.dict_dir_index)
+    (2, 1)
+    >>> l_fileinfo[0].path, l_fileinfo[0].size, l_fileinfo[0].hash, l_fileinfo[0].modified_ns, l_fileinfo[0].link_group
+    ('./testresults/sub/file.txt', 3, 'e3b0c442', 2000000002, '')
+    >>> l_fileinfo[0].get_data_dict() == fileinfo.get_data_dict()
+    True
+    """
+    def __init__(self, f_out, with_link_group: bool = False, is_sorted: bool = False):
+        self.f_out = f_out
+        self.with_link_group = with_link_group
+        self.dict_dir_index: Dict[str, int] = dict()
+        self.n_files: int = 0
+        flags = FP_BINARY_FLAG_LINK_GROUP if with_link_group else 0
+        if is_sorted:
+            flags |= FP_BINARY_FLAG_SORTED
+        self.f_out.write(HEADER_STRUCT.pack(FP_BINARY_MAGIC, FP_BINARY_LAYOUT_VERSION, flags, 0))
+
+    def write_fileinfo(self, fileinfo: 'lib_data_structures.DataStructFileInfo'):
+        dir_path, name = split_path(fileinfo.path)
+        dir_index = self.dict_dir_index.get(dir_path)
+        if dir_index is None:
+            dir_index = len(self.dict_dir_index)
+            self.dict_dir_index[dir_path] = dir_index
+            self.write_record(RECORD_DIR, encode_str(dir_path))
+
+        digest = bytes.fromhex(fileinfo.hash)
+        l_payload = [FILE_STRUCT.pack(dir_index, fileinfo.size, fileinfo.created_ns, fileinfo.modified_ns, fileinfo.accessed_ns, len(digest)),
+                     digest, pack_str(name, UINT16_STRUCT), pack_str(fileinfo.remark, UINT16_STRUCT)]
+        if self.with_link_group:
+            l_payload.append(pack_str(fileinfo.link_group, UINT8_STRUCT))
+        self.write_record(RECORD_FILE, b''.join(l_payload))
+        self.n_files += 1
+
+    def write_record(self, record_type: int, payload: bytes):
+        self.f_out.write(RECORD_HEADER_STRUCT.pack(len(payload) + 1, record_type))
+        self.f_out.write(payload)
+
+    def close(self):
+        """ writes the end record - the file itself is closed by the caller """
+        self.write_record(RECORD_END, UINT64_STRUCT.pack(self.n_files))
+
+
+def iter_fileinfo(f_fp_binary: str) -> Iterator['lib_data_structures.DataStructFileInfo']:
+    """
+    reads a binary fingerprint from a mmap - the timestamps stay nanoseconds until they are read as datetime.
+    a compressed binary fingerprint can not be mapped, it is decompressed into memory
+    """
+    with open_buffer(f_fp_binary) as buffer:
+        with_link_group = read_header(buffer, f_fp_binary)
+        yield from iter_fileinfo_from_buffer(buffer, HEADER_STRUCT.size, with_link_group, f_fp_binary)
+
+
+@contextlib.contextmanager
+def open_buffer(f_fp_binary: str):
+    """ the binary fingerprint as mmap - a compressed binary fingerprint can not be mapped, it is decompressed into memory """
+    if lib_compression.detect_compression(f_fp_binary):
+        with lib_compression.open_input(f_fp_binary, 'rb') as f_in:
+            buffer = f_in.read()
+        if len(buffer) < HEADER_STRUCT.size:
+            raise ValueError('{} is not a binary fingerprint'.format(f_fp_binary))
+        yield buffer
+        return
+    with open(f_fp_binary, 'rb') as f_in:
+        if os.fstat(f_in.fileno()).st_size < HEADER_STRUCT.size:
+            raise ValueError('{} is not a binary fingerprint'.format(f_fp_binary))
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as fp_mmap:
+            yield fp_mmap
+
+
+def iter_fileinfo_from_buffer(buffer, offset: int, with_link_group: bool, f_fp_binary: str = '') -> Iterator['lib_data_structures.DataStructFileInfo']:
+    l_dir_paths: List[str] = list()
+    for offset_payload, _ in iter_file_record_offsets(buffer, offset, l_dir_paths, f_fp_binary):
+        yield get_fileinfo_from_record(buffer, offset_payload, l_dir_paths, with_link_group)
+
+
+def iter_file_records(f_fp_binary: str, l_dir_paths: list) -> Iterator[Tuple[str, bytes]]:
+    """
+    (path, payload) of the file records, not decoded - get_fileinfo_from_record(payload, 0, l_dir_paths, with_link_group)
+    decodes them. l_dir_paths is filled with the directory string table on the way
+
+    >>> with open('./testresults/fp_files_records_test.fpb', 'wb') as f_out:
+    ...     binary_writer = FingerPrintBinaryWriter(f_out)
+    ...     fileinfo = lib_data_structures.DataStructFileInfo()
+    ...     fileinfo.path, fileinfo.size = './testresults/file.txt', 3
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     binary_writer.close()
+    >>> l_dir_paths = list()
+    >>> l_records = list(iter_file_records('./testresults/fp_files_records_test.fpb', l_dir_paths))
+    >>> l_records[0][0], get_fileinfo_from_record(l_records[0][1], 0, l_dir_paths, False).size
+    ('./testresults/file.txt', 3)
+    """
+    with open_buffer(f_fp_binary) as buffer:
+        read_header(buffer, f_fp_binary)
+        for offset_payload, offset_end in iter_file_record_offsets(buffer, HEADER_STRUCT.size, l_dir_paths, f_fp_binary):
+            dir_index, _, _, _, _, digest_length = FILE_STRUCT.unpack_from(buffer, offset_payload)
+            name, _ = unpack_str(buffer, offset_payload + FILE_STRUCT.size + digest_length, UINT16_STRUCT)
+            yield l_dir_paths[dir_index] + name, buffer[offset_payload:offset_end]
+
+
+def iter_file_record_offsets(buffer, offset: int, l_dir_paths: list, f_fp_binary: str = '') -> Iterator[Tuple[int, int]]:
+    """ (start, end) of the payload of the file records - the directory records are decoded into l_dir_paths """
+    buffer_size = len(buffer)
+    while offset + RECORD_HEADER_STRUCT.size <= buffer_size:
+        record_length, record_type = RECORD_HEADER_STRUCT.unpack_from(buffer, offset)
+        offset_payload = offset + RECORD_HEADER_STRUCT.size
+        offset = offset_payload + record_length - 1
+        if offset > buffer_size:
+            break
+        if record_type == RECORD_FILE:
+            yield offset_payload, offset
+        elif record_type == RECORD_DIR:
+            l_dir_paths.append(decode_str(buffer[offset_payload:offset]))
+        elif record_type == RECORD_END:
+            return
+    logger.warning('the binary fingerprint {} is incomplete, the run which made it was probably aborted'.format(f_fp_binary))
+
+
+def get_fileinfo_from_record(buffer, offset: int, l_dir_paths: list, with_link_group: bool) -> 'lib_data_structures.DataStructFileInfo':
+    dir_index, size, created_ns, modified_ns, accessed_ns, digest_length = FILE_STRUCT.unpack_from(buffer, offset)
+    offset += FILE_STRUCT.size
+    fileinfo = lib_data_structures.DataStructFileInfo()
+    fileinfo.hash = buffer[offset:offset + digest_length].hex()
+    offset += digest_length
+    name, offset = unpack_str(buffer, offset, UINT16_STRUCT)
+    fileinfo.remark, offset = unpack_str(buffer, offset, UINT16_STRUCT)
+    if with_link_group:
+        fileinfo.link_group, offset = unpack_str(buffer, offset, UINT8_STRUCT)
+    fileinfo.path = l_dir_paths[dir_index] + name
+    fileinfo.size = size
+    fileinfo.created_ns = created_ns
+    fileinfo.modified_ns = modified_ns
+    fileinfo.accessed_ns = accessed_ns
+    return fileinfo
+
+
+def read_header(buffer, f_fp_binary: str = '') -> bool:
+    """ checks the header - returns True if the file records carry a link group """
+    return bool(read_header_flags(buffer, f_fp_binary) & FP_BINARY_FLAG_LINK_GROUP)
+
+
+def read_header_flags(buffer, f_fp_binary: str = '') -> int:
+    magic, layout_version, flags, reserved = HEADER_STRUCT.unpack_from(buffer, 0)
+    if magic != FP_BINARY_MAGIC:
+        raise ValueError('{} is not a binary fingerprint'.format(f_fp_binary))
+    if layout_version > FP_BINARY_LAYOUT_VERSION:
+        raise ValueError('{} has the layout version {}, this version of fingerprint can read up to version {}'.format(
+            f_fp_binary, layout_version, FP_BINARY_LAYOUT_VERSION))
+    return flags
+
+
+def is_binary_fingerprint(f_fingerprint: str) -> bool:
+    """
+    >>> is_binary_fingerprint('./testfiles_source/fp_files_result1_difftest.csv')
+    False
+    """
+    with lib_compression.open_input(f_fingerprint, 'rb') as f_in:
+        return f_in.read(len(FP_BINARY_MAGIC)) == FP_BINARY_MAGIC
+
+
+def has_link_groups(f_fp_binary: str) -> bool:
+    with lib_compression.open_input(f_fp_binary, 'rb') as f_in:
+        return read_header(f_in.read(HEADER_STRUCT.size), f_fp_binary)
+
+
+def is_sorted(f_fp_binary: str) -> bool:
+    """ the sorted flag of the header - the file records are sorted with lib_external_sort.get_path_sort_key """
+    with lib_compression.open_input(f_fp_binary, 'rb') as f_in:
+        return bool(read_header_flags(f_in.read(HEADER_STRUCT.size), f_fp_binary) & FP_BINARY_FLAG_SORTED)
+
+
+def export_to_csv(f_fp_binary: str, f_csv: str, compress: str = '') -> int:
+    """
+    converts a binary fingerprint to the csv format of fp files - returns the number of files
+
+    >>> fileinfo = lib_data_structures.DataStructFileInfo()
+    >>> fileinfo.path, fileinfo.size, fileinfo.hash = './testresults/file.txt', 3, 'e3b0c442'
+    >>> with open('./testresults/fp_files_export_test.fpb', 'wb') as f_out:
+    ...     binary_writer = FingerPrintBinaryWriter(f_out)
+    ...     binary_writer.write_fileinfo(fileinfo)
+    ...     binary_writer.close()
+    >>> export_to_csv('./testresults/fp_files_export_test.fpb', './testresults/fp_files_export_test.csv')
+    1
+    >>> open('./testresults/fp_files_export_test.csv').read().splitlines()[0]
+    'path,size,created,modified,accessed,hash,change,remark'
+    """
+    with_link_group = has_link_groups(f_fp_binary)
+    n_files = 0
+    with lib_compression.open_output(f_csv, 'w', compress=compress) as f_out:
+        fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames(with_link_group=with_link_group)
+        csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames, dialect='excel')
+        csv_writer.writeheader()
+        for fileinfo in iter_fileinfo(f_fp_binary):
+            csv_writer.writerow(fileinfo.get_data_dict(with_link_group=with_link_group))
+            n_files += 1
+    return n_files
+
+
+def export_fingerprint(f_fp_binary: str, f_csv: str, compress: str = ''):
+    """ fp export - the metadata sidecar of the binary fingerprint goes along, so the exported csv diffs the same way """
+    n_files = export_to_csv(f_fp_binary, f_csv, compress=compress)
+    dict_metadata = lib_fp_metadata.read_fp_metadata(f_fp_binary)
+    if dict_metadata:
+        dict_metadata['format'] = 'csv'
+        lib_fp_metadata.write_fp_metadata(f_csv, dict_metadata)
+    logger.info('{} files exported from {} to {}'.format(n_files, f_fp_binary, f_csv))
+
+
+def split_path(path: str) -> Tuple[str, str]:
+    """
+    >>> split_path('c:\\\\windows\\\\notepad.exe')
+    ('c:\\\\windows\\\\', 'notepad.exe')
+    >>> split_path('./testfiles/file1.txt')
+    ('./testfiles/', 'file1.txt')
+    >>> split_path('file1.txt')
+    ('', 'file1.txt')
+    """
+    index = max(path.rfind('/'), path.rfind('\\')) + 1
+    return path[:index], path[index:]
+
+
+def encode_str(value: str) -> bytes:
+    return value.encode('utf-8', errors='surrogateescape')
+
+
+def decode_str(value: bytes) -> str:
+    return bytes(value).decode('utf-8', errors='surrogateescape')
+
+
+def pack_str(value: str, length_struct: struct.Struct) -> bytes:
+    encoded = encode_str(value)
+    return length_struct.pack(len(encoded)) + encoded
+
+
+def unpack_str(buffer, offset: int, length_struct: struct.Struct) -> Tuple[str, int]:
+    length = length_struct.unpack_from(buffer, offset)[0]
+    offset += length_struct.size
+    return decode_str(buffer[offset:offset + length]), offset + length
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
@@ -1,14 +1,26 @@
 import concurrent.futures
+import contextlib
 import csv
 from fp_conf import fp_files_conf, fp_conf
-import glob
+import lib_compression
 import lib_data_structures
 import lib_doctest_pycharm
+import lib_external_sort
+import lib_fp_binary
+import lib_fp_metadata
+import lib_fp_store
+import lib_hard_links
 import lib_hash
+import lib_hash_cache
 import lib_helper_functions
+import lib_metrics
+import lib_pipeline
+import lib_walk_files
+import lib_walk_rules
 import logging
 import os
 import time
+from typing import Any, Dict, Iterator, List, Optional
 
 logger = logging.getLogger()
 lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
@@ -48,25 +60,56 @@ class FingerPrintFiles(object):
         >>> fingerprint=FingerPrintFiles()
         >>> fingerprint.create_fp()
 
+        >>> # binary fingerprint, exported to csv
+        >>> fp_files_conf.fp_format = 'binary'
+        >>> fp_conf.f_output='./testresults/fp_files_result2.fpb'
+        >>> fingerprint=FingerPrintFiles()
+        >>> fingerprint.create_fp()
+        >>> fp_files_conf.fp_format = 'csv'
+        >>> lib_fp_binary.export_to_csv('./testresults/fp_files_result2.fpb', './testresults/fp_files_result2_export.csv')
+        5
+        >>> def get_rows(f_csv):
+        ...     with open(f_csv) as f_in:
+        ...         return [(row['path'], row['size'], row['modified'], row['hash']) for row in csv.DictReader(f_in)]
+        >>> get_rows('./testresults/fp_files_result2_export.csv') == get_rows('./testresults/fp_files_result2.csv')
+        True
+
+        >>> # sorted by path, spilled in sorted runs of 2 files
+        >>> fp_files_conf.sorted, fp_files_conf.sort_run_size = True, 2
+        >>> fp_conf.f_output='./testresults/fp_files_result2_sorted.csv'
+        >>> fingerprint=FingerPrintFiles()
+        >>> fingerprint.create_fp()
+        >>> fp_files_conf.sorted, fp_files_conf.sort_run_size = False, 1000000
+        >>> l_paths = [row['path'] for row in csv.DictReader(open('./testresults/fp_files_result2_sorted.csv'))]
+        >>> l_paths == sorted(l_paths, key=lib_external_sort.get_path_sort_key), len(l_paths)
+        (True, 5)
+        >>> lib_fp_metadata.read_fp_metadata(fp_conf.f_output)['sorted']
+        'path'
         """
 
         logger.info(f'create fingerprint for files from {fp_files_conf.fp_dir}, storing results in {fp_conf.f_output}')
 
-        n_files: int = 0
-        file_iterator = get_file_iterator()
-
-        with open(fp_conf.f_output, 'w', encoding='utf-8', newline='') as f_out:
-
-            fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames()
-            csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames, dialect='excel')
-            csv_writer.writeheader()
-
-            for file in file_iterator:
-                fileinfo = get_fileinfo(filename=file, hash_files=fp_files_conf.hash_files)
-                if fileinfo is not None:
-                    n_files += 1
-                    csv_writer.writerow(fileinfo.get_data_dict())
-        logger.info('{} files fingerprinted'.format(n_files))
+        metrics = get_metrics(n_workers=1)
+        walk_rules = get_walk_rules()
+        hard_link_index = get_hard_link_index()
+        file_iterator = get_file_iterator(hard_link_index, walk_rules, metrics)
+
+        with open_fp_output() as f_out, open_hash_cache() as hash_cache:
+            fp_writer = FingerPrintFilesWriter(f_out, hash_cache, hard_link_index, metrics)
+
+            for filename, stat_result in file_iterator:
+                time_start = time.perf_counter()
+                fileinfo = get_fileinfo(filename=filename, hash_files=fp_files_conf.hash_files, stat_result=stat_result,
+                                        hash_cache=hash_cache, hash_algo=fp_files_conf.hash_algo)
+                seconds = time.perf_counter() - time_start
+                metrics.add_worker_busy_seconds(seconds)
+                fp_writer.write_fileinfo(filename, fileinfo, stat_result, seconds)
+            fp_writer.close()
+            close_hash_cache(hash_cache)
+        write_fp_files_metadata()
+        log_walk_rules(walk_rules)
+        finish_metrics(metrics, scheduler='sequential')
+        logger.info('{} files fingerprinted'.format(fp_writer.n_files))
 
     @staticmethod
     def create_fp_mp():
@@ -85,30 +128,250 @@ class FingerPrintFiles(object):
         >>> fingerprint=FingerPrintFiles()
         >>> fingerprint.create_fp_mp()
 
+        >>> fp_files_conf.mp_ordered = True
+        >>> fp_files_conf.mp_batch_size = 2
+        >>> fp_conf.f_output='./testresults/fp_files_result2_mp_ordered.csv'
+        >>> fingerprint=FingerPrintFiles()
+        >>> fingerprint.create_fp_mp()
+        >>> fp_conf.f_output='./testresults/fp_files_result2_ordered.csv'
+        >>> fingerprint=FingerPrintFiles()
+        >>> fingerprint.create_fp()
+        >>> open('./testresults/fp_files_result2_mp_ordered.csv').read() == open('./testresults/fp_files_result2_ordered.csv').read()
+        True
+        >>> fp_files_conf.mp_ordered = False
+        >>> fp_files_conf.mp_batch_size = 256
+
         """
 
         logger.info(f'create fingerprint for files from {fp_files_conf.fp_dir}, storing results in {fp_conf.f_output}')
 
-        n_files: int = 0
-        file_iterator = get_file_iterator()
+        metrics = get_metrics(n_workers=get_mp_max_workers())
+        walk_rules = get_walk_rules()
+        hard_link_index = get_hard_link_index()
+        file_iterator = get_file_iterator(hard_link_index, walk_rules, metrics)
+
+        with open_fp_output() as f_out, open_hash_cache() as hash_cache:
+            fp_writer = FingerPrintFilesWriter(f_out, hash_cache, hard_link_index, metrics)
+
+            with concurrent.futures.ProcessPoolExecutor(max_workers=get_mp_max_workers()) as executor:
+                batches = lib_pipeline.iter_batches(file_iterator, batch_size=fp_files_conf.mp_batch_size)
+                for l_file_records, fileinfo_batch in lib_pipeline.bounded_executor_map(executor, get_fileinfo_batch, batches,
+                                                                                        max_in_flight=get_mp_max_in_flight(),
+                                                                                        ordered=fp_files_conf.mp_ordered,
+                                                                                        queue_depth_callback=metrics.sample_queue_depth,
+                                                                                        **get_fileinfo_batch_kwargs(hash_cache)):
+                    fp_writer.write_fileinfo_batch(l_file_records, fileinfo_batch)
+            fp_writer.close()
+            close_hash_cache(hash_cache)
+        write_fp_files_metadata()
+        log_walk_rules(walk_rules)
+        finish_metrics(metrics, scheduler='multiprocessing')
+        logger.info(f'{fp_writer.n_files} files fingerprinted')
 
-        with open(fp_conf.f_output, 'w', encoding='utf-8', newline='') as f_out:
-            fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames()
-            csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames, dialect='excel')
-            csv_writer.writeheader()
+    @staticmethod
+    def create_fp_tiered():
+        """
+        size tiered scheduling : small files (below fp_files_conf.large_file_threshold) are fingerprinted while we walk,
+        inline or in a thread pool - they are not worth the pickling costs of a process pool.
+        large files are collected during the walk and fingerprinted afterwards, largest first (to cut the tail latency),
+        in a thread pool (hashlib releases the GIL on large buffers) or a process pool.
+        the order of the files in the result is not preserved. the throughput per tier is logged at the end.
+
+        >>> import test
+        >>> timestamp = time.time()
+        >>> test.create_testfiles_fingerprint_1(timestamp)
+        >>> fp_files_conf.fp_dir='./testfiles/'
+        >>> fp_conf.f_output='./testresults/fp_files_result1_tiered.csv'
+        >>> fp_files_conf.large_file_threshold = 1024
+        >>> for fp_files_conf.large_file_pool, fp_files_conf.small_file_workers in (('thread', 0), ('process', 2)):
+        ...     fingerprint=FingerPrintFiles()
+        ...     fingerprint.create_fp_tiered()
+        >>> fp_conf.f_output='./testresults/fp_files_result1.csv'
+        >>> fingerprint=FingerPrintFiles()
+        >>> fingerprint.create_fp()
+        >>> sorted(open('./testresults/fp_files_result1_tiered.csv').readlines()) == sorted(open('./testresults/fp_files_result1.csv').readlines())
+        True
+        >>> fp_files_conf.large_file_threshold = 8388608
+        >>> fp_files_conf.large_file_pool, fp_files_conf.small_file_workers = 'thread', 4
 
-            with concurrent.futures.ProcessPoolExecutor(max_workers=int(os.cpu_count()-1)) as executor:
-                fileinfo_futures = [executor.submit(get_fileinfo, filename=filename, hash_files=fp_files_conf.hash_files) for filename in file_iterator]
-                for fileinfo_future in concurrent.futures.as_completed(fileinfo_futures):
-                    fileinfo = fileinfo_future.result()
-                    if fileinfo is not None:
-                        n_files += 1
-                        csv_writer.writerow(fileinfo.get_data_dict())
-        logger.info(f'{n_files} files fingerprinted')
+        """
 
+        logger.info(f'create fingerprint for files from {fp_files_conf.fp_dir}, storing results in {fp_conf.f_output}')
 
-def get_fileinfo(filename: str, hash_files: bool = True):   # we need to pass hash_files because state of conf.hash_files gets lost in MP
+        large_file_workers = get_large_file_workers()
+        metrics = get_metrics(n_workers=max(fp_files_conf.small_file_workers, 1) + large_file_workers)
+        walk_rules = get_walk_rules()
+        hard_link_index = get_hard_link_index()
+        file_iterator = get_file_iterator(hard_link_index, walk_rules, metrics)
+        tier_small = lib_data_structures.DataStructFileTier('small files')
+        tier_large = lib_data_structures.DataStructFileTier('large files')
+        l_large_file_records: List[lib_walk_files.FileRecord] = list()
+
+        def iter_small_file_records():
+            for file_record in file_iterator:
+                stat_result = file_record[1]
+                if stat_result is not None and stat_result.st_size >= fp_files_conf.large_file_threshold:
+                    l_large_file_records.append(file_record)
+                else:
+                    tier_small.add_file(stat_result)
+                    yield file_record
+
+        with open_fp_output() as f_out, open_hash_cache() as hash_cache:
+            fp_writer = FingerPrintFilesWriter(f_out, hash_cache, hard_link_index, metrics)
+            fileinfo_batch_kwargs = get_fileinfo_batch_kwargs(hash_cache)
+
+            # small files - while walking
+            tier_small.start()
+            small_batches = lib_pipeline.iter_batches(iter_small_file_records(), batch_size=fp_files_conf.mp_batch_size)
+            if fp_files_conf.small_file_workers:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=fp_files_conf.small_file_workers) as executor:
+                    for l_file_records, fileinfo_batch in lib_pipeline.bounded_executor_map(executor, get_fileinfo_batch, small_batches,
+                                                                                            max_in_flight=fp_files_conf.small_file_workers * 2,
+                                                                                            queue_depth_callback=metrics.sample_queue_depth,
+                                                                                            **fileinfo_batch_kwargs):
+                        fp_writer.write_fileinfo_batch(l_file_records, fileinfo_batch)
+            else:
+                for l_file_records in small_batches:
+                    fp_writer.write_fileinfo_batch(l_file_records, get_fileinfo_batch(l_file_records, **fileinfo_batch_kwargs))
+            tier_small.stop()
+
+            # large files - largest first, one file per task
+            tier_large.start()
+            l_large_file_records.sort(key=lambda file_record: file_record[1].st_size, reverse=True)
+            for file_record in l_large_file_records:
+                tier_large.add_file(file_record[1])
+            if fp_files_conf.large_file_pool == 'process':
+                executor_large = concurrent.futures.ProcessPoolExecutor(max_workers=large_file_workers)
+            else:
+                executor_large = concurrent.futures.ThreadPoolExecutor(max_workers=large_file_workers)
+            with executor_large:
+                large_batches = lib_pipeline.iter_batches(l_large_file_records, batch_size=1)
+                for l_file_records, fileinfo_batch in lib_pipeline.bounded_executor_map(executor_large, get_fileinfo_batch, large_batches,
+                                                                                        max_in_flight=large_file_workers * 2,
+                                                                                        queue_depth_callback=metrics.sample_queue_depth,
+                                                                                        **fileinfo_batch_kwargs):
+                    fp_writer.write_fileinfo_batch(l_file_records, fileinfo_batch)
+            tier_large.stop()
+            fp_writer.close()
+            close_hash_cache(hash_cache)
+        write_fp_files_metadata()
+        log_walk_rules(walk_rules)
+        tier_small.log_throughput()
+        tier_large.log_throughput()
+        finish_metrics(metrics, scheduler='tiered')
+        logger.info(f'{fp_writer.n_files} files fingerprinted')
+
+
+class FingerPrintFilesWriter(object):
     """
+    writes the fileinfos to the fingerprint (csv, binary or a snapshot of a fingerprint store), merges the hash cache entries of the workers into the hash cache
+    and writes the hard links which were held back by the hard link index at their position in the walk, as soon as their first link is fingerprinted.
+    fp_files_conf.sorted : the fileinfos are collected by an external sorter and written sorted by path on close()
+    """
+    def __init__(self, f_out, hash_cache: Optional[lib_hash_cache.HashCache] = None,
+                 hard_link_index: Optional['lib_hard_links.HardLinkIndex'] = None, metrics: Optional[lib_metrics.FPMetrics] = None):
+        self.hash_cache = hash_cache
+        self.hard_link_index = hard_link_index
+        self.metrics = metrics
+        self.with_link_group = fp_files_conf.link_groups
+        self.n_files: int = 0
+        self.csv_writer: Optional[csv.DictWriter] = None
+        self.binary_writer: Optional[lib_fp_binary.FingerPrintBinaryWriter] = None
+        self.snapshot_writer: Optional[lib_fp_store.SnapshotWriter] = None
+        self.sorter: Optional[lib_external_sort.ExternalSorter] = None
+        if fp_files_conf.sorted:
+            self.sorter = lib_external_sort.ExternalSorter(key=get_fileinfo_sort_key, run_size=fp_files_conf.sort_run_size,
+                                                           tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+        if fp_files_conf.fp_format == 'binary':
+            self.binary_writer = lib_fp_binary.FingerPrintBinaryWriter(f_out, with_link_group=self.with_link_group, is_sorted=fp_files_conf.sorted)
+        elif fp_files_conf.fp_format == 'sqlite':
+            # f_out is the FingerPrintStore
+            self.snapshot_writer = f_out.create_snapshot('files', get_fp_files_metadata())
+        else:
+            fieldnames = lib_data_structures.DataStructFileInfo().get_data_dict_fieldnames(with_link_group=self.with_link_group)
+            self.csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames, dialect='excel')
+            self.csv_writer.writeheader()
+
+    def write_fileinfo(self, filename: str, fileinfo: Optional['lib_data_structures.DataStructFileInfo'], stat_result: Optional[os.stat_result] = None,
+                       seconds: float = 0.0):
+        """ fileinfo is None for vanished files, seconds : the time it took to fingerprint the file """
+        if self.hard_link_index is not None:
+            self.hard_link_index.release_links_before(filename)
+            self.write_ready_hard_links()
+            self.hard_link_index.resolve(fileinfo, stat_result)
+        self.write_row(fileinfo, seconds, hashed=fp_files_conf.hash_files)
+        self.write_ready_hard_links()
+
+    def write_fileinfo_batch(self, l_file_records: List[lib_walk_files.FileRecord], fileinfo_batch: 'lib_data_structures.DataStructFileInfoBatch'):
+        """ writes the result of one task and merges its hash cache entries - fileinfo_batch.l_fileinfo is aligned with l_file_records """
+        if self.hash_cache is not None:
+            self.hash_cache.add_pending(fileinfo_batch.l_hash_cache_entries)
+            self.hash_cache.n_hits += fileinfo_batch.n_hash_cache_hits
+            self.hash_cache.n_misses += fileinfo_batch.n_hash_cache_misses
+        if self.metrics is not None:
+            self.metrics.add_worker_busy_seconds(fileinfo_batch.seconds)
+        for (filename, stat_result), fileinfo, seconds in zip(l_file_records, fileinfo_batch.l_fileinfo, fileinfo_batch.l_seconds):
+            self.write_fileinfo(filename, fileinfo, stat_result, seconds)
+
+    def write_row(self, fileinfo: Optional['lib_data_structures.DataStructFileInfo'], seconds: float = 0.0, hashed: bool = False):
+        if fileinfo is None:
+            return
+        self.n_files += 1
+        time_start = time.perf_counter()
+        if self.sorter is not None:
+            self.sorter.add(fileinfo)
+        else:
+            self.write_output_row(fileinfo)
+        if self.metrics is not None:
+            self.metrics.add_phase_seconds('write', time.perf_counter() - time_start)
+            self.metrics.add_file(fileinfo.path, fileinfo.size, seconds, hashed=hashed)
+
+    def write_output_row(self, fileinfo: 'lib_data_structures.DataStructFileInfo'):
+        if self.binary_writer is not None:
+            self.binary_writer.write_fileinfo(fileinfo)
+        elif self.snapshot_writer is not None:
+            self.snapshot_writer.write_fileinfo(fileinfo)
+        else:
+            self.csv_writer.writerow(fileinfo.get_data_dict(with_link_group=self.with_link_group))
+
+    def write_sorted_rows(self):
+        """ merges the sorted runs into the fingerprint """
+        if self.sorter is None:
+            return
+        time_start = time.perf_counter()
+        for fileinfo in self.sorter:
+            self.write_output_row(fileinfo)
+        self.sorter.close()
+        if self.metrics is not None:
+            self.metrics.add_phase_seconds('sort', time.perf_counter() - time_start)
+
+    def write_ready_hard_links(self):
+        if self.hard_link_index is not None:
+            for fileinfo in self.hard_link_index.pop_ready():
+                self.write_row(fileinfo)
+
+    def close(self):
+        """ writes the remaining hard links - the links found after the last fingerprinted file """
+        if self.hard_link_index is not None:
+            self.hard_link_index.release_remaining_links()
+        self.write_ready_hard_links()
+        self.write_sorted_rows()
+        if self.binary_writer is not None:
+            self.binary_writer.close()
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.close()
+        if self.hard_link_index is not None:
+            self.hard_link_index.log_statistics()
+
+
+def get_fileinfo(filename: str, hash_files: bool = True, stat_result: os.stat_result = None,
+                 hash_cache: lib_hash_cache.HashCache = None,
+                 hash_algo: str = lib_hash.HASH_ALGORITHM_DEFAULT):   # we need to pass hash_files, hash_algo because state of conf gets lost in MP
+    """
+    stat_result: the stat result from the directory walk - if None, the file is stat'ed here
+    hash_cache: if given, the cache is consulted before the file is opened for hashing
+    hash_algo: one of lib_hash.HASH_ALGORITHMS
+
     >>> import test
     >>> timestamp = time.time()
     >>> test.create_testfiles_fingerprint_1(timestamp)
@@ -122,6 +385,20 @@ def get_fileinfo(filename: str, hash_files: bool = True):   # we need to pass ha
     'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
     >>> fileinfo.remark
     ''
+    >>> fileinfo_from_stat = get_fileinfo('./testfiles/file1_no_changes.txt', stat_result=os.stat('./testfiles/file1_no_changes.txt'))
+    >>> fileinfo_from_stat.get_data_dict() == fileinfo.get_data_dict()
+    True
+    >>> get_fileinfo('./testfiles/file1_no_changes.txt', hash_algo='blake2s').hash
+    '69217a3079908094e11121d042354a7c1f55b6482ca1a51e1b250dfd1ed0eef9'
+    >>> if os.path.exists('./testresults/fp_hash_cache_fileinfo.sqlite'): os.remove('./testresults/fp_hash_cache_fileinfo.sqlite')
+    >>> with lib_hash_cache.HashCache('./testresults/fp_hash_cache_fileinfo.sqlite') as hash_cache:
+    ...     get_fileinfo('./testfiles/file1_no_changes.txt', hash_cache=hash_cache).hash == fileinfo.hash
+    ...     hash_cache.flush()
+    ...     get_fileinfo('./testfiles/file1_no_changes.txt', hash_cache=hash_cache).hash == fileinfo.hash
+    ...     hash_cache.n_hits, hash_cache.n_misses
+    True
+    True
+    (1, 1)
     >>> fileinfo = get_fileinfo('./testfiles/does-not-exist.txt') # doctest: +ELLIPSIS, +NORMALIZE_WHITESPACE
     >>> fileinfo is None
     True
@@ -131,33 +408,302 @@ def get_fileinfo(filename: str, hash_files: bool = True):   # we need to pass ha
     'access denied'
     """
 
-    dict_attribute_functions = {'accessed_float': os.path.getatime, 'modified_float': os.path.getmtime,
-                                'created_float': os.path.getctime, 'size': os.path.getsize, 'hash': lib_hash.get_file_hash_preserve_access_dates}
-
     fileinfo = lib_data_structures.DataStructFileInfo()
     fileinfo.path = filename
 
-    for attribute,file_property_function in dict_attribute_functions.items():
+    try:
+        if stat_result is None:
+            stat_result = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        fileinfo.remark = 'access denied'
+        return fileinfo
+
+    fileinfo.set_stat_result(stat_result)
+
+    if hash_files:
         try:
-            if attribute != 'hash':
-                setattr(fileinfo,attribute, file_property_function(filename))
-            elif hash_files:
-                setattr(fileinfo, attribute, file_property_function(filename))
+            fileinfo.hash = get_file_hash_cached(filename=filename, stat_result=stat_result, hash_cache=hash_cache, hash_algo=hash_algo)
         except FileNotFoundError:
-            fileinfo = None
-            break
+            return None
         except OSError:
             fileinfo.remark = 'access denied'
     return fileinfo
 
 
-def get_file_iterator():
-    glob_filter = fp_files_conf.fp_dir + '**'
-    file_iter = glob.iglob(glob_filter, recursive=True)
+def get_file_hash_cached(filename: str, stat_result: os.stat_result, hash_cache: lib_hash_cache.HashCache = None,
+                         hash_algo: str = lib_hash.HASH_ALGORITHM_DEFAULT) -> str:
+    if hash_cache is None or not lib_hash_cache.is_stat_result_cacheable(stat_result):
+        return lib_hash.get_file_hash_preserve_access_dates(filename, stat_result=stat_result, hash_algo=hash_algo)
+    digest = hash_cache.lookup(stat_result)
+    if digest is None:
+        digest = lib_hash.get_file_hash_preserve_access_dates(filename, stat_result=stat_result, hash_algo=hash_algo)
+        if os.name != 'nt':
+            # on posix restoring the access dates updates st_ctime - the cache key must have the new st_ctime,
+            # and if the file was modified while we hashed it, it is not cached at all
+            stat_result_after = os.stat(filename)
+            if (stat_result_after.st_size, stat_result_after.st_mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns):
+                return digest
+            stat_result = stat_result_after
+        hash_cache.store(stat_result, digest)
+    return digest
+
+
+def get_fileinfo_batch(l_file_records: List[lib_walk_files.FileRecord], hash_files: bool = True,
+                       hash_cache_path: str = '', rehash: bool = False,
+                       hash_algo: str = lib_hash.HASH_ALGORITHM_DEFAULT) -> 'lib_data_structures.DataStructFileInfoBatch':
+    """
+    one multiprocessing task - fingerprints a batch of files to amortize the IPC costs.
+    fileinfo_batch.l_fileinfo is aligned with l_file_records, vanished files are None.
+    the hash cache is opened read only in the worker, the new cache entries are handed back to the main process.
+
+    >>> import test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> l_file_records = [('./testfiles/file1_no_changes.txt', None), ('./testfiles/does-not-exist.txt', None)]
+    >>> fileinfo_batch = get_fileinfo_batch(l_file_records)
+    >>> fileinfo_batch.l_fileinfo[0].path, fileinfo_batch.l_fileinfo[1]
+    ('./testfiles/file1_no_changes.txt', None)
+    """
+    fileinfo_batch = lib_data_structures.DataStructFileInfoBatch()
+    hash_cache = None
+    if hash_files and hash_cache_path:
+        hash_cache = lib_hash_cache.get_process_hash_cache(db_path=hash_cache_path, rehash=rehash, hash_algo=hash_algo)
+        n_hits, n_misses = hash_cache.n_hits, hash_cache.n_misses
+
+    time_start_batch = time.perf_counter()
+    for filename, stat_result in l_file_records:
+        time_start = time.perf_counter()
+        fileinfo_batch.l_fileinfo.append(get_fileinfo(filename=filename, hash_files=hash_files, stat_result=stat_result,
+                                                      hash_cache=hash_cache, hash_algo=hash_algo))
+        fileinfo_batch.l_seconds.append(time.perf_counter() - time_start)
+    fileinfo_batch.seconds = time.perf_counter() - time_start_batch
+
+    if hash_cache is not None:
+        fileinfo_batch.l_hash_cache_entries = hash_cache.pop_pending()
+        fileinfo_batch.n_hash_cache_hits = hash_cache.n_hits - n_hits
+        fileinfo_batch.n_hash_cache_misses = hash_cache.n_misses - n_misses
+    return fileinfo_batch
+
+
+def open_hash_cache():
+    """
+    returns the hash cache as context manager - or a context manager returning None if the hash cache is not used
+
+    >>> fp_files_conf.hash_cache_path = ''
+    >>> with open_hash_cache() as hash_cache:
+    ...     hash_cache is None
+    True
+    """
+    if not (fp_files_conf.hash_files and fp_files_conf.hash_cache_path):
+        return contextlib.nullcontext()
+    hash_cache_path = get_hash_cache_path()
+    logger.info('using hash cache {}'.format(hash_cache_path))
+    return lib_hash_cache.HashCache(db_path=hash_cache_path, rehash=fp_files_conf.rehash, hash_algo=fp_files_conf.hash_algo)
+
+
+def close_hash_cache(hash_cache: Optional[lib_hash_cache.HashCache]):
+    if hash_cache is None:
+        return
+    hash_cache.flush()
+    n_evicted = hash_cache.evict(max_entries=fp_files_conf.hash_cache_max_entries)
+    logger.info('hash cache: {} hits, {} misses, {} entries evicted'.format(hash_cache.n_hits, hash_cache.n_misses, n_evicted))
+
+
+def write_fp_files_metadata():
+    """
+    the metadata sidecar - a fingerprint store keeps the metadata with each snapshot instead
+
+    >>> fp_conf.f_output = './testresults/fp_files_result1.csv'
+    >>> fp_files_conf.hash_algo = 'blake2b'
+    >>> write_fp_files_metadata()
+    >>> lib_fp_metadata.read_fp_metadata(fp_conf.f_output)['hash_algo']
+    'blake2b'
+    >>> fp_files_conf.hash_algo = 'sha256'
+    """
+    if fp_files_conf.fp_format == 'sqlite':
+        return
+    lib_fp_metadata.write_fp_metadata(fp_conf.f_output, get_fp_files_metadata())
+
+
+def get_fp_files_metadata() -> dict:
+    dict_metadata = dict()
+    dict_metadata['fingerprint_type'] = 'files'
+    dict_metadata['version'] = fp_conf.version
+    dict_metadata['fp_dir'] = fp_files_conf.fp_dir
+    dict_metadata['hash_algo'] = fp_files_conf.hash_algo if fp_files_conf.hash_files else ''
+    dict_metadata['format'] = fp_files_conf.fp_format
+    dict_metadata['sorted'] = lib_external_sort.SORT_ORDER_FILES if fp_files_conf.sorted else ''
+    return dict_metadata
+
+
+def get_fileinfo_sort_key(fileinfo: 'lib_data_structures.DataStructFileInfo') -> str:
+    return lib_external_sort.get_path_sort_key(fileinfo.path)
+
+
+def get_fp_output_extension() -> str:
+    """
+    >>> get_fp_output_extension()
+    '.csv'
+    """
+    if fp_files_conf.fp_format == 'binary':
+        return lib_fp_binary.FP_BINARY_EXTENSION
+    if fp_files_conf.fp_format == 'sqlite':
+        return lib_fp_store.FP_STORE_EXTENSION
+    return '.csv'
+
+
+def open_fp_output():
+    """
+    the csv fingerprint is a text file, the binary fingerprint is written through a buffered binary file,
+    both optionally compressed (fp_conf.compress). the fingerprint store gets a new snapshot
+    """
+    if fp_files_conf.fp_format == 'sqlite':
+        return lib_fp_store.FingerPrintStore(fp_conf.f_output)
+    if fp_files_conf.fp_format == 'binary':
+        return lib_compression.open_output(fp_conf.f_output, 'wb', compress=fp_conf.compress)
+    return lib_compression.open_output(fp_conf.f_output, 'w', compress=fp_conf.compress)
+
+
+def get_hash_cache_path() -> str:
+    """
+    'auto' : the hash cache is stored next to the output file, shared by all fingerprints written to that directory
+
+    >>> fp_conf.f_output = './testresults/fp_files_result1.csv'
+    >>> fp_files_conf.hash_cache_path = 'auto'
+    >>> get_hash_cache_path()
+    './testresults/fp_hash_cache.sqlite'
+    >>> fp_files_conf.hash_cache_path = './testresults/my_cache.sqlite'
+    >>> get_hash_cache_path()
+    './testresults/my_cache.sqlite'
+    >>> fp_files_conf.hash_cache_path = ''
+    """
+    if fp_files_conf.hash_cache_path == 'auto':
+        return lib_helper_functions.convert_path_to_posix(os.path.join(os.path.dirname(fp_conf.f_output), 'fp_hash_cache.sqlite'))
+    return fp_files_conf.hash_cache_path
+
+
+def get_fileinfo_batch_kwargs(hash_cache: Optional[lib_hash_cache.HashCache]) -> dict:
+    """ the keyword arguments for get_fileinfo_batch - the workers do not see the state of the conf """
+    fileinfo_batch_kwargs: Dict[str, Any] = dict()
+    fileinfo_batch_kwargs['hash_files'] = fp_files_conf.hash_files
+    fileinfo_batch_kwargs['hash_cache_path'] = hash_cache.db_path if hash_cache is not None else ''
+    fileinfo_batch_kwargs['rehash'] = fp_files_conf.rehash
+    fileinfo_batch_kwargs['hash_algo'] = fp_files_conf.hash_algo
+    return fileinfo_batch_kwargs
+
+
+def get_large_file_workers() -> int:
+    if fp_files_conf.large_file_workers:
+        return fp_files_conf.large_file_workers
+    return max(1, int(os.cpu_count()))
+
+
+def get_mp_max_workers() -> int:
+    max_workers = max(1, int(os.cpu_count() - 1))
+    return max_workers
+
+
+def get_mp_max_in_flight() -> int:
+    """
+    the number of batches submitted but not yet written - enough to keep all workers busy while the reorder buffer waits for a slow batch
+
+    >>> get_mp_max_in_flight() >= get_mp_max_workers()
+    True
+    """
+    if fp_files_conf.mp_max_in_flight:
+        return fp_files_conf.mp_max_in_flight
+    return get_mp_max_workers() * 4
+
+
+def get_file_iterator(hard_link_index: Optional['lib_hard_links.HardLinkIndex'] = None,
+                      walk_rules: Optional[lib_walk_rules.WalkRules] = None,
+                      metrics: Optional[lib_metrics.FPMetrics] = None) -> Iterator[lib_walk_files.FileRecord]:
+    # the hash cache and the hard link index need device and inode numbers - windows does not deliver them with the directory listing
+    full_stat = bool(fp_files_conf.hash_files and fp_files_conf.hash_cache_path) or hard_link_index is not None
+    file_iter = lib_walk_files.iter_file_records(fp_files_conf.fp_dir, full_stat=full_stat, walk_rules=walk_rules, metrics=metrics)
+    if hard_link_index is not None:
+        file_iter = hard_link_index.filter_file_records(file_iter)
     return file_iter
 
 
+def get_metrics(n_workers: int) -> lib_metrics.FPMetrics:
+    return lib_metrics.FPMetrics(n_workers=n_workers, progress_interval=fp_files_conf.progress_interval)
+
+
+def finish_metrics(metrics: lib_metrics.FPMetrics, scheduler: str):
+    """
+    logs the metrics report and writes it to fp_files_conf.metrics_out
+
+    >>> fp_files_conf.metrics_out = './testresults/fp_files_metrics_finish.json'
+    >>> logger.level = logging.ERROR
+    >>> finish_metrics(lib_metrics.FPMetrics(), scheduler='sequential')
+    >>> import json
+    >>> json.load(open(fp_files_conf.metrics_out))['scheduler']
+    'sequential'
+    >>> fp_files_conf.metrics_out = ''
+    """
+    metrics.stop()
+    dict_report = metrics.get_report()
+    dict_report['version'] = fp_conf.version
+    dict_report['fp_dir'] = fp_files_conf.fp_dir
+    dict_report['f_output'] = fp_conf.f_output
+    dict_report['scheduler'] = scheduler
+    dict_report['hash_algo'] = fp_files_conf.hash_algo if fp_files_conf.hash_files else ''
+    metrics.log_report(dict_report)
+    if fp_files_conf.metrics_out:
+        lib_metrics.write_metrics_report(fp_files_conf.metrics_out, dict_report)
+
+
+def get_walk_rules() -> Optional[lib_walk_rules.WalkRules]:
+    """
+    the rules from the commandline and the rules file, compiled once - returns None if there are no rules
+
+    >>> get_walk_rules() is None
+    True
+    >>> fp_files_conf.exclude = ['.git']
+    >>> get_walk_rules().is_dir_excluded('project/.git')
+    True
+    >>> fp_files_conf.exclude = []
+    """
+    l_exclude = list(fp_files_conf.exclude)
+    l_include = list(fp_files_conf.include)
+    if fp_files_conf.rules_file:
+        l_exclude_from_file, l_include_from_file = lib_walk_rules.read_rules_file(fp_files_conf.rules_file)
+        l_exclude.extend(l_exclude_from_file)
+        l_include.extend(l_include_from_file)
+    if not (l_exclude or l_include):
+        return None
+    return lib_walk_rules.WalkRules(l_exclude=l_exclude, l_include=l_include)
+
+
+def log_walk_rules(walk_rules: Optional[lib_walk_rules.WalkRules]):
+    if walk_rules is not None:
+        walk_rules.log_statistics()
+
+
+def get_hard_link_index() -> Optional['lib_hard_links.HardLinkIndex']:
+    """
+    returns None if hard links are not deduplicated - link_groups implies dedup_hard_links, also without hashing
+
+    >>> get_hard_link_index() is None
+    True
+    >>> fp_files_conf.link_groups = True
+    >>> get_hard_link_index() is None
+    False
+    >>> fp_files_conf.link_groups = False
+    """
+    if not (fp_files_conf.link_groups or (fp_files_conf.dedup_hard_links and fp_files_conf.hash_files)):
+        return None
+    return lib_hard_links.HardLinkIndex(hash_files=fp_files_conf.hash_files, hash_algo=fp_files_conf.hash_algo)
+
+
 def check_f_output_permission():
+    if fp_files_conf.fp_format == 'sqlite' and os.path.exists(fp_conf.f_output):
+        # an existing fingerprint store keeps its snapshots
+        lib_fp_store.FingerPrintStore(fp_conf.f_output).close()
+        return
     lib_helper_functions.create_path_and_check_permission(fp_conf.f_output)
     os.remove(fp_conf.f_output)
 
@@ -0,0 +1,59 @@
+import json
+import lib_doctest_pycharm
+import lib_helper_functions
+import logging
+import os
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# the csv fingerprints stay plain excel csv files - everything we need to know about how a fingerprint was made
+# (hash algorithm, ...) goes into a small json sidecar file next to it
+
+
+def get_fp_metadata_filename(f_fingerprint: str) -> str:
+    """
+    the sidecar keeps the full name of the fingerprint, so fp1.csv, fp1.csv.gz, fp1.fpb and fp1.sqlite get their own metadata
+
+    >>> get_fp_metadata_filename('./testresults/fp_files_result1.csv')
+    './testresults/fp_files_result1.csv.meta.json'
+    >>> get_fp_metadata_filename('./testresults/fp_files_result1.csv.gz')
+    './testresults/fp_files_result1.csv.gz.meta.json'
+    >>> get_fp_metadata_filename('./testresults/fp_files_result1.fpb')
+    './testresults/fp_files_result1.fpb.meta.json'
+    """
+    f_metadata = f_fingerprint + '.meta.json'
+    return f_metadata
+
+
+def write_fp_metadata(f_fingerprint: str, dict_metadata: dict):
+    """
+    >>> write_fp_metadata('./testresults/fp_files_metadata_test.csv', {'hash_algo': 'blake2b'})
+    >>> read_fp_metadata('./testresults/fp_files_metadata_test.csv')
+    {'hash_algo': 'blake2b'}
+    """
+    with open(get_fp_metadata_filename(f_fingerprint), 'w', encoding='utf-8') as f_metadata:
+        json.dump(dict_metadata, f_metadata, indent=4, sort_keys=True)
+
+
+def read_fp_metadata(f_fingerprint: str) -> dict:
+    """
+    returns an empty dict for fingerprints without metadata (made by older versions)
+
+    >>> read_fp_metadata('./testresults/does_not_exist.csv')
+    {}
+    """
+    f_metadata = get_fp_metadata_filename(f_fingerprint)
+    if not os.path.isfile(f_metadata):
+        return dict()
+    try:
+        with open(f_metadata, 'r', encoding='utf-8') as f_metadata_file:
+            return json.load(f_metadata_file)
+    except (OSError, ValueError):
+        lib_helper_functions.log_exception_traceback(s_error='can not read the fingerprint metadata {}'.format(f_metadata))
+        return dict()
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
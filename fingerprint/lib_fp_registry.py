@@ -1,22 +1,37 @@
 import csv
 from fp_conf import fp_conf, fp_reg_conf
+import lib_compression
 import lib_data_structures
 import lib_doctest_pycharm
-import lib_detect_encoding
-import lib_helper_functions
+import lib_external_sort
+import lib_fp_metadata
+import lib_fp_registry_baseline
+import lib_fp_registry_parallel
+import lib_fp_store
+import lib_reg_decode
+import lib_regf
 import lib_registry
 import lib_runcommand
 import logging
 import os
 from Registry import Registry
+import shutil
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 logger = logging.getLogger()
 lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
 
+MAX_KEY_DEPTH: int = 512                # windows nests registry keys at most 512 levels deep - deeper keys can only come from a cycle in a damaged hive
+REGISTRY_CSV_FIELDNAMES: List[str] = ['path', 'modified', 'value_name', 'value_type', 'value', 'change', 'remark']
+
 class FingerPrintRegistry(object):
     def __init__(self):
-        pass
+        # decodes the values the registry backend can not decode, counts them for the log
+        self.value_decoder = lib_reg_decode.ValueDecoder()
+        # the keys of the previous fingerprint, see lib_fp_registry_baseline
+        self.registry_baseline: Optional[lib_fp_registry_baseline.RegistryBaseline] = None
 
     def __enter__(self):
         """
@@ -37,125 +52,324 @@ class FingerPrintRegistry(object):
         """
         logger.info('create registry fingerprint')
         registry_files_copied:[lib_data_structures.DataStructRegistryFileInfo] = self.copy_registry_files_and_return_copied()
-        l_registry_entries: [lib_data_structures.DataStructRegistryEntry] = self.parse_all_hives(registry_files_copied)
-        if fp_reg_conf.delete_hive_copies:
-            self.delete_hive_copies(registry_files_copied)
-        self.write_registry_entries_to_csv(l_registry_entries)
+        baseline_dir = self.open_registry_baseline() if fp_reg_conf.baseline else ''
+        try:
+            # the hives are parsed while the fingerprint is written - one key at a time, not all hives in memory
+            if fp_reg_conf.hive_workers != 1 and (len(registry_files_copied) > 1 or fp_reg_conf.split_depth):
+                # the hives or their subtrees in worker processes
+                lib_fp_registry_parallel.write_hives_parallel(registry_files_copied, n_workers=fp_reg_conf.hive_workers,
+                                                              split_depth=fp_reg_conf.split_depth, baseline_dir=baseline_dir)
+                return
+            registry_entries: Iterator[lib_data_structures.DataStructRegistryEntry] = self.parse_all_hives(registry_files_copied)
+            if fp_reg_conf.fp_format == 'sqlite':
+                self.write_registry_entries_to_store(registry_entries)
+            else:
+                self.write_registry_entries_to_csv(registry_entries)
+        finally:
+            if fp_reg_conf.delete_hive_copies:
+                self.delete_hive_copies(registry_files_copied)
+            if baseline_dir:
+                self.close_registry_baseline(baseline_dir)
+
+    def open_registry_baseline(self) -> str:
+        """
+        reads the baseline fp_reg_conf.baseline into a temporary directory next to the fingerprint, returns that directory
 
-    @staticmethod
-    def write_registry_entries_to_csv(l_registry_entries:[lib_data_structures.DataStructRegistryEntry]):
+        >>> fingerprint_registry = FingerPrintRegistry()
+        >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+        >>> registry_file_info.hive_name, registry_file_info.filename = 'HKLM\\\\SAM', './testfiles_source/test_registry_hklm_sam.hive'
+        >>> def read_bytes(f_path):
+        ...     with open(f_path, 'rb') as f_in:
+        ...         return f_in.read()
+        >>> fp_conf.f_output = './testresults/test_reg_baseline_1.csv'
+        >>> fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_hive(registry_file_info))
+
+        >>> # the keys are reused from the baseline, every third one is read from the hive and compared - the same fingerprint
+        >>> fp_reg_conf.baseline, fp_reg_conf.baseline_verify = './testresults/test_reg_baseline_1.csv', 3
+        >>> for reg_backend in ('python-registry', 'mmap'):
+        ...     fingerprint_registry = FingerPrintRegistry()
+        ...     baseline_dir = fingerprint_registry.open_registry_baseline()
+        ...     fp_conf.f_output = './testresults/test_reg_baseline_2.csv'
+        ...     fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_hive(registry_file_info, reg_backend=reg_backend))
+        ...     baseline_stats = fingerprint_registry.registry_baseline.baseline_stats
+        ...     fingerprint_registry.close_registry_baseline(baseline_dir)
+        ...     read_bytes('./testresults/test_reg_baseline_2.csv') == read_bytes('./testresults/test_reg_baseline_1.csv')
+        ...     baseline_stats.n_reused, baseline_stats.n_verified, baseline_stats.l_mismatches, os.path.exists(baseline_dir)
+        True
+        (55, 27, [], False)
+        True
+        (55, 27, [], False)
+        >>> fp_reg_conf.baseline, fp_reg_conf.baseline_verify = '', 0
+        """
+        baseline_dir = tempfile.mkdtemp(prefix='fp_reg_baseline_', dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+        lib_fp_registry_baseline.create_baseline(fp_reg_conf.baseline, baseline_dir)
+        self.registry_baseline = lib_fp_registry_baseline.RegistryBaseline(baseline_dir, verify_every=fp_reg_conf.baseline_verify)
+        return baseline_dir
+
+    def close_registry_baseline(self, baseline_dir: str):
+        self.registry_baseline.close()
+        self.registry_baseline = None
+        shutil.rmtree(baseline_dir, ignore_errors=True)
+
+    def write_registry_entries_to_csv(self, l_registry_entries:[lib_data_structures.DataStructRegistryEntry]):
         """
         >>> fingerprint_registry = FingerPrintRegistry()
         >>> fp_conf.f_output = './testfiles/test_reg.csv'
         >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
         >>> registry_file_info.hive_name = 'HKLM\SAM'
         >>> registry_file_info.filename = './testfiles_source/test_registry_hklm_sam.hive'
-        >>> l_registry_entries = fingerprint_registry.parse_hive(registry_file_info=registry_file_info)  # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+        >>> l_registry_entries = list(fingerprint_registry.parse_hive(registry_file_info=registry_file_info))
+        >>> fingerprint_registry.write_registry_entries_to_csv(l_registry_entries=l_registry_entries)
+
+        >>> # sorted by path and value name, spilled in sorted runs of 100 rows
+        >>> fp_reg_conf.sorted, fp_reg_conf.sort_run_size = True, 100
+        >>> fp_conf.f_output = './testfiles/test_reg_sorted.csv'
         >>> fingerprint_registry.write_registry_entries_to_csv(l_registry_entries=l_registry_entries)
+        >>> fp_reg_conf.sorted, fp_reg_conf.sort_run_size = False, 1000000
+        >>> l_rows = [row for row in csv.DictReader(open('./testfiles/test_reg_sorted.csv', encoding='utf-8'))]
+        >>> l_rows == sorted(l_rows, key=get_registry_row_sort_key)
+        True
+        >>> len(l_rows) == len(list(csv.DictReader(open('./testfiles/test_reg.csv', encoding='utf-8'))))
+        True
+        >>> lib_fp_metadata.read_fp_metadata(fp_conf.f_output)['sorted']
+        'path,value_name'
         """
 
-        n_keys:int = 0
-        longest_key:str = ''
-        longest_value_name:str = ''
-        maximum_field_length:int = 0
+        registry_stats = RegistryStats()
         logger.info('writing registry fingerprint to {}'.format(fp_conf.f_output))
-        with open(fp_conf.f_output, 'w', encoding='utf-8',newline='') as f_out:
-            fieldnames = ['path', 'modified', 'value_name', 'value_type', 'value', 'change', 'remark']
-            csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames, dialect='excel')
+        with lib_compression.open_output(fp_conf.f_output, 'w', compress=fp_conf.compress) as f_out, get_registry_sorter() as sorter:
+            csv_writer = csv.DictWriter(f_out, fieldnames=REGISTRY_CSV_FIELDNAMES, dialect='excel')
             csv_writer.writeheader()
+            rows = iter_registry_csv_rows(l_registry_entries, registry_stats, fp_reg_conf.field_length_limit)
+            if fp_reg_conf.sorted:
+                for row in rows:
+                    sorter.add(dict(row))
+                csv_writer.writerows(sorter)
+            else:
+                csv_writer.writerows(rows)
+        lib_fp_metadata.write_fp_metadata(fp_conf.f_output, get_fp_registry_metadata())
+        self.set_value_stats(registry_stats)
+        registry_stats.log_written()
+
+    def write_registry_entries_to_store(self, l_registry_entries:[lib_data_structures.DataStructRegistryEntry]):
+        """
+        a new snapshot in the fingerprint store fp_conf.f_output - the store is not read by excel, the values are not truncated
 
-            for registry_entry in l_registry_entries:
-                n_keys += 1
-                # write the key
-                data_dict = dict()
-                data_dict['path'] = registry_entry.path
-                data_dict['modified'] = registry_entry.modified
-                data_dict['value_name'] = ''
-                data_dict['value_type'] = 'KEY'
-                data_dict['value'] = ''
-                data_dict['change'] = ''
-                data_dict['remark'] = ''
-                csv_writer.writerow(data_dict)
-                # write the values if any
-                for registry_value in registry_entry.l_registry_values:
-                    data_dict['value_name'] = registry_value.name
-                    data_dict['value_type'] = registry_value.type
-                    data_dict['value'] = str(registry_value.value)
-                    field_length = len(data_dict['value'])
-                    if field_length > maximum_field_length:
-                        maximum_field_length = field_length
-                        longest_key = data_dict['path']
-                        longest_value_name = data_dict['value_name']
-
-                    if field_length > fp_reg_conf.field_length_limit:
-                        logger.warning('truncating data for: {}, value name: {}, length = {} to maximum length {}'
-                                       .format(data_dict['path'], data_dict['value_name'],
-                                               field_length, fp_reg_conf.field_length_limit))
-                        data_dict['value'] = data_dict['value'][0:fp_reg_conf.field_length_limit]
-                    else:
-                        csv_writer.writerow(data_dict)
-            logger.info('{} registry entries written, longest value: key: {}, value_name: {}, length: {}'.format(n_keys, longest_key, longest_value_name, maximum_field_length))
-
-    def parse_all_hives(self, registry_files_copied:[lib_data_structures.DataStructRegistryFileInfo])->[lib_data_structures.DataStructRegistryEntry]:
+        >>> fingerprint_registry = FingerPrintRegistry()
+        >>> fp_conf.f_output = './testresults/test_reg.sqlite'
+        >>> if os.path.exists(fp_conf.f_output): os.remove(fp_conf.f_output)
+        >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+        >>> registry_file_info.hive_name = 'HKLM\SAM'
+        >>> registry_file_info.filename = './testfiles_source/test_registry_hklm_sam.hive'
+        >>> fingerprint_registry.write_registry_entries_to_store(l_registry_entries=fingerprint_registry.parse_hive(registry_file_info=registry_file_info))
+        >>> lib_fp_store.FingerPrintStore(fp_conf.f_output, readonly=True).get_snapshot_ids('registry')
+        [1]
+        """
+        registry_stats = RegistryStats()
+        logger.info('writing registry fingerprint to the fingerprint store {}'.format(fp_conf.f_output))
+        with lib_fp_store.FingerPrintStore(fp_conf.f_output) as fp_store, get_registry_sorter(key=get_registry_tuple_sort_key) as sorter:
+            snapshot_writer = fp_store.create_snapshot('registry', get_fp_registry_metadata())
+            write_registry_row = sorter.add if fp_reg_conf.sorted else lambda row: snapshot_writer.write_registry_row(*row)
+            for row in iter_registry_store_rows(l_registry_entries, registry_stats):
+                write_registry_row(row)
+            if fp_reg_conf.sorted:
+                for row in sorter:
+                    snapshot_writer.write_registry_row(*row)
+            snapshot_writer.close()
+        logger.info('{} registry entries written'.format(registry_stats.n_keys))
+        self.set_value_stats(registry_stats)
+        registry_stats.log_value_stats()
+
+    def set_value_stats(self, registry_stats: 'RegistryStats'):
+        """ the values decoded by lib_reg_decode and the keys reused from the baseline """
+        registry_stats.decode_stats = self.value_decoder.decode_stats
+        if self.registry_baseline:
+            registry_stats.baseline_stats = self.registry_baseline.baseline_stats
+
+    def parse_all_hives(self, registry_files_copied:[lib_data_structures.DataStructRegistryFileInfo])->Iterator[lib_data_structures.DataStructRegistryEntry]:
         logger.info('parsing hives')
-        l_all_reg_entries = list()
         for registry_file_info in registry_files_copied:
-            l_reg_entries = self.parse_hive(registry_file_info=registry_file_info)
-            l_all_reg_entries = l_all_reg_entries + l_reg_entries
-        return l_all_reg_entries
+            yield from self.parse_hive(registry_file_info=registry_file_info)
 
-    def parse_hive(self, registry_file_info: lib_data_structures.DataStructRegistryFileInfo) -> [lib_data_structures.DataStructRegistryEntry]:
+    def parse_hive(self, registry_file_info: lib_data_structures.DataStructRegistryFileInfo,
+                   reg_backend: str = '') -> Iterator[lib_data_structures.DataStructRegistryEntry]:
         """
+        the keys of the hive as they are visited - the hive is released when the last key was read
+        reg_backend : 'python-registry' or 'mmap' (lib_regf), default fp_reg_conf.reg_backend
+
         >>> fingerprint_registry = FingerPrintRegistry()
         >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
         >>> registry_file_info.hive_name = 'HKLM\SAM'
         >>> registry_file_info.filename = './testfiles_source/test_registry_hklm_sam.hive'
-        >>> fingerprint_registry.parse_hive(registry_file_info=registry_file_info)  # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+        >>> list(fingerprint_registry.parse_hive(registry_file_info=registry_file_info))  # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
         [<lib_data_structures.DataStructRegistryEntry object at ...>, ...]
         """
+        reg_backend = reg_backend or fp_reg_conf.reg_backend
+        if reg_backend == 'mmap':
+            logger.info('parsing registry {} (mmap)'.format(registry_file_info.hive_name))
+            with lib_regf.RegfHive(registry_file_info.filename) as regf_hive:
+                yield from self.iter_registry_entries_regf(regf_hive=regf_hive, registry_file_info=registry_file_info)
+            return
         reg = Registry.Registry(registry_file_info.filename)
         key_root = reg.root()
         logger.info('registry key root : {}'.format(key_root))
         logger.info('parsing registry {}'.format(registry_file_info.hive_name))
-        l_reg_entries = self.get_registry_entries(key=key_root, registry_file_info=registry_file_info)
-        return l_reg_entries
+        yield from self.iter_registry_entries(key_root=key_root, registry_file_info=registry_file_info)
 
-    def get_registry_entries(self, key: Registry.RegistryKey, registry_file_info: lib_data_structures.DataStructRegistryFileInfo) -> [lib_data_structures.DataStructRegistryEntry]:
-        l_reg_entries = list()
+    def iter_registry_entries(self, key_root: Registry.RegistryKey, registry_file_info: lib_data_structures.DataStructRegistryFileInfo,
+                              key_path_parent: str = '') -> Iterator[lib_data_structures.DataStructRegistryEntry]:
+        """
+        the keys depth first, each key before its subkeys - an explicit stack instead of recursion, so deep hives do not hit the
+        recursion limit and the entries are not copied from list to list. the key paths are built from the path of the parent,
+        python-registry would walk up to the root for every key.
+        key_path_parent : the raw path of the parent of key_root, if key_root is not the root of the hive (see lib_fp_registry_parallel)
+
+        >>> fingerprint_registry = FingerPrintRegistry()
+        >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+        >>> registry_file_info.hive_name = 'HKLM\SAM'
+        >>> key_root = Registry.Registry('./testfiles_source/test_registry_hklm_sam.hive').root()
+        >>> l_registry_entries = list(fingerprint_registry.iter_registry_entries(key_root=key_root, registry_file_info=registry_file_info))
+        >>> l_registry_entries[0].path, l_registry_entries[1].path
+        ('HKLM\\\\SAM\\\\ROOT', 'HKLM\\\\SAM\\\\SAM')
+
+        >>> # the same order and paths as a recursive walk with python-registry
+        >>> def iter_keys_recursive(key):
+        ...     yield key
+        ...     for subkey in key.subkeys():
+        ...         yield from iter_keys_recursive(subkey)
+        >>> l_paths = [fingerprint_registry.format_key_path(registry_file_info, key.path()) for key in iter_keys_recursive(key_root)]
+        >>> [registry_entry.path for registry_entry in l_registry_entries] == l_paths
+        True
+
+        >>> # a subtree
+        >>> key_sam = key_root.subkeys()[0]
+        >>> registry_entries_sam = fingerprint_registry.iter_registry_entries(key_root=key_sam, registry_file_info=registry_file_info, key_path_parent='ROOT')
+        >>> l_registry_entries_sam = list(registry_entries_sam)
+        >>> [registry_entry.path for registry_entry in l_registry_entries_sam] == l_paths[1:len(l_registry_entries_sam) + 1]
+        True
+        """
+        # the stack holds an iterator over the subkeys of every open key, with the raw path of that key
+        l_stack: List[Tuple[Iterator[Registry.RegistryKey], str]] = [(iter([key_root]), key_path_parent)]
+        depth_parent = key_path_parent.count('\\') + 1 if key_path_parent else 0
+        while l_stack:
+            subkeys, key_path_parent = l_stack[-1]
+            key = next(subkeys, None)
+            if key is None:
+                l_stack.pop()
+                continue
+            key_path = key_path_parent + '\\' + key.name() if key_path_parent else key.name()
+            yield self.get_registry_entry(key=key, key_path=key_path, registry_file_info=registry_file_info)
+            if depth_parent + len(l_stack) > MAX_KEY_DEPTH:
+                logger.warning('registry key "{}" is nested deeper than {} levels - the hive is damaged, subkeys skipped'.format(key_path, MAX_KEY_DEPTH))
+                continue
+            l_stack.append((iter(key.subkeys()), key_path))
+
+    def get_registry_entry(self, key: Registry.RegistryKey, key_path: str,
+                           registry_file_info: lib_data_structures.DataStructRegistryFileInfo) -> lib_data_structures.DataStructRegistryEntry:
+        """
+        values the backend can not decode are decoded by their type (lib_reg_decode) and counted, both backends decode them the same way
+
+        >>> import lib_hive_writer
+        >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+        >>> registry_file_info.hive_name, registry_file_info.filename = 'HKLM\\\\BROKEN', './testresults/test_reg_broken_values.hive'
+        >>> with lib_hive_writer.HiveWriter(registry_file_info.filename) as hive_writer:
+        ...     hive_writer.add_key(0, 'ROOT', [('lone_surrogate', lib_hive_writer.REG_SZ, 'abc'.encode('utf-16le') + b'\\x00\\xd8x\\x00\\x00\\x00'),
+        ...                                     ('unknown_type', 0x12, b'\\x01\\x02\\x03\\x04\\x05')])
+        >>> for reg_backend in ('python-registry', 'mmap'):
+        ...     fingerprint_registry = FingerPrintRegistry()
+        ...     registry_entry = next(fingerprint_registry.parse_hive(registry_file_info, reg_backend=reg_backend))
+        ...     [registry_value.value for registry_value in registry_entry.l_registry_values], sorted(fingerprint_registry.value_decoder.decode_stats.counter)
+        (['abc\\ufffdx', '0102030405'], [('RegSZ', 'utf-16le'), ('Unknown type: 0x12', 'hex')])
+        (['abc\\ufffdx', '0102030405'], [('RegSZ', 'utf-16le'), ('Unknown type: 0x12', 'hex')])
+        """
         l_registry_values = list()
         registry_entry = lib_data_structures.DataStructRegistryEntry()
-        registry_entry.path = self.format_key_path(registry_file_info=registry_file_info, key_path=key.path())
+        registry_entry.path = self.format_key_path(registry_file_info=registry_file_info, key_path=key_path)
         registry_entry.modified = key.timestamp()
+        if self.registry_baseline:
+            l_values_baseline = self.registry_baseline.get_reused_values(registry_entry)
+            if l_values_baseline is not None:
+                registry_entry.l_registry_values = lib_fp_registry_baseline.get_registry_values(l_values_baseline)
+                return registry_entry
 
         for value in key.values():
             registry_value = lib_data_structures.DataStructRegistryValue()
             registry_value.name = value.name()
             registry_value.type = value.value_type_str()
             try:
-                registry_value.value = self.get_registry_value(value)
+                registry_value.value = value.value()
             except (AttributeError, Registry.RegistryParse.UnknownTypeException, TypeError, UnicodeDecodeError):
-                s_error = 'can not read the value of key "{}", value name "{}", value type "{}"'.format(registry_entry.path, registry_value.name, registry_value.type)
-                lib_helper_functions.log_exception_traceback(s_error=s_error)
-                registry_value.value = 'ERROR: can not be parsed or access denied'
+                registry_value.value = self.value_decoder.decode(registry_entry.path, registry_value.type, value.raw_data())
             l_registry_values.append(registry_value)
 
         registry_entry.l_registry_values = l_registry_values
-        l_reg_entries.append(registry_entry)
+        if self.registry_baseline:
+            self.registry_baseline.verify(registry_entry)
+        return registry_entry
 
-        for subkey in key.subkeys():
-            l_subkeys = self.get_registry_entries(key=subkey, registry_file_info=registry_file_info)
-            l_reg_entries = l_reg_entries + l_subkeys
-        return l_reg_entries
+    def iter_registry_entries_regf(self, regf_hive: lib_regf.RegfHive, registry_file_info: lib_data_structures.DataStructRegistryFileInfo,
+                                   offset_nk: int = 0, key_path_parent: str = '') -> Iterator[lib_data_structures.DataStructRegistryEntry]:
+        """
+        the entries of the mmap backend - the same entries as iter_registry_entries, key by key and value by value
 
-    @staticmethod
-    def get_registry_value(value) -> str:
-        try:
-            registry_value = value.value()
-        except (AttributeError, Registry.RegistryParse.UnknownTypeException, TypeError, UnicodeDecodeError):
-            value_raw = value.raw_data()
-            encoding = lib_detect_encoding.get_file_encoding(value_raw)
-            registry_value = value_raw.decode(encoding)
-        return registry_value
+        >>> fingerprint_registry = FingerPrintRegistry()
+        >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+        >>> registry_file_info.hive_name = 'HKLM\\SAM'
+        >>> def get_rows(registry_entries):
+        ...     return [(registry_entry.path, registry_entry.modified, [(registry_value.name, registry_value.type, registry_value.value)
+        ...              for registry_value in registry_entry.l_registry_values]) for registry_entry in registry_entries]
+
+        >>> # the test hive and a generated hive with all value types, big values in db records and more than 1012 subkeys (ri lists)
+        >>> import lib_hive_writer, struct
+        >>> f_hive_generated = './testresults/test_reg_generated_types.hive'
+        >>> with lib_hive_writer.HiveWriter(f_hive_generated, timestamp=131000000000000015) as hive_writer:
+        ...     hive_writer.add_key(0, 'ROOT', [])
+        ...     for value_type in range(12):
+        ...         l_values = [('data_{}'.format(size), value_type, (b'0123456789abcdef' * 4000)[:size]) for size in (0, 2, 4, 6, 100, 0x3fd8, 0x3fda, 50000)]
+        ...         l_values += [('', value_type, lib_hive_writer.encode_sz('wert äöü Ω'))]
+        ...         l_values += [('filetime', lib_regf.REG_FILETIME, struct.pack('<Q', 131000000000000005))]
+        ...         hive_writer.add_key(1, 'type_{}_Ω'.format(value_type), l_values)
+        ...     hive_writer.add_key(1, 'wide', [])
+        ...     for n in range(1100):
+        ...         hive_writer.add_key(2, 'key_{}'.format(n), [('value', lib_regf.REG_DWORD, struct.pack('<I', n))])
+        >>> for registry_file_info.filename in ('./testfiles_source/test_registry_hklm_sam.hive', f_hive_generated):
+        ...     key_root = Registry.Registry(registry_file_info.filename).root()
+        ...     with lib_regf.RegfHive(registry_file_info.filename) as regf_hive:
+        ...         l_rows_regf = get_rows(fingerprint_registry.iter_registry_entries_regf(regf_hive, registry_file_info))
+        ...     l_rows_regf == get_rows(fingerprint_registry.iter_registry_entries(key_root, registry_file_info)), len(l_rows_regf)
+        (True, 82)
+        (True, 1114)
+        """
+        for key_path, timestamp, offset_nk in regf_hive.iter_keys(offset_nk=offset_nk, key_path_parent=key_path_parent, max_depth=MAX_KEY_DEPTH):
+            yield self.get_registry_entry_regf(regf_hive=regf_hive, key_path=key_path, timestamp=timestamp, offset_nk=offset_nk,
+                                               registry_file_info=registry_file_info)
+
+    def get_registry_entry_regf(self, regf_hive: lib_regf.RegfHive, key_path: str, timestamp: int, offset_nk: int,
+                                registry_file_info: lib_data_structures.DataStructRegistryFileInfo) -> lib_data_structures.DataStructRegistryEntry:
+        l_registry_values = list()
+        registry_entry = lib_data_structures.DataStructRegistryEntry()
+        registry_entry.path = self.format_key_path(registry_file_info=registry_file_info, key_path=key_path)
+        registry_entry.modified = lib_regf.get_datetime(timestamp)
+        if self.registry_baseline:
+            l_values_baseline = self.registry_baseline.get_reused_values(registry_entry)
+            if l_values_baseline is not None:
+                registry_entry.l_registry_values = lib_fp_registry_baseline.get_registry_values(l_values_baseline)
+                return registry_entry
+
+        for value_name, value_type, raw_data in regf_hive.get_key_values(offset_nk):
+            registry_value = lib_data_structures.DataStructRegistryValue()
+            registry_value.name = value_name or '(default)'
+            registry_value.type = lib_regf.get_value_type_name(value_type)
+            try:
+                registry_value.value = lib_regf.get_value_data(value_type, raw_data)
+            except (AttributeError, lib_regf.RegfUnknownTypeError, TypeError, UnicodeDecodeError):
+                registry_value.value = self.value_decoder.decode(registry_entry.path, registry_value.type, raw_data)
+            l_registry_values.append(registry_value)
+
+        registry_entry.l_registry_values = l_registry_values
+        if self.registry_baseline:
+            self.registry_baseline.verify(registry_entry)
+        return registry_entry
 
     @staticmethod
     def format_key_path(registry_file_info:lib_data_structures.DataStructRegistryFileInfo, key_path:str)->str:
@@ -358,6 +572,121 @@ class FingerPrintRegistry(object):
         return f_out_dir
 
 
+class RegistryStats(object):
+    """
+    the keys written, the longest value, the values decoded by lib_reg_decode and the keys reused from the baseline (see
+    lib_fp_registry_baseline) - the workers of lib_fp_registry_parallel
+    return them for their hive, merged in the order of the hives they are the same as the ones of a sequential run
+
+    >>> registry_stats, registry_stats_2 = RegistryStats(), RegistryStats()
+    >>> registry_stats.add_value('key_a', 'a', 10)
+    >>> registry_stats_2.add_value('key_b', 'b', 10)
+    >>> registry_stats_2.add_value('key_c', 'c', 20)
+    >>> registry_stats.n_keys, registry_stats_2.n_keys = 1, 2
+    >>> registry_stats.merge(registry_stats_2)
+    >>> registry_stats.n_keys, registry_stats.maximum_field_length, registry_stats.longest_key, registry_stats.longest_value_name
+    (3, 20, 'key_c', 'c')
+    """
+    def __init__(self):
+        self.n_keys: int = 0
+        self.maximum_field_length: int = 0
+        self.longest_key: str = ''
+        self.longest_value_name: str = ''
+        self.decode_stats = lib_reg_decode.DecodeStats()
+        self.baseline_stats = lib_fp_registry_baseline.BaselineStats()
+
+    def add_value(self, key_path: str, value_name: str, field_length: int):
+        # the first of equally long values is kept
+        if field_length > self.maximum_field_length:
+            self.maximum_field_length = field_length
+            self.longest_key = key_path
+            self.longest_value_name = value_name
+
+    def merge(self, registry_stats: 'RegistryStats'):
+        """ adds the stats of the next hive """
+        self.n_keys += registry_stats.n_keys
+        self.add_value(registry_stats.longest_key, registry_stats.longest_value_name, registry_stats.maximum_field_length)
+        self.decode_stats.merge(registry_stats.decode_stats)
+        self.baseline_stats.merge(registry_stats.baseline_stats)
+
+    def log_written(self):
+        logger.info('{} registry entries written, longest value: key: {}, value_name: {}, length: {}'.format(
+            self.n_keys, self.longest_key, self.longest_value_name, self.maximum_field_length))
+        self.log_value_stats()
+
+    def log_value_stats(self):
+        self.decode_stats.log()
+        self.baseline_stats.log()
+
+
+def iter_registry_csv_rows(registry_entries: Iterable[lib_data_structures.DataStructRegistryEntry], registry_stats: RegistryStats,
+                           field_length_limit: int) -> Iterator[dict]:
+    """
+    the csv rows of the keys : the key row, then a row for every value, the values truncated to field_length_limit.
+    the same dict is filled for all rows of a key, a row has to be written or copied before the next one is taken
+    """
+    for registry_entry in registry_entries:
+        registry_stats.n_keys += 1
+        # the key
+        data_dict: Dict[str, Any] = dict()
+        data_dict['path'] = registry_entry.path
+        data_dict['modified'] = registry_entry.modified
+        data_dict['value_name'] = ''
+        data_dict['value_type'] = 'KEY'
+        data_dict['value'] = ''
+        data_dict['change'] = ''
+        data_dict['remark'] = ''
+        yield data_dict
+        # the values if any
+        for registry_value in registry_entry.l_registry_values:
+            data_dict['value_name'] = registry_value.name
+            data_dict['value_type'] = registry_value.type
+            data_dict['value'] = str(registry_value.value)
+            field_length = len(data_dict['value'])
+            registry_stats.add_value(data_dict['path'], data_dict['value_name'], field_length)
+            if field_length > field_length_limit:
+                logger.warning('truncating data for: {}, value name: {}, length = {} to maximum length {}'
+                               .format(data_dict['path'], data_dict['value_name'], field_length, field_length_limit))
+                data_dict['value'] = data_dict['value'][0:field_length_limit]
+            yield data_dict
+
+
+def iter_registry_store_rows(registry_entries: Iterable[lib_data_structures.DataStructRegistryEntry],
+                             registry_stats: RegistryStats) -> Iterator[Tuple[str, str, str, str, str]]:
+    """ the rows for the fingerprint store : (path, modified, value_name, value_type, value), the values are not truncated """
+    for registry_entry in registry_entries:
+        registry_stats.n_keys += 1
+        modified = str(registry_entry.modified)
+        yield registry_entry.path, modified, '', 'KEY', ''
+        for registry_value in registry_entry.l_registry_values:
+            yield registry_entry.path, modified, registry_value.name, registry_value.type, str(registry_value.value)
+
+
+def get_fp_registry_metadata() -> dict:
+    dict_metadata: Dict[str, Any] = dict()
+    dict_metadata['fingerprint_type'] = 'registry'
+    dict_metadata['version'] = fp_conf.version
+    dict_metadata['sorted'] = lib_external_sort.SORT_ORDER_REGISTRY if fp_reg_conf.sorted else ''
+    # longer values are truncated in a csv fingerprint - a baseline does not reuse them (lib_fp_registry_baseline)
+    dict_metadata['field_length_limit'] = fp_reg_conf.field_length_limit
+    return dict_metadata
+
+
+def get_registry_sorter(key=None) -> lib_external_sort.ExternalSorter:
+    """ --sorted : the registry rows are sorted by path and value name, the key row (value name '') first """
+    return lib_external_sort.ExternalSorter(key=key or get_registry_row_sort_key, run_size=fp_reg_conf.sort_run_size,
+                                            tmp_dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+
+
+def get_registry_row_sort_key(row: dict) -> Tuple[str, str]:
+    return lib_external_sort.get_path_sort_key(row['path']), row['value_name']
+
+
+def get_registry_tuple_sort_key(row: tuple) -> Tuple[str, str]:
+    """ row : (path, modified, value_name, value_type, value) """
+    return lib_external_sort.get_path_sort_key(row[0]), row[2]
+
+
 if __name__ == '__main__':
     logger.info('this is a library and not intended to run stand alone')
     lib_doctest_pycharm.testmod()
@@ -0,0 +1,203 @@
+import csv
+import itertools
+import lib_compression
+import lib_data_structures
+import lib_doctest_pycharm
+import lib_fp_metadata
+import lib_fp_store
+import logging
+import marshal
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# incremental registry fingerprint (fp reg --baseline) - a key with the same path and last write time as in a previous
+# registry fingerprint (csv or fingerprint store) gets the value rows of that fingerprint, its values are not read from the hive.
+# windows sets the last write time of a key whenever a value of the key is written, so the values of the key are the same.
+#
+# the baseline is read once before the hives : the value rows of every key are spooled to a file in a temporary directory,
+# the index holds path : (modified, offset, size) - the rows of a key are read back when it is reused. the workers of
+# lib_fp_registry_parallel open the same directory. keys of a csv baseline with a value as long as its field_length_limit
+# are left out, the value might be truncated.
+#
+# --baseline_verify N : every N-th key found in the baseline is read from the hive anyway and compared with the baseline,
+# the differences are logged - if there are any, the last write times can not be trusted on this system
+
+BASELINE_INDEX: str = 'baseline_index.marshal'
+BASELINE_VALUES: str = 'baseline_values.marshal'
+MAX_MISMATCHES_LOGGED: int = 10
+FIELD_LENGTH_LIMIT_DEFAULT: int = 32767     # csv fingerprints without metadata - the default of fp reg
+
+BaselineValue = Tuple[str, str, str]        # value name, value type, value as it is written
+
+
+def create_baseline(f_baseline: str, baseline_dir: str, snapshot_id: int = 0):
+    """
+    spools the keys of the registry fingerprint f_baseline to baseline_dir - csv (compressed or not) or fingerprint store,
+    of a store the snapshot_id, default the latest complete registry snapshot
+
+    >>> import lib_fp_registry
+    >>> fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    >>> registry_file_info.hive_name, registry_file_info.filename = 'HKLM\\\\SAM', './testfiles_source/test_registry_hklm_sam.hive'
+    >>> l_registry_entries = list(fingerprint_registry.parse_hive(registry_file_info))
+    >>> def get_values(registry_entry):
+    ...     return [(registry_value.name, registry_value.type, str(registry_value.value)) for registry_value in registry_entry.l_registry_values]
+
+    >>> # a csv fingerprint and a fingerprint store
+    >>> lib_fp_registry.fp_conf.f_output = './testresults/test_reg_baseline.csv'
+    >>> fingerprint_registry.write_registry_entries_to_csv(l_registry_entries)
+    >>> lib_fp_registry.fp_conf.f_output = './testresults/test_reg_baseline.sqlite'
+    >>> if os.path.exists(lib_fp_registry.fp_conf.f_output): os.remove(lib_fp_registry.fp_conf.f_output)
+    >>> fingerprint_registry.write_registry_entries_to_store(l_registry_entries)
+    >>> baseline_dir = './testresults/test_reg_baseline'
+    >>> os.makedirs(baseline_dir, exist_ok=True)
+    >>> for f_baseline in ('./testresults/test_reg_baseline.csv', './testresults/test_reg_baseline.sqlite'):
+    ...     create_baseline(f_baseline, baseline_dir)
+    ...     with RegistryBaseline(baseline_dir) as registry_baseline:
+    ...         registry_entry = l_registry_entries[5]
+    ...         len(registry_baseline.dict_index), registry_baseline.get_values(registry_entry.path, str(registry_entry.modified)) == get_values(registry_entry)
+    ...         registry_baseline.get_values(registry_entry.path, '1980-01-01 00:00:00')
+    (82, True)
+    (82, True)
+    """
+    logger.info('reading the registry baseline {}'.format(f_baseline))
+    if lib_fp_store.is_fp_store(f_baseline):
+        snapshot_id = snapshot_id or lib_fp_store.get_latest_snapshot_id(f_baseline, 'registry')
+        # values in the store are not truncated
+        field_length_limit = 0
+        rows = lib_fp_store.iter_registry_rows(f_baseline, snapshot_id)
+        write_baseline(rows, baseline_dir, field_length_limit)
+    else:
+        dict_metadata = lib_fp_metadata.read_fp_metadata(f_baseline)
+        field_length_limit = int(dict_metadata.get('field_length_limit', FIELD_LENGTH_LIMIT_DEFAULT))
+        with lib_compression.open_input(f_baseline, 'r') as f_in:
+            rows = ((row['path'], row['modified'], row['value_name'], row['value_type'], row['value'])
+                    for row in csv.DictReader(f_in, dialect='excel'))
+            write_baseline(rows, baseline_dir, field_length_limit)
+
+
+def write_baseline(rows, baseline_dir: str, field_length_limit: int):
+    """ rows : (path, modified, value_name, value_type, value), the rows of a key follow its KEY row - unsorted or sorted by path """
+    dict_index: Dict[str, Tuple[str, int, int]] = dict()
+    with open(os.path.join(baseline_dir, BASELINE_VALUES), 'wb') as f_values:
+        for path, key_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            _, modified, _, value_type, _ = next(key_rows)
+            if value_type != 'KEY':
+                continue
+            l_values = [(value_name, value_type, value) for _, _, value_name, value_type, value in key_rows]
+            if field_length_limit and any(len(value) >= field_length_limit for _, _, value in l_values):
+                continue
+            data = marshal.dumps(l_values)
+            dict_index[path] = (modified, f_values.tell(), len(data))
+            f_values.write(data)
+    with open(os.path.join(baseline_dir, BASELINE_INDEX), 'wb') as f_index:
+        marshal.dump(dict_index, f_index)
+    logger.info('registry baseline : {} keys'.format(len(dict_index)))
+
+
+class BaselineStats(object):
+    """
+    the keys found in the baseline - the workers of lib_fp_registry_parallel return them with their RegistryStats
+
+    >>> baseline_stats, baseline_stats_2 = BaselineStats(), BaselineStats()
+    >>> baseline_stats.n_reused, baseline_stats_2.n_reused, baseline_stats_2.n_verified = 5, 3, 1
+    >>> baseline_stats_2.l_mismatches.append('key_a')
+    >>> baseline_stats.merge(baseline_stats_2)
+    >>> baseline_stats.n_reused, baseline_stats.n_verified, baseline_stats.l_mismatches
+    (8, 1, ['key_a'])
+    """
+    def __init__(self):
+        self.n_reused: int = 0
+        self.n_verified: int = 0
+        self.l_mismatches: List[str] = list()
+
+    def merge(self, baseline_stats: 'BaselineStats'):
+        """ adds the stats of the next hive """
+        self.n_reused += baseline_stats.n_reused
+        self.n_verified += baseline_stats.n_verified
+        self.l_mismatches += baseline_stats.l_mismatches
+
+    def log(self):
+        if not self.n_reused and not self.n_verified:
+            return
+        logger.info('registry baseline : {} keys reused, {} keys verified, {} different'.format(
+            self.n_reused, self.n_verified, len(self.l_mismatches)))
+        if self.l_mismatches:
+            logger.warning('registry baseline : the values of {} keys changed without a new last write time, do not use --baseline on '
+                           'this system - first keys : {}'.format(len(self.l_mismatches), ', '.join(self.l_mismatches[:MAX_MISMATCHES_LOGGED])))
+
+
+class RegistryBaseline(object):
+    """
+    a baseline spooled by create_baseline
+    verify_every : every verify_every-th key found in the baseline is read from the hive and compared, 0 = none
+    """
+    def __init__(self, baseline_dir: str, verify_every: int = 0):
+        self.verify_every = verify_every
+        with open(os.path.join(baseline_dir, BASELINE_INDEX), 'rb') as f_index:
+            self.dict_index: Dict[str, Tuple[str, int, int]] = marshal.load(f_index)
+        self.f_values = open(os.path.join(baseline_dir, BASELINE_VALUES), 'rb')
+        self.baseline_stats = BaselineStats()
+        self.n_found: int = 0
+        # the baseline values of the key that is verified next
+        self.l_values_verify: Optional[List[BaselineValue]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.f_values.close()
+
+    def get_values(self, path: str, modified: str) -> Optional[List[BaselineValue]]:
+        """ the values of the key in the baseline, if it has the same last write time there - otherwise None """
+        index_entry = self.dict_index.get(path)
+        if index_entry is None or index_entry[0] != modified:
+            return None
+        _, offset, size = index_entry
+        self.f_values.seek(offset)
+        return marshal.loads(self.f_values.read(size))
+
+    def get_reused_values(self, registry_entry: lib_data_structures.DataStructRegistryEntry) -> Optional[List[BaselineValue]]:
+        """
+        the values of the baseline, if the values of the key can be reused - None : the key has to be read from the hive.
+        every verify_every-th key found is read from the hive anyway, verify compares it with the baseline
+        """
+        l_values = self.get_values(registry_entry.path, str(registry_entry.modified))
+        if l_values is None:
+            return None
+        self.n_found += 1
+        if self.verify_every and self.n_found % self.verify_every == 0:
+            self.l_values_verify = l_values
+            return None
+        self.baseline_stats.n_reused += 1
+        return l_values
+
+    def verify(self, registry_entry: lib_data_structures.DataStructRegistryEntry):
+        """ the key read from the hive after get_reused_values - compared with the baseline, if it was chosen for verification """
+        if self.l_values_verify is None:
+            return
+        l_values_hive = [(registry_value.name, registry_value.type, str(registry_value.value)) for registry_value in registry_entry.l_registry_values]
+        if l_values_hive != self.l_values_verify:
+            self.baseline_stats.l_mismatches.append(registry_entry.path)
+        self.baseline_stats.n_verified += 1
+        self.l_values_verify = None
+
+
+def get_registry_values(l_values: List[BaselineValue]) -> List[lib_data_structures.DataStructRegistryValue]:
+    l_registry_values = list()
+    for value_name, value_type, value in l_values:
+        registry_value = lib_data_structures.DataStructRegistryValue()
+        registry_value.name, registry_value.type, registry_value.value = value_name, value_type, value
+        l_registry_values.append(registry_value)
+    return l_registry_values
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
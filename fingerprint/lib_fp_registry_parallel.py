@@ -0,0 +1,384 @@
+import concurrent.futures
+import csv
+from fp_conf import fp_conf, fp_reg_conf
+import lib_compression
+import lib_data_structures
+import lib_doctest_pycharm
+import lib_fp_metadata
+import lib_fp_registry
+import lib_fp_registry_baseline
+import lib_fp_store
+import lib_regf
+import logging
+import os
+import shutil
+import tempfile
+import time
+from Registry import Registry
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# parallel registry fingerprint (fp reg --hive_workers N) - every copied hive is parsed in its own worker process.
+# a worker streams the rows of its hive to a part file in a temporary directory next to the fingerprint : for a csv fingerprint
+# the csv text the sequential writer would write (without header), for a fingerprint store the row tuples as csv.
+# the parts are taken in the order of the hives, each one as soon as its worker is done - a csv part is copied as it is,
+# so the fingerprint is byte identical to a sequential run. --sorted and the store read the rows of the parts back.
+# the wall time drops towards the time of the largest hive (SOFTWARE on most systems).
+#
+# --split_depth D splits the hives into work units : the keys above depth D are single keys, every key at depth D is a unit
+# with all its subkeys (D = 1 : every top level key of a hive). consecutive units are grouped into work items of about the same
+# weight (a subtree weighs 1 + its direct subkeys, the size of a subtree is not known before it is parsed), WORK_ITEMS_PER_WORKER
+# items per worker. the items are parsed in parallel like whole hives and merged in their order, which is the depth first order
+# of the sequential traversal. the worker re-opens the hive and finds the keys of its units by path - it keeps the last hive it opened.
+# with --reg_backend=mmap the workers read the hives with lib_regf, the units are planned with python-registry in both cases.
+# with --baseline the main process spools the baseline once, every worker opens the spooled baseline (lib_fp_registry_baseline).
+#
+# unit : (raw key path, with subkeys), the raw path starts with the name of the root key, '' = the whole hive
+
+WORK_ITEMS_PER_WORKER: int = 4          # more items balance the workers better, every item costs a part file and a task
+
+WorkUnit = Tuple[str, bool]
+WorkItem = Tuple[lib_data_structures.DataStructRegistryFileInfo, List[WorkUnit]]
+
+
+def write_hives_parallel(registry_files: List[lib_data_structures.DataStructRegistryFileInfo], n_workers: int = 0, split_depth: int = 0,
+                         baseline_dir: str = ''):
+    """
+    n_workers    : worker processes, 0 = cpu_count, never more than work items
+    split_depth  : the depth of the work units, 0 = one unit per hive
+    baseline_dir : the baseline spooled by lib_fp_registry_baseline.create_baseline, '' = none
+
+    >>> fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    >>> l_registry_files = list()
+    >>> for hive_name in ('HKLM\\\\SAM', 'HKLM\\\\SAM_2', 'HKLM\\\\SAM_3'):
+    ...     registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    ...     registry_file_info.hive_name = hive_name
+    ...     registry_file_info.filename = './testfiles_source/test_registry_hklm_sam.hive'
+    ...     l_registry_files.append(registry_file_info)
+    >>> def read_bytes(f_path):
+    ...     with open(f_path, 'rb') as f_in:
+    ...         return f_in.read()
+
+    >>> # byte identical to the sequential fingerprint, unsorted and sorted
+    >>> for fp_reg_conf.sorted in (False, True):
+    ...     fp_conf.f_output = './testresults/test_reg_sequential.csv'
+    ...     fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_all_hives(l_registry_files))
+    ...     fp_conf.f_output = './testresults/test_reg_parallel.csv'
+    ...     write_hives_parallel(l_registry_files, n_workers=2)
+    ...     read_bytes('./testresults/test_reg_parallel.csv') == read_bytes('./testresults/test_reg_sequential.csv')
+    True
+    True
+    >>> fp_reg_conf.sorted = False
+
+    >>> # the same rows in a fingerprint store
+    >>> for f_output in ('./testresults/test_reg_sequential.sqlite', './testresults/test_reg_parallel.sqlite'):
+    ...     if os.path.exists(f_output): os.remove(f_output)
+    >>> fp_conf.f_output = './testresults/test_reg_sequential.sqlite'
+    >>> fingerprint_registry.write_registry_entries_to_store(fingerprint_registry.parse_all_hives(l_registry_files))
+    >>> fp_conf.f_output, fp_reg_conf.fp_format = './testresults/test_reg_parallel.sqlite', 'sqlite'
+    >>> write_hives_parallel(l_registry_files, n_workers=2)
+    >>> fp_reg_conf.fp_format = 'csv'
+    >>> l_tables = list()
+    >>> for f_output in ('./testresults/test_reg_sequential.sqlite', './testresults/test_reg_parallel.sqlite'):
+    ...     with lib_fp_store.FingerPrintStore(f_output) as fp_store:
+    ...         l_tables.append(fp_store.connection.execute('SELECT * FROM registry').fetchall())
+    >>> l_tables[0] == l_tables[1], len(l_tables[0]) > 0
+    (True, True)
+    >>> [f_name for f_name in os.listdir('./testresults') if f_name.startswith('fp_reg_parts_')]
+    []
+
+    >>> # split into subtrees, on the test hive and on a generated hive with 3000 keys
+    >>> import lib_hive_writer
+    >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    >>> registry_file_info.hive_name, registry_file_info.filename = 'HKLM\\\\GENERATED', './testresults/test_reg_generated.hive'
+    >>> with lib_hive_writer.HiveWriter(registry_file_info.filename) as hive_writer:
+    ...     hive_writer.add_key(0, 'ROOT', [])
+    ...     for n in range(3000):
+    ...         value = ('value', lib_hive_writer.REG_SZ, lib_hive_writer.encode_sz('value {}'.format(n)))
+    ...         hive_writer.add_key(1 + n % 4 if n % 100 else 1, 'key_{}'.format(n), [value])
+    >>> l_registry_files = [l_registry_files[0], registry_file_info]
+    >>> fp_conf.f_output = './testresults/test_reg_sequential.csv'
+    >>> fingerprint_registry.write_registry_entries_to_csv(fingerprint_registry.parse_all_hives(l_registry_files))
+    >>> for split_depth in (1, 2, 3):
+    ...     fp_conf.f_output = './testresults/test_reg_parallel.csv'
+    ...     write_hives_parallel(l_registry_files, n_workers=2, split_depth=split_depth)
+    ...     read_bytes('./testresults/test_reg_parallel.csv') == read_bytes('./testresults/test_reg_sequential.csv')
+    True
+    True
+    True
+
+    >>> # the mmap backend, whole hives and subtrees
+    >>> fp_reg_conf.reg_backend = 'mmap'
+    >>> for split_depth in (0, 2):
+    ...     fp_conf.f_output = './testresults/test_reg_parallel.csv'
+    ...     write_hives_parallel(l_registry_files, n_workers=2, split_depth=split_depth)
+    ...     read_bytes('./testresults/test_reg_parallel.csv') == read_bytes('./testresults/test_reg_sequential.csv')
+    True
+    True
+    >>> fp_reg_conf.reg_backend = 'python-registry'
+
+    >>> # the keys of a baseline reused by the workers
+    >>> fp_reg_conf.baseline, fp_reg_conf.baseline_verify = './testresults/test_reg_sequential.csv', 3
+    >>> baseline_dir = fingerprint_registry.open_registry_baseline()
+    >>> fp_conf.f_output = './testresults/test_reg_parallel.csv'
+    >>> write_hives_parallel(l_registry_files, n_workers=2, split_depth=2, baseline_dir=baseline_dir)
+    >>> fingerprint_registry.close_registry_baseline(baseline_dir)
+    >>> fp_reg_conf.baseline, fp_reg_conf.baseline_verify = '', 0
+    >>> read_bytes('./testresults/test_reg_parallel.csv') == read_bytes('./testresults/test_reg_sequential.csv')
+    True
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    l_work_items = get_work_items(registry_files, split_depth, n_items=n_workers * WORK_ITEMS_PER_WORKER)
+    n_workers = min(n_workers, len(l_work_items))
+    logger.info('parsing {} hives ({} work items) in {} worker processes'.format(len(registry_files), len(l_work_items), n_workers))
+    time_start = time.perf_counter()
+    part_dir = tempfile.mkdtemp(prefix='fp_reg_parts_', dir=os.path.dirname(os.path.abspath(fp_conf.f_output)))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # the config of the main process is passed, spawned workers would have the defaults
+            l_futures = [executor.submit(write_work_item_part, registry_file_info, l_units, get_part_filename(part_dir, part_index),
+                                         fp_reg_conf.fp_format, fp_reg_conf.field_length_limit, fp_reg_conf.reg_backend,
+                                         baseline_dir, fp_reg_conf.baseline_verify)
+                         for part_index, (registry_file_info, l_units) in enumerate(l_work_items)]
+            parts = iter_finished_parts(l_futures)
+            if fp_reg_conf.fp_format == 'sqlite':
+                write_parts_to_store(parts)
+            else:
+                write_parts_to_csv(parts)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    logger.info('{} hives parsed in {:.1f} seconds'.format(len(registry_files), time.perf_counter() - time_start))
+
+
+def get_work_items(registry_files: List[lib_data_structures.DataStructRegistryFileInfo], split_depth: int, n_items: int) -> List[WorkItem]:
+    """
+    about n_items work items in the order of the hives, split_depth 0 : one item per hive
+
+    >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    >>> registry_file_info.filename = './testfiles_source/test_registry_hklm_sam.hive'
+    >>> [l_units for _, l_units in get_work_items([registry_file_info], split_depth=0, n_items=8)]
+    [[('', True)]]
+    >>> [l_units for _, l_units in get_work_items([registry_file_info], split_depth=2, n_items=1)]
+    [[('ROOT', False), ('ROOT\\\\SAM', False), ('ROOT\\\\SAM\\\\Domains', True), ('ROOT\\\\SAM\\\\LastSkuUpgrade', True), ('ROOT\\\\SAM\\\\RXACT', True)]]
+    >>> [l_units for _, l_units in get_work_items([registry_file_info], split_depth=2, n_items=8)]  # doctest: +NORMALIZE_WHITESPACE
+    [[('ROOT', False), ('ROOT\\\\SAM', False), ('ROOT\\\\SAM\\\\Domains', True)], [('ROOT\\\\SAM\\\\LastSkuUpgrade', True)],
+     [('ROOT\\\\SAM\\\\RXACT', True)]]
+    """
+    if split_depth < 1:
+        return [(registry_file_info, [('', True)]) for registry_file_info in registry_files]
+    l_hive_units = [(registry_file_info, get_weighted_units(registry_file_info, split_depth)) for registry_file_info in registry_files]
+    weight_item = sum(weight for _, l_weighted_units in l_hive_units for _, weight in l_weighted_units) / max(n_items, 1)
+    l_work_items: List[WorkItem] = list()
+    for registry_file_info, l_weighted_units in l_hive_units:
+        l_units: List[WorkUnit] = list()
+        weight_units = 0
+        for unit, weight in l_weighted_units:
+            l_units.append(unit)
+            weight_units += weight
+            # an item ends with a subtree, the single keys before it are parsed with it
+            if unit[1] and weight_units >= weight_item:
+                l_work_items.append((registry_file_info, l_units))
+                l_units, weight_units = list(), 0
+        if l_units:
+            l_work_items.append((registry_file_info, l_units))
+    return l_work_items
+
+
+def get_weighted_units(registry_file_info: lib_data_structures.DataStructRegistryFileInfo, split_depth: int) -> List[Tuple[WorkUnit, int]]:
+    """ the units of a hive in depth first order with their weight - the same walk as FingerPrintRegistry.iter_registry_entries, down to split_depth """
+    l_weighted_units: List[Tuple[WorkUnit, int]] = list()
+    l_stack: List[Tuple[Iterator[Registry.RegistryKey], str]] = [(iter([Registry.Registry(registry_file_info.filename).root()]), '')]
+    while l_stack:
+        subkeys, key_path_parent = l_stack[-1]
+        key = next(subkeys, None)
+        if key is None:
+            l_stack.pop()
+            continue
+        key_path = key_path_parent + '\\' + key.name() if key_path_parent else key.name()
+        if len(l_stack) > split_depth:
+            l_weighted_units.append(((key_path, True), 1 + key.subkeys_number()))
+        else:
+            l_weighted_units.append(((key_path, False), 1))
+            l_stack.append((iter(key.subkeys()), key_path))
+    return l_weighted_units
+
+
+def write_work_item_part(registry_file_info: lib_data_structures.DataStructRegistryFileInfo, l_units: List[WorkUnit], f_part: str,
+                         fp_format: str, field_length_limit: int, reg_backend: str, baseline_dir: str = '',
+                         baseline_verify: int = 0) -> Tuple[str, 'lib_fp_registry.RegistryStats']:
+    """ run by the workers - parses the units of a work item into the part file f_part """
+    registry_stats = lib_fp_registry.RegistryStats()
+    fingerprint_registry = lib_fp_registry.FingerPrintRegistry()
+    if baseline_dir:
+        fingerprint_registry.registry_baseline = get_registry_baseline_opened(baseline_dir, baseline_verify)
+        # the stats of this work item only
+        fingerprint_registry.registry_baseline.baseline_stats = lib_fp_registry_baseline.BaselineStats()
+    registry_entries = iter_work_item_entries(registry_file_info, l_units, reg_backend, fingerprint_registry)
+    with open(f_part, 'w', encoding='utf-8', newline='') as f_out:
+        if fp_format == 'sqlite':
+            csv.writer(f_out, dialect='excel').writerows(lib_fp_registry.iter_registry_store_rows(registry_entries, registry_stats))
+        else:
+            csv_writer = csv.DictWriter(f_out, fieldnames=lib_fp_registry.REGISTRY_CSV_FIELDNAMES, dialect='excel')
+            csv_writer.writerows(lib_fp_registry.iter_registry_csv_rows(registry_entries, registry_stats, field_length_limit))
+    fingerprint_registry.set_value_stats(registry_stats)
+    return f_part, registry_stats
+
+
+def iter_work_item_entries(registry_file_info: lib_data_structures.DataStructRegistryFileInfo, l_units: List[WorkUnit],
+                           reg_backend: str = 'python-registry', fingerprint_registry: 'lib_fp_registry.FingerPrintRegistry' = None
+                           ) -> Iterator[lib_data_structures.DataStructRegistryEntry]:
+    """
+    >>> registry_file_info = lib_data_structures.DataStructRegistryFileInfo()
+    >>> registry_file_info.hive_name, registry_file_info.filename = 'HKLM\\\\SAM', './testfiles_source/test_registry_hklm_sam.hive'
+    >>> l_units = [('ROOT', False), ('ROOT\\\\SAM\\\\RXACT', True)]
+    >>> for reg_backend in ('python-registry', 'mmap'):
+    ...     [registry_entry.path for registry_entry in iter_work_item_entries(registry_file_info, l_units, reg_backend)]
+    ['HKLM\\\\SAM\\\\ROOT', 'HKLM\\\\SAM\\\\SAM\\\\RXACT']
+    ['HKLM\\\\SAM\\\\ROOT', 'HKLM\\\\SAM\\\\SAM\\\\RXACT']
+    """
+    fingerprint_registry = fingerprint_registry or lib_fp_registry.FingerPrintRegistry()
+    if l_units == [('', True)]:
+        yield from fingerprint_registry.parse_hive(registry_file_info=registry_file_info, reg_backend=reg_backend)
+        return
+    if reg_backend == 'mmap':
+        regf_hive = get_regf_hive_opened(registry_file_info.filename)
+        for key_path, with_subkeys in l_units:
+            registry_entries = fingerprint_registry.iter_registry_entries_regf(regf_hive=regf_hive, registry_file_info=registry_file_info,
+                                                                               offset_nk=regf_hive.find_key(key_path),
+                                                                               key_path_parent=key_path.rpartition('\\')[0])
+            # the subtree walk yields the key itself first
+            yield from registry_entries if with_subkeys else [next(registry_entries)]
+        return
+    hive_opened = get_hive_opened(registry_file_info.filename)
+    for key_path, with_subkeys in l_units:
+        key = hive_opened.get_key(key_path)
+        if with_subkeys:
+            yield from fingerprint_registry.iter_registry_entries(key_root=key, registry_file_info=registry_file_info,
+                                                                  key_path_parent=key_path.rpartition('\\')[0])
+        else:
+            yield fingerprint_registry.get_registry_entry(key=key, key_path=key_path, registry_file_info=registry_file_info)
+
+
+class HiveOpened(object):
+    """
+    a hive opened by a worker - the keys of the units are found by their raw path. the subkeys of a parent are indexed by
+    their exact name when the first of them is opened, python-registry would search the subkeys without case for every key
+
+    >>> hive_opened = HiveOpened('./testfiles_source/test_registry_hklm_sam.hive')
+    >>> hive_opened.get_key('ROOT').path(), hive_opened.get_key('ROOT\\\\SAM\\\\Domains\\\\Account').path()
+    ('ROOT', 'ROOT\\\\SAM\\\\Domains\\\\Account')
+    """
+    def __init__(self, f_hive: str):
+        self.f_hive = f_hive
+        self.key_root = Registry.Registry(f_hive).root()
+        self.dict_subkeys: Dict[str, Dict[str, Registry.RegistryKey]] = dict()
+
+    def get_key(self, key_path: str) -> Registry.RegistryKey:
+        key_path_parent, _, name = key_path.rpartition('\\')
+        if not key_path_parent:
+            return self.key_root
+        if key_path_parent not in self.dict_subkeys:
+            self.dict_subkeys[key_path_parent] = {subkey.name(): subkey for subkey in self.get_key(key_path_parent).subkeys()}
+        return self.dict_subkeys[key_path_parent][name]
+
+
+# the hive last opened by this worker process - python-registry reads the whole hive into memory, it is read once per worker
+dict_hive_opened: Dict[str, HiveOpened] = dict()
+
+
+def get_hive_opened(f_hive: str) -> HiveOpened:
+    if f_hive not in dict_hive_opened:
+        dict_hive_opened.clear()
+        dict_hive_opened[f_hive] = HiveOpened(f_hive)
+    return dict_hive_opened[f_hive]
+
+
+# the hive last mapped by this worker process (mmap backend) - the subkey index of lib_regf.RegfHive.find_key is kept with it
+dict_regf_hive_opened: Dict[str, lib_regf.RegfHive] = dict()
+
+
+def get_regf_hive_opened(f_hive: str) -> lib_regf.RegfHive:
+    if f_hive not in dict_regf_hive_opened:
+        for regf_hive in dict_regf_hive_opened.values():
+            regf_hive.close()
+        dict_regf_hive_opened.clear()
+        dict_regf_hive_opened[f_hive] = lib_regf.RegfHive(f_hive)
+    return dict_regf_hive_opened[f_hive]
+
+
+# the baseline opened by this worker process - its index is read once per worker
+dict_registry_baseline_opened: Dict[str, lib_fp_registry_baseline.RegistryBaseline] = dict()
+
+
+def get_registry_baseline_opened(baseline_dir: str, verify_every: int) -> lib_fp_registry_baseline.RegistryBaseline:
+    if baseline_dir not in dict_registry_baseline_opened:
+        for registry_baseline in dict_registry_baseline_opened.values():
+            registry_baseline.close()
+        dict_registry_baseline_opened.clear()
+        dict_registry_baseline_opened[baseline_dir] = lib_fp_registry_baseline.RegistryBaseline(baseline_dir, verify_every=verify_every)
+    return dict_registry_baseline_opened[baseline_dir]
+
+
+def iter_finished_parts(l_futures: List[concurrent.futures.Future]) -> Iterator[Tuple[str, 'lib_fp_registry.RegistryStats']]:
+    """ the parts in the order of the hives - the later hives are parsed while the first parts are written """
+    for future in l_futures:
+        yield future.result()
+
+
+def write_parts_to_csv(parts: Iterator[Tuple[str, 'lib_fp_registry.RegistryStats']]):
+    registry_stats = lib_fp_registry.RegistryStats()
+    logger.info('writing registry fingerprint to {}'.format(fp_conf.f_output))
+    with lib_compression.open_output(fp_conf.f_output, 'w', compress=fp_conf.compress) as f_out, lib_fp_registry.get_registry_sorter() as sorter:
+        csv_writer = csv.DictWriter(f_out, fieldnames=lib_fp_registry.REGISTRY_CSV_FIELDNAMES, dialect='excel')
+        csv_writer.writeheader()
+        for f_part, registry_stats_part in parts:
+            registry_stats.merge(registry_stats_part)
+            with open(f_part, 'r', encoding='utf-8', newline='') as f_part_in:
+                if fp_reg_conf.sorted:
+                    for row in csv.DictReader(f_part_in, fieldnames=lib_fp_registry.REGISTRY_CSV_FIELDNAMES, dialect='excel'):
+                        sorter.add(row)
+                else:
+                    shutil.copyfileobj(f_part_in, f_out)
+            os.remove(f_part)
+        if fp_reg_conf.sorted:
+            csv_writer.writerows(sorter)
+    lib_fp_metadata.write_fp_metadata(fp_conf.f_output, lib_fp_registry.get_fp_registry_metadata())
+    registry_stats.log_written()
+
+
+def write_parts_to_store(parts: Iterator[Tuple[str, 'lib_fp_registry.RegistryStats']]):
+    registry_stats = lib_fp_registry.RegistryStats()
+    logger.info('writing registry fingerprint to the fingerprint store {}'.format(fp_conf.f_output))
+    with lib_fp_store.FingerPrintStore(fp_conf.f_output) as fp_store, \
+            lib_fp_registry.get_registry_sorter(key=lib_fp_registry.get_registry_tuple_sort_key) as sorter:
+        snapshot_writer = fp_store.create_snapshot('registry', lib_fp_registry.get_fp_registry_metadata())
+        for f_part, registry_stats_part in parts:
+            registry_stats.merge(registry_stats_part)
+            with open(f_part, 'r', encoding='utf-8', newline='') as f_part_in:
+                for row in csv.reader(f_part_in, dialect='excel'):
+                    if fp_reg_conf.sorted:
+                        sorter.add(tuple(row))
+                    else:
+                        snapshot_writer.write_registry_row(*row)
+            os.remove(f_part)
+        if fp_reg_conf.sorted:
+            for row in sorter:
+                snapshot_writer.write_registry_row(*row)
+        snapshot_writer.close()
+    logger.info('{} registry entries written'.format(registry_stats.n_keys))
+    registry_stats.log_value_stats()
+
+
+def get_part_filename(part_dir: str, part_index: int) -> str:
+    """
+    >>> get_part_filename('parts', 3).replace('\\\\', '/')
+    'parts/part_00003.csv'
+    """
+    return os.path.join(part_dir, 'part_{:05}.csv'.format(part_index))
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
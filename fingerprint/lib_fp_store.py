@@ -0,0 +1,428 @@
+import csv
+import json
+import lib_compression
+import lib_data_structures
+import lib_doctest_pycharm
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# sqlite fingerprint store (fp files / fp reg --fp_format sqlite, extension .sqlite).
+# every run adds a snapshot to the store, the rows carry the snapshot_id. the fingerprints can be queried ad hoc,
+# e.g. SELECT path, size FROM files WHERE snapshot_id = 2 AND hash IN (SELECT hash FROM files WHERE snapshot_id = 1 AND path LIKE '%.dll')
+#
+# snapshots : snapshot_id, fingerprint_type ('files' or 'registry'), timestamp, complete (0 while the run is writing,
+#             or if it was aborted), metadata (json, like the metadata sidecar of the csv fingerprints)
+# files     : snapshot_id, path, size, created_ns, modified_ns, accessed_ns (epoch nanoseconds), hash, remark, link_group
+#             indexed on path, hash and modified_ns (each with the snapshot_id first)
+# registry  : snapshot_id, path, modified, value_name, value_type ('KEY' for the key itself), value
+#             indexed on path, value_name
+#
+# the diffs of two snapshots run as indexed joins inside sqlite - the memory needed does not grow with the number of rows.
+# the snapshots may be in the same store or in two stores (the store of fp1 is attached to the connection).
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+FP_STORE_EXTENSION = '.sqlite'
+FP_STORE_SCHEMA_VERSION: int = 1
+FP_STORE_INSERT_BATCH: int = 10000
+
+FILES_COLUMNS = ('path', 'size', 'created_ns', 'modified_ns', 'accessed_ns', 'hash', 'remark', 'link_group')
+REGISTRY_COLUMNS = ('path', 'modified', 'value_name', 'value_type', 'value')
+
+
+class FingerPrintStore(object):
+    """
+    >>> if os.path.exists('./testresults/fp_store_test.sqlite'): os.remove('./testresults/fp_store_test.sqlite')
+    >>> with FingerPrintStore('./testresults/fp_store_test.sqlite') as fp_store:
+    ...     snapshot_writer = fp_store.create_snapshot('files', {'hash_algo': 'sha256'})
+    ...     fileinfo = lib_data_structures.DataStructFileInfo()
+    ...     fileinfo.path, fileinfo.size, fileinfo.hash = './testfiles/file1.txt', 3, 'e3b0c442'
+    ...     snapshot_writer.write_fileinfo(fileinfo)
+    ...     snapshot_writer.close()
+    ...     fp_store.get_snapshot_ids('files')
+    [1]
+    >>> with FingerPrintStore('./testresults/fp_store_test.sqlite') as fp_store:
+    ...     [(fileinfo.path, fileinfo.size, fileinfo.hash) for fileinfo in fp_store.iter_fileinfo(1)]
+    ...     fp_store.get_snapshot_metadata(1)
+    [('./testfiles/file1.txt', 3, 'e3b0c442')]
+    {'hash_algo': 'sha256'}
+
+    >>> # readers open the store read only, without touching the schema
+    >>> with FingerPrintStore('./testresults/fp_store_test.sqlite', readonly=True) as fp_store:
+    ...     fp_store.create_snapshot('files', {})
+    Traceback (most recent call last):
+    ...
+    sqlite3.OperationalError: attempt to write a readonly database
+    """
+    def __init__(self, db_path: str, readonly: bool = False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.connection = self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            db_uri = pathlib.Path(self.db_path).resolve().as_uri() + '?mode=ro'
+            self.connection = sqlite3.connect(db_uri, uri=True)
+            self.check_schema_version()
+        else:
+            self.connection = sqlite3.connect(self.db_path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.create_schema()
+        return self.connection
+
+    def check_schema_version(self, schema: str = 'main', db_path: str = ''):
+        """ schema : the main store or an attached one (db_path) """
+        schema_version = self.connection.execute('PRAGMA {}.user_version'.format(schema)).fetchone()[0]
+        if schema_version > FP_STORE_SCHEMA_VERSION:
+            raise RuntimeError('the fingerprint store {} has the schema version {}, this version of fingerprint can read up to version {}'.format(
+                db_path or self.db_path, schema_version, FP_STORE_SCHEMA_VERSION))
+
+    def create_schema(self):
+        self.check_schema_version()
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS snapshots '
+                                    '(snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint_type TEXT, timestamp REAL, '
+                                    'complete INTEGER, metadata TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files '
+                                    '(snapshot_id INTEGER, path TEXT, size INTEGER, created_ns INTEGER, modified_ns INTEGER, '
+                                    'accessed_ns INTEGER, hash TEXT, remark TEXT, link_group TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_path ON files (snapshot_id, path)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_hash ON files (snapshot_id, hash)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_modified ON files (snapshot_id, modified_ns)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS registry '
+                                    '(snapshot_id INTEGER, path TEXT, modified TEXT, value_name TEXT, value_type TEXT, value TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS registry_path ON registry (snapshot_id, path, value_name)')
+            self.connection.execute('PRAGMA user_version = {}'.format(FP_STORE_SCHEMA_VERSION))
+
+    def create_snapshot(self, fingerprint_type: str, dict_metadata: dict) -> 'SnapshotWriter':
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO snapshots (fingerprint_type, timestamp, complete, metadata) VALUES (?, ?, 0, ?)',
+                                             (fingerprint_type, time.time(), json.dumps(dict_metadata, sort_keys=True)))
+        logger.info('fingerprint store {} : snapshot {}'.format(self.db_path, cursor.lastrowid))
+        return SnapshotWriter(self.connection, cursor.lastrowid, fingerprint_type)
+
+    def get_snapshot_ids(self, fingerprint_type: str, complete_only: bool = True) -> List[int]:
+        sql = 'SELECT snapshot_id FROM snapshots WHERE fingerprint_type = ?'
+        if complete_only:
+            sql += ' AND complete = 1'
+        return [row[0] for row in self.connection.execute(sql + ' ORDER BY snapshot_id', (fingerprint_type, ))]
+
+    def get_snapshot_metadata(self, snapshot_id: int) -> dict:
+        row = self.connection.execute('SELECT metadata FROM snapshots WHERE snapshot_id = ?', (snapshot_id, )).fetchone()
+        if row is None:
+            raise RuntimeError('the fingerprint store {} has no snapshot {}'.format(self.db_path, snapshot_id))
+        return json.loads(row[0])
+
+    def iter_fileinfo(self, snapshot_id: int) -> Iterator['lib_data_structures.DataStructFileInfo']:
+        """ the files of a snapshot, in the order they were written """
+        for row in self.iter_files_rows(snapshot_id):
+            yield get_fileinfo_from_row(row)
+
+    def iter_files_rows(self, snapshot_id: int) -> Iterator[tuple]:
+        """ the files rows of a snapshot (FILES_COLUMNS), in the order they were written - see get_fileinfo_from_row() """
+        yield from self.connection.execute('SELECT {} FROM files WHERE snapshot_id = ? ORDER BY rowid'.format(', '.join(FILES_COLUMNS)), (snapshot_id, ))
+
+    def iter_registry_rows(self, snapshot_id: int) -> Iterator[tuple]:
+        """ the registry rows of a snapshot (REGISTRY_COLUMNS), in the order they were written """
+        yield from self.connection.execute('SELECT {} FROM registry WHERE snapshot_id = ? ORDER BY rowid'.format(', '.join(REGISTRY_COLUMNS)),
+                                           (snapshot_id, ))
+
+    def close(self):
+        self.connection.close()
+
+
+class SnapshotWriter(object):
+    """ batched inserts, one transaction per batch - the snapshot is marked complete on close() """
+    def __init__(self, connection: sqlite3.Connection, snapshot_id: int, fingerprint_type: str):
+        self.connection = connection
+        self.snapshot_id = snapshot_id
+        self.table = 'files' if fingerprint_type == 'files' else 'registry'
+        columns = FILES_COLUMNS if fingerprint_type == 'files' else REGISTRY_COLUMNS
+        self.sql_insert = 'INSERT INTO {} (snapshot_id, {}) VALUES (?{})'.format(self.table, ', '.join(columns), ', ?' * len(columns))
+        self.l_rows: List[tuple] = list()
+        self.n_rows: int = 0
+
+    def write_fileinfo(self, fileinfo: 'lib_data_structures.DataStructFileInfo'):
+        self.write_row((fileinfo.path, fileinfo.size, fileinfo.created_ns, fileinfo.modified_ns, fileinfo.accessed_ns,
+                        fileinfo.hash, fileinfo.remark, fileinfo.link_group))
+
+    def write_registry_row(self, path: str, modified: str, value_name: str, value_type: str, value: str):
+        self.write_row((path, modified, value_name, value_type, value))
+
+    def write_row(self, row: tuple):
+        self.l_rows.append((self.snapshot_id, ) + row)
+        if len(self.l_rows) >= FP_STORE_INSERT_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.l_rows:
+            return
+        with self.connection:
+            self.connection.executemany(self.sql_insert, self.l_rows)
+        self.n_rows += len(self.l_rows)
+        self.l_rows = list()
+
+    def close(self):
+        self.flush()
+        with self.connection:
+            self.connection.execute('UPDATE snapshots SET complete = 1 WHERE snapshot_id = ?', (self.snapshot_id, ))
+
+
+def is_fp_store(f_fingerprint: str) -> bool:
+    """
+    >>> is_fp_store('./testfiles_source/fp_files_result1_difftest.csv')
+    False
+    """
+    with open(f_fingerprint, 'rb') as f_in:
+        return f_in.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def resolve_snapshot_ids(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, fingerprint_type: str) -> Tuple[int, int]:
+    """
+    snapshot 0 means the default : fp2 is the latest complete snapshot of its store, fp1 the latest complete snapshot
+    of its store - or the one before fp2, if both are in the same store. snapshots of csv or binary fingerprints stay 0
+
+    >>> if os.path.exists('./testresults/fp_store_resolve.sqlite'): os.remove('./testresults/fp_store_resolve.sqlite')
+    >>> with FingerPrintStore('./testresults/fp_store_resolve.sqlite') as fp_store:
+    ...     for n in range(3):
+    ...         fp_store.create_snapshot('files', {}).close()
+    >>> resolve_snapshot_ids('./testresults/fp_store_resolve.sqlite', './testresults/fp_store_resolve.sqlite', 0, 0, 'files')
+    (2, 3)
+    >>> resolve_snapshot_ids('./testresults/fp_store_resolve.sqlite', './testresults/fp_store_resolve.sqlite', 0, 2, 'files')
+    (1, 2)
+    >>> resolve_snapshot_ids('./testfiles_source/fp_files_result1_difftest.csv', './testresults/fp_store_resolve.sqlite', 0, 0, 'files')
+    (0, 3)
+    >>> resolve_snapshot_ids('./testresults/fp_store_resolve.sqlite', './testresults/fp_store_resolve.sqlite', 0, 1, 'files')
+    Traceback (most recent call last):
+    ...
+    RuntimeError: the fingerprint store ./testresults/fp_store_resolve.sqlite has no complete files snapshot before snapshot 1
+    """
+    if is_fp_store(f_fp_2) and not snapshot_2:
+        snapshot_2 = get_latest_snapshot_id(f_fp_2, fingerprint_type)
+    if is_fp_store(f_fp_1) and not snapshot_1:
+        before_snapshot = snapshot_2 if is_same_store(f_fp_1, f_fp_2) else 0
+        snapshot_1 = get_latest_snapshot_id(f_fp_1, fingerprint_type, before_snapshot)
+    return snapshot_1, snapshot_2
+
+
+def get_latest_snapshot_id(f_fp_store: str, fingerprint_type: str, before_snapshot: int = 0) -> int:
+    with FingerPrintStore(f_fp_store, readonly=True) as fp_store:
+        l_snapshot_ids = fp_store.get_snapshot_ids(fingerprint_type)
+    if before_snapshot:
+        l_snapshot_ids = [snapshot_id for snapshot_id in l_snapshot_ids if snapshot_id < before_snapshot]
+    if not l_snapshot_ids:
+        s_before = ' before snapshot {}'.format(before_snapshot) if before_snapshot else ''
+        raise RuntimeError('the fingerprint store {} has no complete {} snapshot{}'.format(f_fp_store, fingerprint_type, s_before))
+    return l_snapshot_ids[-1]
+
+
+def is_same_store(f_fp_1: str, f_fp_2: str) -> bool:
+    return os.path.exists(f_fp_1) and os.path.exists(f_fp_2) and os.path.samefile(f_fp_1, f_fp_2)
+
+
+def read_snapshot_metadata(f_fp_store: str, snapshot_id: int) -> dict:
+    with FingerPrintStore(f_fp_store, readonly=True) as fp_store:
+        return fp_store.get_snapshot_metadata(snapshot_id)
+
+
+def iter_fileinfo(f_fp_store: str, snapshot_id: int) -> Iterator['lib_data_structures.DataStructFileInfo']:
+    with FingerPrintStore(f_fp_store, readonly=True) as fp_store:
+        yield from fp_store.iter_fileinfo(snapshot_id)
+
+
+def iter_files_rows(f_fp_store: str, snapshot_id: int) -> Iterator[tuple]:
+    with FingerPrintStore(f_fp_store, readonly=True) as fp_store:
+        yield from fp_store.iter_files_rows(snapshot_id)
+
+
+def iter_registry_rows(f_fp_store: str, snapshot_id: int) -> Iterator[tuple]:
+    with FingerPrintStore(f_fp_store, readonly=True) as fp_store:
+        yield from fp_store.iter_registry_rows(snapshot_id)
+
+
+def get_fileinfo_from_row(row: tuple) -> 'lib_data_structures.DataStructFileInfo':
+    fileinfo = lib_data_structures.DataStructFileInfo()
+    fileinfo.path, fileinfo.size, fileinfo.created_ns, fileinfo.modified_ns, fileinfo.accessed_ns, fileinfo.hash, fileinfo.remark, fileinfo.link_group = row
+    return fileinfo
+
+
+def connect_diff(f_fp_1: str, f_fp_2: str) -> Tuple[FingerPrintStore, str]:
+    """ the store of fp2 (read only), with the store of fp1 attached read only if it is a different one - returns the store and the schema of fp1 """
+    fp_store = FingerPrintStore(f_fp_2, readonly=True)
+    if is_same_store(f_fp_1, f_fp_2):
+        return fp_store, 'main'
+    fp_store.connection.execute('ATTACH DATABASE ? AS fp1', (pathlib.Path(f_fp_1).resolve().as_uri() + '?mode=ro', ))
+    fp_store.check_schema_version('fp1', f_fp_1)
+    return fp_store, 'fp1'
+
+
+def iter_files_diff_candidates(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, compare_hashes: bool = True) \
+        -> Iterator[Tuple[Optional['lib_data_structures.DataStructFileInfo'], 'lib_data_structures.DataStructFileInfo']]:
+    """
+    the files of fp2 which are new or differ from fp1 in size, timestamps or hash, as (fileinfo fp1 or None, fileinfo fp2),
+    in the order of fp2. the changes are told apart by lib_diff_files.FileDiff.get_fileinfo_diff()
+    the columns are compared with IS NOT - a NULL on one side is a difference too
+
+    >>> f_fp_store = './testresults/fp_store_files_diff.sqlite'
+    >>> if os.path.exists(f_fp_store): os.remove(f_fp_store)
+    >>> with FingerPrintStore(f_fp_store) as fp_store:
+    ...     for file_hash in (None, 'e3b0c442'):
+    ...         snapshot_writer = fp_store.create_snapshot('files', {})
+    ...         fileinfo = lib_data_structures.DataStructFileInfo()
+    ...         fileinfo.path, fileinfo.size, fileinfo.hash = './testfiles/file1.txt', 3, file_hash
+    ...         snapshot_writer.write_fileinfo(fileinfo)
+    ...         snapshot_writer.close()
+    >>> [(fileinfo_fp_1.hash, fileinfo_fp_2.hash) for fileinfo_fp_1, fileinfo_fp_2 in iter_files_diff_candidates(f_fp_store, f_fp_store, 1, 2)]
+    [(None, 'e3b0c442')]
+    """
+    columns_1 = ', '.join('f1.' + column for column in FILES_COLUMNS)
+    columns_2 = ', '.join('f2.' + column for column in FILES_COLUMNS)
+    fp_store, schema_1 = connect_diff(f_fp_1, f_fp_2)
+    with fp_store:
+        cursor = fp_store.connection.execute(
+            'SELECT {columns_2}, f1.rowid IS NOT NULL, {columns_1} FROM main.files AS f2 '
+            'LEFT JOIN {schema_1}.files AS f1 ON f1.snapshot_id = ? AND f1.path = f2.path '
+            'WHERE f2.snapshot_id = ? AND (f1.rowid IS NULL OR f1.size IS NOT f2.size OR f1.created_ns IS NOT f2.created_ns '
+            'OR f1.modified_ns IS NOT f2.modified_ns OR (? AND f1.hash IS NOT f2.hash)) '
+            'ORDER BY f2.rowid'.format(columns_1=columns_1, columns_2=columns_2, schema_1=schema_1),
+            (snapshot_1, snapshot_2, compare_hashes))
+        n_columns = len(FILES_COLUMNS)
+        for row in cursor:
+            fileinfo_fp_1 = get_fileinfo_from_row(row[n_columns + 1:]) if row[n_columns] else None
+            yield fileinfo_fp_1, get_fileinfo_from_row(row[:n_columns])
+
+
+def iter_files_deleted(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int) -> Iterator['lib_data_structures.DataStructFileInfo']:
+    """ the files of fp1 which are not in fp2, in the order of fp1 """
+    fp_store, schema_1 = connect_diff(f_fp_1, f_fp_2)
+    with fp_store:
+        cursor = fp_store.connection.execute(
+            'SELECT {columns} FROM {schema_1}.files AS f1 WHERE f1.snapshot_id = ? AND NOT EXISTS '
+            '(SELECT 1 FROM main.files AS f2 WHERE f2.snapshot_id = ? AND f2.path = f1.path) '
+            'ORDER BY f1.rowid'.format(columns=', '.join('f1.' + column for column in FILES_COLUMNS), schema_1=schema_1),
+            (snapshot_1, snapshot_2))
+        for row in cursor:
+            yield get_fileinfo_from_row(row)
+
+
+def iter_registry_diff(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, check_modified: bool = False) -> Iterator[dict]:
+    """
+    the registry diff as indexed joins - rows with path, modified, value_name, value_type, value, change, value_old.
+    changed and added entries in the order of fp2, then the deleted entries in the order of fp1
+
+    >>> if os.path.exists('./testresults/fp_store_reg_diff.sqlite'): os.remove('./testresults/fp_store_reg_diff.sqlite')
+    >>> with FingerPrintStore('./testresults/fp_store_reg_diff.sqlite') as fp_store:
+    ...     snapshot_writer = fp_store.create_snapshot('registry', {})
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-14 22:49:05', '', 'KEY', '')
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-14 22:49:05', 'trial', 'RegSZ', 'active')
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-14 22:49:05', 'old', 'RegSZ', '1')
+    ...     snapshot_writer.close()
+    ...     snapshot_writer = fp_store.create_snapshot('registry', {})
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-15 10:00:00', '', 'KEY', '')
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-15 10:00:00', 'trial', 'RegSZ', 'ended')
+    ...     snapshot_writer.write_registry_row('HKLM\\\\SOFTWARE\\\\Test', '2018-11-15 10:00:00', 'new', 'RegDWord', '1')
+    ...     snapshot_writer.close()
+    >>> for dict_row in iter_registry_diff('./testresults/fp_store_reg_diff.sqlite', './testresults/fp_store_reg_diff.sqlite', 1, 2):
+    ...     dict_row['value_name'], dict_row['change'], dict_row['value_old']
+    ('trial', 'value changed', 'active')
+    ('new', 'ADDED', '')
+    ('old', 'DELETED', '')
+    """
+    columns_1 = ', '.join('r1.' + column for column in REGISTRY_COLUMNS)
+    columns_2 = ', '.join('r2.' + column for column in REGISTRY_COLUMNS)
+    fp_store, schema_1 = connect_diff(f_fp_1, f_fp_2)
+    with fp_store:
+        cursor = fp_store.connection.execute(
+            'SELECT {columns_2}, r1.rowid IS NOT NULL, {columns_1} FROM main.registry AS r2 '
+            'LEFT JOIN {schema_1}.registry AS r1 ON r1.snapshot_id = ? AND r1.path = r2.path AND r1.value_name = r2.value_name '
+            'WHERE r2.snapshot_id = ? AND (r1.rowid IS NULL OR r1.value_type IS NOT r2.value_type OR r1.value IS NOT r2.value '
+            'OR (? AND r1.modified IS NOT r2.modified)) '
+            'ORDER BY r2.rowid'.format(columns_1=columns_1, columns_2=columns_2, schema_1=schema_1),
+            (snapshot_1, snapshot_2, check_modified))
+        n_columns = len(REGISTRY_COLUMNS)
+        for row in cursor:
+            yield get_registry_diff_row(row[n_columns + 1:] if row[n_columns] else None, row[:n_columns], check_modified=check_modified)
+
+        cursor = fp_store.connection.execute(
+            'SELECT {columns_1} FROM {schema_1}.registry AS r1 WHERE r1.snapshot_id = ? AND NOT EXISTS '
+            '(SELECT 1 FROM main.registry AS r2 WHERE r2.snapshot_id = ? AND r2.path = r1.path AND r2.value_name = r1.value_name) '
+            'ORDER BY r1.rowid'.format(columns_1=columns_1, schema_1=schema_1),
+            (snapshot_1, snapshot_2))
+        for row in cursor:
+            yield get_registry_deleted_row(row)
+
+
+def get_registry_diff_row(row_1: Optional[tuple], row_2: tuple, check_modified: bool = False) -> dict:
+    """
+    the diff row for a registry row of fp2 - row_1 is None for new entries, the change is '' if nothing changed
+
+    >>> get_registry_diff_row(('HKLM\\Test', '2018-11-14', 'trial', 'RegSZ', 'active'), ('HKLM\\Test', '2018-11-15', 'trial', 'RegSZ', 'ended'))['change']
+    'value changed'
+    """
+    dict_row = dict(zip(REGISTRY_COLUMNS, row_2))
+    dict_row['value_old'] = ''
+    if row_1 is None:
+        dict_row['change'] = 'ADDED'
+        return dict_row
+    dict_row_1 = dict(zip(REGISTRY_COLUMNS, row_1))
+    l_changed = list()
+    if check_modified and dict_row_1['modified'] != dict_row['modified']:
+        l_changed.append('modified changed from {} to {}'.format(dict_row_1['modified'], dict_row['modified']))
+    if dict_row_1['value_type'] != dict_row['value_type']:
+        l_changed.append('value_type changed from {} to {}'.format(dict_row_1['value_type'], dict_row['value_type']))
+    if dict_row_1['value'] != dict_row['value']:
+        l_changed.append('value changed')
+        dict_row['value_old'] = dict_row_1['value']
+    dict_row['change'] = ', '.join(l_changed)
+    return dict_row
+
+
+def get_registry_deleted_row(row_1: tuple) -> dict:
+    dict_row = dict(zip(REGISTRY_COLUMNS, row_1))
+    dict_row['change'] = 'DELETED'
+    dict_row['value_old'] = ''
+    return dict_row
+
+
+def write_registry_diff(f_fp_1: str, f_fp_2: str, snapshot_1: int, snapshot_2: int, f_output: str, check_modified: bool = False,
+                        compress: str = '') -> int:
+    """
+    the registry diff csv, streamed from the joins - returns the number of rows
+
+    >>> write_registry_diff('./testresults/fp_store_reg_diff.sqlite', './testresults/fp_store_reg_diff.sqlite', 1, 2,
+    ...                     './testresults/fp_store_reg_diff.csv')
+    3
+    """
+    return write_registry_diff_rows(iter_registry_diff(f_fp_1, f_fp_2, snapshot_1, snapshot_2, check_modified=check_modified),
+                                    f_output, compress=compress)
+
+
+def write_registry_diff_rows(dict_rows: Iterator[dict], f_output: str, compress: str = '') -> int:
+    """ writes the registry diff csv - returns the number of rows """
+    n_rows = 0
+    with lib_compression.open_output(f_output, 'w', compress=compress) as f_out:
+        fieldnames = ['path', 'modified', 'value_name', 'value_type', 'value', 'change', 'value_old']
+        csv_writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        csv_writer.writeheader()
+        for dict_row in dict_rows:
+            csv_writer.writerow(dict_row)
+            n_rows += 1
+    return n_rows
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
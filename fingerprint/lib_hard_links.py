@@ -0,0 +1,175 @@
+import lib_data_structures
+import lib_doctest_pycharm
+import lib_hash
+import logging
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+InodeKey = Tuple[int, int]      # (st_dev, st_ino)
+FileRecord = Tuple[str, os.stat_result]
+
+
+class HardLinkIndex(object):
+    """
+    hashes every inode only once : the first link of an inode (st_nlink > 1) is fingerprinted as usual,
+    later links of the same inode are not handed to the workers - they get the hash of the first link.
+    a held back link keeps its position in the walk : it is released by the writer just before the next fingerprinted file,
+    so the order of the walk (sequential, mp_ordered) is preserved. the index lives in the main process, so it works with every scheduler.
+    the stat results need st_dev, st_ino and st_nlink - on windows the directory walk must use full_stat=True
+
+    >>> import lib_fp_files, test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> if os.path.exists('./testfiles/file1_hard_link.txt'): os.remove('./testfiles/file1_hard_link.txt')
+    >>> os.link('./testfiles/file1_no_changes.txt', './testfiles/file1_hard_link.txt')
+    >>> l_file_records = [(path, os.stat(path)) for path in ('./testfiles/file1_no_changes.txt', './testfiles/file1_hard_link.txt',
+    ...                                                     './testfiles/file3_change_data.txt')]
+    >>> hard_link_index = HardLinkIndex()
+    >>> l_fileinfo_written = list()
+    >>> for filename, stat_result in hard_link_index.filter_file_records(l_file_records):
+    ...     hard_link_index.release_links_before(filename)
+    ...     fileinfo = lib_fp_files.get_fileinfo(filename, stat_result=stat_result)
+    ...     hard_link_index.resolve(fileinfo, stat_result)
+    ...     l_fileinfo_written += hard_link_index.pop_ready() + [fileinfo] + hard_link_index.pop_ready()
+    >>> hard_link_index.release_remaining_links()
+    >>> l_fileinfo_written += hard_link_index.pop_ready()
+    >>> [os.path.basename(fileinfo.path) for fileinfo in l_fileinfo_written]
+    ['file1_no_changes.txt', 'file1_hard_link.txt', 'file3_change_data.txt']
+    >>> l_fileinfo_written[1].hash == l_fileinfo_written[0].hash, l_fileinfo_written[1].link_group == l_fileinfo_written[0].link_group != ''
+    (True, True)
+    >>> list(hard_link_index.dict_resolved.values()) == [(l_fileinfo_written[0].hash, l_fileinfo_written[0].link_group)]
+    True
+    >>> hard_link_index.n_links_reused
+    1
+    >>> os.remove('./testfiles/file1_hard_link.txt')
+    """
+    def __init__(self, hash_files: bool = True, hash_algo: str = lib_hash.HASH_ALGORITHM_DEFAULT):
+        self.hash_files = hash_files
+        self.hash_algo = hash_algo
+        self.dict_resolved: Dict[InodeKey, Tuple[str, str]] = dict()                            # inode -> (hash, link_group) of the first link
+        self.dict_pending: Dict[InodeKey, List[FileRecord]] = dict()                            # inode -> released links, waiting for the first one
+        self.dict_links_before: Dict[str, List[FileRecord]] = dict()                            # fingerprinted file -> links held back before it
+        self.l_links_held_back: List[FileRecord] = list()                                       # links since the last fingerprinted file
+        self.l_ready: List['lib_data_structures.DataStructFileInfo'] = list()
+        self.n_links_reused: int = 0
+        self.n_bytes_avoided: int = 0
+
+    def filter_file_records(self, file_records: Iterable[Tuple[str, Optional[os.stat_result]]]) -> Iterator[Tuple[str, Optional[os.stat_result]]]:
+        """ yields the file records which need to be fingerprinted, later links are held back """
+        for file_record in file_records:
+            inode_key = get_inode_key(file_record[1])
+            if inode_key is not None and (inode_key in self.dict_resolved or inode_key in self.dict_pending):
+                self.l_links_held_back.append(file_record)
+                continue
+            if inode_key is not None:
+                self.dict_pending[inode_key] = list()
+            if self.l_links_held_back:
+                self.dict_links_before[file_record[0]] = self.l_links_held_back
+                self.l_links_held_back = list()
+            yield file_record
+
+    def release_links_before(self, filename: str):
+        """ called by the writer before the fingerprinted file is written - the links held back in front of it are ready or wait for their first link """
+        for file_record in self.dict_links_before.pop(filename, list()):
+            self.release_link(file_record)
+
+    def release_remaining_links(self):
+        """ the links found after the last fingerprinted file """
+        l_file_records = self.l_links_held_back
+        for l_file_records_before in self.dict_links_before.values():
+            l_file_records += l_file_records_before
+        self.l_links_held_back = list()
+        self.dict_links_before = dict()
+        for file_record in l_file_records:
+            self.release_link(file_record)
+
+    def release_link(self, file_record: FileRecord):
+        inode_key = get_inode_key(file_record[1])
+        if inode_key in self.dict_resolved:
+            self.add_ready(file_record, self.dict_resolved[inode_key])
+        elif inode_key in self.dict_pending:
+            self.dict_pending[inode_key].append(file_record)
+        else:
+            # the first link vanished or could not be read - the link is hashed on its own
+            self.add_ready(file_record, hash_link_group=None)
+
+    def resolve(self, fileinfo: Optional['lib_data_structures.DataStructFileInfo'], stat_result: Optional[os.stat_result]):
+        """ called for every fingerprinted file - if it was the first link of an inode, the released links get its hash """
+        inode_key = get_inode_key(stat_result)
+        if inode_key is None:
+            return
+        l_file_records_pending = self.dict_pending.pop(inode_key, list())
+        if fileinfo is None or (self.hash_files and not fileinfo.hash):
+            # the first link vanished while we fingerprinted it or could not be read (rare) - the remaining links are hashed on their own
+            for file_record in l_file_records_pending:
+                self.add_ready(file_record, hash_link_group=None)
+            return
+        fileinfo.link_group = get_link_group(inode_key)
+        self.dict_resolved[inode_key] = (fileinfo.hash, fileinfo.link_group)
+        for file_record in l_file_records_pending:
+            self.add_ready(file_record, self.dict_resolved[inode_key])
+
+    def add_ready(self, file_record: FileRecord, hash_link_group: Optional[Tuple[str, str]]):
+        """ hash_link_group : (hash, link_group) of the first link, None if the link has to be hashed on its own """
+        filename, stat_result = file_record
+        fileinfo = lib_data_structures.DataStructFileInfo()
+        fileinfo.path = filename
+        fileinfo.set_stat_result(stat_result)
+        if hash_link_group is None:
+            if not self.hash_files:
+                if os.path.exists(filename):
+                    self.l_ready.append(fileinfo)
+                return
+            try:
+                fileinfo.hash = lib_hash.get_file_hash_preserve_access_dates(filename, stat_result=stat_result, hash_algo=self.hash_algo)
+            except FileNotFoundError:
+                return
+            except OSError:
+                fileinfo.remark = 'access denied'
+        else:
+            fileinfo.hash, fileinfo.link_group = hash_link_group
+            self.n_links_reused += 1
+            self.n_bytes_avoided += stat_result.st_size
+        self.l_ready.append(fileinfo)
+
+    def pop_ready(self) -> List['lib_data_structures.DataStructFileInfo']:
+        l_ready = self.l_ready
+        self.l_ready = list()
+        return l_ready
+
+    def log_statistics(self):
+        logger.info('hard links: {} links reused the hash of an already hashed inode, {:.1f} MiB of I/O avoided'.format(
+            self.n_links_reused, self.n_bytes_avoided / 1048576))
+
+
+def get_inode_key(stat_result: Optional[os.stat_result]) -> Optional[InodeKey]:
+    """
+    returns None for files without further hard links
+
+    >>> get_inode_key(None) is None
+    True
+    >>> get_inode_key(os.stat_result((0, 7, 3, 2, 0, 0, 0, 0, 0, 0)))
+    (3, 7)
+    >>> get_inode_key(os.stat_result((0, 7, 3, 1, 0, 0, 0, 0, 0, 0))) is None
+    True
+    """
+    if stat_result is None or stat_result.st_nlink < 2 or stat_result.st_ino == 0:
+        return None
+    return stat_result.st_dev, stat_result.st_ino
+
+
+def get_link_group(inode_key: InodeKey) -> str:
+    """
+    >>> get_link_group((3, 255))
+    '3:ff'
+    """
+    return '{:x}:{:x}'.format(*inode_key)
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
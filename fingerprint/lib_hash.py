@@ -1,11 +1,120 @@
 import hashlib
+import mmap
 import os
+import threading
 import time
 
+# blake2b is considerably faster then sha256 on 64 bit cpus without sha extensions, md5 and sha1 are good enough for change detection
+HASH_ALGORITHMS = ('sha256', 'blake2b', 'blake2s', 'sha1', 'md5')
+HASH_ALGORITHM_DEFAULT = 'sha256'
+
+BLOCK_SIZE_SMALL: int = 65536               # for files up to BLOCK_SIZE_THRESHOLD
+BLOCK_SIZE_LARGE: int = 1048576             # less syscalls for larger files
+BLOCK_SIZE_THRESHOLD: int = 1048576
+MMAP_THRESHOLD: int = 67108864              # files from 64 MiB are hashed from a memory map, without copying them into a buffer
+
+# one FileHasher (with its buffer) per thread, see get_file_hasher()
+thread_local_data = threading.local()
+
+
+class FileHasher(object):
+    """
+    hashes files without allocating a new bytes object for every block :
+    one preallocated buffer is filled with readinto() and passed to the hasher as memoryview,
+    large files are hashed directly from a memory map.
+    a FileHasher must not be shared between threads - use get_file_hasher()
+
+    >>> import test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> file_hasher = FileHasher()
+    >>> file_hasher.hash_file('./testfiles/file1_no_changes.txt')
+    'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+    >>> with open('./testfiles/file_hasher_test.bin', 'wb') as f_test:
+    ...     _ = f_test.write(b'0123456789' * 200000)
+    >>> file_hasher.hash_file('./testfiles/file_hasher_test.bin') == get_file_hash_blockiter('./testfiles/file_hasher_test.bin')
+    True
+    >>> file_hasher.hash_file('./testfiles/file_hasher_test.bin', size=MMAP_THRESHOLD) == get_file_hash_blockiter('./testfiles/file_hasher_test.bin')
+    True
+    >>> os.remove('./testfiles/file_hasher_test.bin')
+    """
+    def __init__(self):
+        self.buffer = bytearray(BLOCK_SIZE_LARGE)
+        self.buffer_view = memoryview(self.buffer)
+
+    def hash_file(self, fname: str, hash_algo: str = HASH_ALGORITHM_DEFAULT, size: int = -1) -> str:
+        """
+        size: the file size, if we know it already from the directory walk - otherwise it is taken from the open file
+        """
+        hasher = get_hasher(hash_algo)
+        with open(fname, 'rb', buffering=0) as f_in:
+            if size < 0:
+                size = os.fstat(f_in.fileno()).st_size
+            if size >= MMAP_THRESHOLD and self.update_from_mmap(hasher, f_in):
+                return hasher.hexdigest()
+            block_view = self.buffer_view[:get_block_size(size)]
+            n_bytes = f_in.readinto(block_view)
+            while n_bytes:
+                hasher.update(block_view[:n_bytes])
+                n_bytes = f_in.readinto(block_view)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def update_from_mmap(hasher, f_in) -> bool:
+        """ returns False if the file can not be mapped, then we read it the conventional way """
+        try:
+            with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                hasher.update(mapped_file)
+            return True
+        except (OSError, ValueError):
+            return False
+
+
+def get_file_hasher() -> FileHasher:
+    """
+    >>> get_file_hasher() is get_file_hasher()
+    True
+    """
+    file_hasher = getattr(thread_local_data, 'file_hasher', None)
+    if file_hasher is None:
+        file_hasher = FileHasher()
+        thread_local_data.file_hasher = file_hasher
+    return file_hasher
+
+
+def get_block_size(size: int) -> int:
+    """
+    >>> get_block_size(0)
+    65536
+    >>> get_block_size(100 * 1048576)
+    1048576
+    """
+    if size < BLOCK_SIZE_THRESHOLD:
+        return BLOCK_SIZE_SMALL
+    return BLOCK_SIZE_LARGE
+
+
+def get_hasher(hash_algo: str = HASH_ALGORITHM_DEFAULT):
+    """
+    >>> get_hasher('blake2b').name
+    'blake2b'
+    >>> get_hasher('whirlpool')
+    Traceback (most recent call last):
+        ...
+    ValueError: unsupported hash algorithm "whirlpool", supported: sha256, blake2b, blake2s, sha1, md5
+    """
+    if hash_algo not in HASH_ALGORITHMS:
+        raise ValueError('unsupported hash algorithm "{}", supported: {}'.format(hash_algo, ', '.join(HASH_ALGORITHMS)))
+    return hashlib.new(hash_algo)
+
 
 def hash_bytestr_iter(bytesiter, hasher, ashexstr=True):
+    """
+    >>> hash_bytestr_iter([b'some ', b'Data'], hashlib.md5())
+    'dcbdffaef5f005008816a23f52fce806'
+    """
     for block in bytesiter:
-        hasher.apt_update(block)
+        hasher.update(block)
     return hasher.hexdigest() if ashexstr else hasher.digest()
 
 
@@ -17,14 +126,22 @@ def file_as_blockiter(afile, blocksize=65536):
             block = afile.read(blocksize)
 
 
-def get_file_hash(fname: str):
-    result = hash_bytestr_iter(file_as_blockiter(open(fname, 'rb')), hashlib.sha256())
+def get_file_hash_blockiter(fname: str, hash_algo: str = HASH_ALGORITHM_DEFAULT):
+    """ the old generator based implementation - kept as reference for lib_benchmark """
+    result = hash_bytestr_iter(file_as_blockiter(open(fname, 'rb')), get_hasher(hash_algo))
+    return result
+
+
+def get_file_hash(fname: str, hash_algo: str = HASH_ALGORITHM_DEFAULT, size: int = -1):
+    result = get_file_hasher().hash_file(fname, hash_algo=hash_algo, size=size)
     return result
 
 
-def get_file_hash_preserve_access_dates(fname: str):
+def get_file_hash_preserve_access_dates(fname: str, stat_result: os.stat_result = None, hash_algo: str = HASH_ALGORITHM_DEFAULT):
     """
     :param fname:
+    :param stat_result: the stat result of the file, if we have it already from the directory walk
+    :param hash_algo: one of HASH_ALGORITHMS
     :return:
     >>> import os, test, time
     >>> timestamp = time.time()
@@ -35,10 +152,18 @@ def get_file_hash_preserve_access_dates(fname: str):
     >>> atime2 = os.path.getatime('./testfiles/file1_no_changes.txt')
     >>> atime1 == atime2
     True
+    >>> get_file_hash_preserve_access_dates('./testfiles/file1_no_changes.txt', stat_result=os.stat('./testfiles/file1_no_changes.txt'))
+    'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+    >>> atime1 == os.path.getatime('./testfiles/file1_no_changes.txt')
+    True
+    >>> get_file_hash_preserve_access_dates('./testfiles/file1_no_changes.txt', hash_algo='md5')
+    'd41d8cd98f00b204e9800998ecf8427e'
     """
-    atime, mtime = get_atime_mtime(fname)   # preserve access and modify dates
-    result = get_file_hash(fname)
-    set_atime_mtime(fname, atime, mtime)    # preserve access and modify dates
+    if stat_result is None:
+        stat_result = os.stat(fname)
+    result = get_file_hash(fname, hash_algo=hash_algo, size=stat_result.st_size)
+    # preserve access and modify dates - nanoseconds, so we dont lose precision
+    os.utime(fname, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
     return result
 
 
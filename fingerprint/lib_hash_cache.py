@@ -0,0 +1,227 @@
+import lib_doctest_pycharm
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# (st_dev, st_ino, size, mtime_ns, ctime_ns) - if one of them changes, the file has to be hashed again
+HashCacheKey = Tuple[int, int, int, int, int]
+HashCacheEntry = Tuple[HashCacheKey, str]
+
+HASH_CACHE_SCHEMA_VERSION: int = 2
+HASH_CACHE_FLUSH_ENTRIES: int = 10000
+
+# one read only connection per worker process and thread, see get_process_hash_cache()
+dict_process_hash_caches: Dict[Tuple[str, str, int], 'HashCache'] = dict()
+
+
+class HashCache(object):
+    """
+    persistent cache of file hashes, stored in a sqlite database.
+    a cached hash is only used if device, inode, size, modification and change (creation on windows) time are unchanged,
+    and if it was made with the same hash algorithm.
+    new entries are buffered and written in batches - in multiprocessing the workers open the cache read only,
+    hand their new entries back to the main process (pop_pending) and only the main process writes them (add_pending, flush).
+    every entry which is used or stored gets the timestamp of the current run, evict() removes the least recently used entries.
+
+    >>> import test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> stat_result = os.stat('./testfiles/file1_no_changes.txt')
+    >>> if os.path.exists('./testresults/fp_hash_cache_test.sqlite'): os.remove('./testresults/fp_hash_cache_test.sqlite')
+    >>> with HashCache('./testresults/fp_hash_cache_test.sqlite') as hash_cache:
+    ...     hash_cache.lookup(stat_result) is None
+    ...     hash_cache.store(stat_result, 'e3b0c4')
+    ...     hash_cache.flush()
+    ...     hash_cache.lookup(stat_result)
+    ...     hash_cache.n_hits, hash_cache.n_misses
+    True
+    'e3b0c4'
+    (1, 1)
+
+    >>> # a read only cache, like the multiprocessing workers use it
+    >>> with HashCache('./testresults/fp_hash_cache_test.sqlite', readonly=True) as hash_cache:
+    ...     hash_cache.lookup(stat_result)
+    'e3b0c4'
+
+    >>> # a different hash algorithm does not match
+    >>> with HashCache('./testresults/fp_hash_cache_test.sqlite', hash_algo='blake2b') as hash_cache:
+    ...     hash_cache.lookup(stat_result) is None
+    True
+
+    >>> # rehash - the cache is not consulted, but refreshed
+    >>> with HashCache('./testresults/fp_hash_cache_test.sqlite', rehash=True) as hash_cache:
+    ...     hash_cache.lookup(stat_result) is None
+    True
+    """
+
+    def __init__(self, db_path: str, readonly: bool = False, rehash: bool = False, hash_algo: str = 'sha256'):
+        self.db_path = db_path
+        self.hash_algo = hash_algo
+        self.readonly = readonly
+        self.rehash = rehash
+        self.run_timestamp: int = int(time.time())
+        self.n_hits: int = 0
+        self.n_misses: int = 0
+        self.l_pending: List[HashCacheEntry] = list()
+        self.connection = self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            db_uri = pathlib.Path(self.db_path).resolve().as_uri() + '?mode=ro'
+            connection = sqlite3.connect(db_uri, uri=True)
+        else:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute('PRAGMA journal_mode=WAL')     # readers in the worker processes do not block the writer
+            self.create_schema(connection)
+        return connection
+
+    @staticmethod
+    def create_schema(connection: sqlite3.Connection):
+        schema_version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if schema_version != HASH_CACHE_SCHEMA_VERSION:
+            # it is a cache - we just start over
+            connection.execute('DROP TABLE IF EXISTS hash_cache')
+        connection.execute('CREATE TABLE IF NOT EXISTS hash_cache '
+                           '(st_dev INTEGER, st_ino INTEGER, size INTEGER, mtime_ns INTEGER, ctime_ns INTEGER, hash_algo TEXT, '
+                           'digest TEXT, last_used INTEGER)')
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS hash_cache_key ON hash_cache (st_dev, st_ino, size, mtime_ns, ctime_ns, hash_algo)')
+        connection.execute('CREATE INDEX IF NOT EXISTS hash_cache_last_used ON hash_cache (last_used)')
+        connection.execute('PRAGMA user_version = {}'.format(HASH_CACHE_SCHEMA_VERSION))
+        connection.commit()
+
+    def lookup(self, stat_result: os.stat_result) -> Optional[str]:
+        digest = None
+        if not self.rehash:
+            row = self.connection.execute('SELECT digest FROM hash_cache '
+                                          'WHERE st_dev=? AND st_ino=? AND size=? AND mtime_ns=? AND ctime_ns=? AND hash_algo=?',
+                                          get_hash_cache_key(stat_result) + (self.hash_algo, )).fetchone()
+            if row is not None:
+                digest = row[0]
+        if digest is None:
+            self.n_misses += 1
+        else:
+            self.n_hits += 1
+            self.store(stat_result, digest)      # refresh last_used
+        return digest
+
+    def store(self, stat_result: os.stat_result, digest: str):
+        self.l_pending.append((get_hash_cache_key(stat_result), digest))
+        if not self.readonly and len(self.l_pending) >= HASH_CACHE_FLUSH_ENTRIES:
+            self.flush()
+
+    def pop_pending(self) -> List[HashCacheEntry]:
+        l_pending = self.l_pending
+        self.l_pending = list()
+        return l_pending
+
+    def add_pending(self, l_entries: List[HashCacheEntry]):
+        self.l_pending.extend(l_entries)
+        if len(self.l_pending) >= HASH_CACHE_FLUSH_ENTRIES:
+            self.flush()
+
+    def flush(self):
+        if self.readonly or not self.l_pending:
+            return
+        l_rows = [key + (self.hash_algo, digest, self.run_timestamp) for key, digest in self.pop_pending()]
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO hash_cache (st_dev, st_ino, size, mtime_ns, ctime_ns, hash_algo, digest, last_used) '
+                                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', l_rows)
+
+    def evict(self, max_entries: int) -> int:
+        """
+        removes the least recently used entries, so that not more then max_entries remain
+
+        >>> if os.path.exists('./testresults/fp_hash_cache_evict.sqlite'): os.remove('./testresults/fp_hash_cache_evict.sqlite')
+        >>> with HashCache('./testresults/fp_hash_cache_evict.sqlite') as hash_cache:
+        ...     hash_cache.add_pending([((0, n, 0, 0, 0), 'digest') for n in range(10)])
+        ...     hash_cache.flush()
+        ...     hash_cache.evict(max_entries=4)
+        ...     hash_cache.get_n_entries()
+        6
+        4
+        """
+        if self.readonly:
+            return 0
+        self.flush()
+        n_excess = self.get_n_entries() - max_entries
+        if n_excess <= 0:
+            return 0
+        with self.connection:
+            self.connection.execute('DELETE FROM hash_cache WHERE rowid IN (SELECT rowid FROM hash_cache ORDER BY last_used LIMIT ?)', (n_excess, ))
+        return n_excess
+
+    def get_n_entries(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM hash_cache').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def get_process_hash_cache(db_path: str, rehash: bool = False, hash_algo: str = 'sha256') -> HashCache:
+    """
+    the read only hash cache of the current (worker) process - opened once per process, not once per task.
+    sqlite connections can not be shared between threads, so threads get their own connection
+
+    >>> get_process_hash_cache('./testresults/fp_hash_cache_test.sqlite') is get_process_hash_cache('./testresults/fp_hash_cache_test.sqlite')
+    True
+    """
+    key = (db_path, hash_algo, threading.get_ident())
+    if key not in dict_process_hash_caches:
+        dict_process_hash_caches[key] = HashCache(db_path=db_path, readonly=True, rehash=rehash, hash_algo=hash_algo)
+    return dict_process_hash_caches[key]
+
+
+def get_hash_cache_key(stat_result: os.stat_result) -> HashCacheKey:
+    """
+    >>> stat_result = os.stat_result((0, 2 ** 64 - 1, 2, 1, 0, 0, 10, 0, 0, 0, 0.0, 0.0, 0.0, 3, 4, 5))
+    >>> get_hash_cache_key(stat_result)
+    (2, -1, 10, 4, 5)
+    """
+    return (get_sqlite_int(stat_result.st_dev), get_sqlite_int(stat_result.st_ino), stat_result.st_size,
+            stat_result.st_mtime_ns, stat_result.st_ctime_ns)
+
+
+def get_sqlite_int(value: int) -> int:
+    """
+    sqlite integers are signed 64 bit - device and inode numbers might be unsigned 64 bit (or even wider on ReFS)
+
+    >>> get_sqlite_int(5)
+    5
+    >>> get_sqlite_int(2 ** 63)
+    -9223372036854775808
+    """
+    value = value % (1 << 64)
+    if value >= (1 << 63):
+        value = value - (1 << 64)
+    return value
+
+
+def is_stat_result_cacheable(stat_result: Optional[os.stat_result]) -> bool:
+    """
+    on windows DirEntry.stat() returns st_ino = 0 - without the inode the key is not reliable
+
+    >>> is_stat_result_cacheable(None)
+    False
+    >>> is_stat_result_cacheable(os.stat('.'))
+    True
+    """
+    return stat_result is not None and stat_result.st_ino != 0
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
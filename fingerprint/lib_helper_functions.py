@@ -3,6 +3,7 @@ import datetime
 from lib_fp_files import *
 import lib_doctest_pycharm
 import logging
+import math
 import os
 from pathlib import Path
 import sys
@@ -32,6 +33,30 @@ def convert_float_to_datetime(time_float:float)->datetime.datetime:
     """
     return datetime.datetime.fromtimestamp(time_float)
 
+def convert_ns_to_float(time_ns:int)->float:
+    """
+    the same float as os.stat_result.st_mtime for os.stat_result.st_mtime_ns
+
+    >>> convert_ns_to_float(1542221218076271000)
+    1542221218.076271
+    """
+    seconds, nanoseconds = divmod(time_ns, 1000000000)
+    return seconds + nanoseconds * 1E-9
+
+
+def convert_float_to_ns(time_float:float)->int:
+    """
+    seconds and fraction are converted separately - a float rounded to microseconds survives the round trip
+
+    >>> convert_float_to_ns(1542221218.076271)
+    1542221218076271057
+    >>> convert_ns_to_float(convert_float_to_ns(1542221218.076271))
+    1542221218.076271
+    """
+    seconds = math.floor(time_float)
+    return int(seconds) * 1000000000 + round((time_float - seconds) * 1E9)
+
+
 def convert_datetime_or_datestr_to_float(time_datetime:Union[datetime.datetime,str])->float:
     """
     >>> convert_datetime_or_datestr_to_float("2018-11-14 19:46:58.076271")
@@ -111,6 +136,35 @@ def inform_if_not_run_as_admin(exit_if_not_admin: bool = False, interactive: boo
             sys.exit(1)
 
 
+def get_peak_rss_bytes() -> int:
+    """
+    the peak resident set size (peak working set on windows) of this process in bytes, 0 if it can not be determined
+
+    >>> get_peak_rss_bytes() > 0
+    True
+    """
+    if sys.platform == 'win32':                     # mypy skips the windows branch on other platforms
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong)] + \
+                       [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                                                             'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                                                             'PagefileUsage', 'PeakPagefileUsage')]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        h_process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(h_process, ctypes.byref(counters), counters.cb):
+            return 0
+        return int(counters.PeakWorkingSetSize)
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':                    # bytes on macos, kilobytes everywhere else
+        return max_rss
+    return max_rss * 1024
+
+
 def log_exception_traceback(s_error: str = '', log_level: int = logging.WARNING, log_level_traceback: int = logging.DEBUG, flush_handlers: bool = False) -> str:
     s_message = s_error
     if s_error:
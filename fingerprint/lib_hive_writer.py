@@ -0,0 +1,193 @@
+import lib_doctest_pycharm
+import logging
+import struct
+from typing import Iterable, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# writes registry hive files (regf) - synthetic hives for tests and benchmarks, the hives of a live system are saved with "reg save".
+# the keys come in depth first order as (depth, name, values), the root has depth 0, values are (name, type, raw data).
+# one hbin holds all cells : nk (key), vk (value), value lists and lh subkey lists (ri index lists for more than LH_MAX_KEYS subkeys).
+# values bigger than MAX_DATA_SIZE are split into segments of a db record.
+# the subkeys are listed in the order they come - windows expects them sorted by their upper case name.
+
+FILETIME_DEFAULT: int = 131000000000000000     # 2016-02-13, 100 ns since 1601-01-01
+HBIN_HEADER_SIZE: int = 0x20
+LH_MAX_KEYS: int = 1012                         # subkeys per lh list, more are split into lh lists of an ri index list
+MAX_DATA_SIZE: int = 0x3fd8                     # bigger values are stored in db records, in segments of this size
+NO_OFFSET: int = 0xFFFFFFFF
+
+# value types, see winnt.h
+REG_NONE, REG_SZ, REG_EXPAND_SZ, REG_BINARY, REG_DWORD, REG_MULTI_SZ, REG_QWORD = 0, 1, 2, 3, 4, 7, 11
+
+RegistryValueRaw = Tuple[str, int, bytes]
+
+
+class HiveWriter(object):
+    """
+    >>> import os, tempfile
+    >>> f_hive = os.path.join(tempfile.mkdtemp(), 'test.hive')
+    >>> with HiveWriter(f_hive) as hive_writer:
+    ...     hive_writer.add_key(0, 'ROOT', [])
+    ...     hive_writer.add_key(1, 'Software', [('Version', REG_SZ, encode_sz('1.0')), ('Count', REG_DWORD, struct.pack('<I', 3))])
+    ...     hive_writer.add_key(2, 'Vendor', [('', REG_BINARY, bytes(range(16)))])
+    ...     hive_writer.add_key(1, 'System', [])
+    >>> from Registry import Registry
+    >>> key_root = Registry.Registry(f_hive).root()
+    >>> [key.path() for key in key_root.subkeys()]
+    ['ROOT\\\\Software', 'ROOT\\\\System']
+    >>> [(value.name(), value.value()) for value in key_root.subkeys()[0].values()]
+    [('Version', '1.0'), ('Count', 3)]
+    >>> key_root.subkeys()[0].subkeys()[0].values()[0].value() == bytes(range(16))
+    True
+
+    >>> # big values in db records
+    >>> with HiveWriter(f_hive) as hive_writer:
+    ...     hive_writer.add_key(0, 'ROOT', [('Big', REG_BINARY, bytes(range(256)) * 200)])
+    >>> Registry.Registry(f_hive).root().values()[0].value() == bytes(range(256)) * 200
+    True
+    """
+    def __init__(self, f_hive: str, timestamp: int = FILETIME_DEFAULT):
+        self.f_hive = f_hive
+        self.timestamp = timestamp
+        self.hbin = bytearray(HBIN_HEADER_SIZE)
+        self.offset_root: int = -1
+        # the open keys from the root to the last key : (offset of the nk cell, [(offset, name) of its subkeys so far])
+        self.l_stack: List[Tuple[int, List[Tuple[int, str]]]] = list()
+        self.n_keys: int = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def add_key(self, depth: int, name: str, l_values: Iterable[RegistryValueRaw]):
+        if depth > len(self.l_stack) or (depth == 0) != (self.offset_root < 0):
+            raise ValueError('key "{}" at depth {}: the keys must come in depth first order, starting with one root'.format(name, depth))
+        while len(self.l_stack) > depth:
+            self.close_key()
+        offset_nk = self.add_nk(name, l_values, is_root=depth == 0)
+        if depth == 0:
+            self.offset_root = offset_nk
+        else:
+            self.l_stack[-1][1].append((offset_nk, name))
+        self.l_stack.append((offset_nk, list()))
+        self.n_keys += 1
+
+    def add_nk(self, name: str, l_values: Iterable[RegistryValueRaw], is_root: bool) -> int:
+        b_name, is_ascii = encode_name(name)
+        l_offsets_vk = [self.add_vk(*value) for value in l_values]
+        offset_values = self.add_cell(b''.join(struct.pack('<I', offset) for offset in l_offsets_vk)) if l_offsets_vk else NO_OFFSET
+        flags = (0x20 if is_ascii else 0) | (0x2C if is_root else 0)
+        offset_parent = self.l_stack[-1][0] if self.l_stack else NO_OFFSET
+        nk = struct.pack('<2sHQIIIIIIIIIIIIIIIHH', b'nk', flags, self.timestamp, 0, offset_parent, 0, 0, NO_OFFSET, NO_OFFSET,
+                         len(l_offsets_vk), offset_values, NO_OFFSET, NO_OFFSET, 0, 0, 0, 0, 0, len(b_name), 0)
+        return self.add_cell(nk + b_name)
+
+    def add_vk(self, name: str, value_type: int, data: bytes) -> int:
+        b_name, is_ascii = encode_name(name)
+        if len(data) <= 4:
+            # resident data, in the offset field
+            size, data_field = 0x80000000 | len(data), data.ljust(4, b'\x00')
+        elif len(data) > MAX_DATA_SIZE:
+            size, data_field = len(data), struct.pack('<I', self.add_db(data))
+        else:
+            size, data_field = len(data), struct.pack('<I', self.add_cell(data))
+        vk = struct.pack('<2sHI4sIHH', b'vk', len(b_name), size, data_field, value_type, 1 if is_ascii else 0, 0)
+        return self.add_cell(vk + b_name)
+
+    def add_db(self, data: bytes) -> int:
+        l_offsets_segments = [self.add_cell(data[index:index + MAX_DATA_SIZE]) for index in range(0, len(data), MAX_DATA_SIZE)]
+        offset_segments = self.add_cell(b''.join(struct.pack('<I', offset) for offset in l_offsets_segments))
+        return self.add_cell(struct.pack('<2sHI', b'db', len(l_offsets_segments), offset_segments))
+
+    def close_key(self):
+        offset_nk, l_subkeys = self.l_stack.pop()
+        if not l_subkeys:
+            return
+        if len(l_subkeys) <= LH_MAX_KEYS:
+            offset_list = self.add_lh(l_subkeys)
+        else:
+            l_offsets_lh = [self.add_lh(l_subkeys[index:index + LH_MAX_KEYS]) for index in range(0, len(l_subkeys), LH_MAX_KEYS)]
+            offset_list = self.add_cell(struct.pack('<2sH', b'ri', len(l_offsets_lh)) + b''.join(struct.pack('<I', offset) for offset in l_offsets_lh))
+        max_name_length = max(len(encode_name(name)[0]) for _, name in l_subkeys)
+        # nk cell data : subkey count at 0x14, subkey list at 0x1C, maximum subkey name length at 0x34
+        offset_data = offset_nk + 4
+        struct.pack_into('<I', self.hbin, offset_data + 0x14, len(l_subkeys))
+        struct.pack_into('<I', self.hbin, offset_data + 0x1C, offset_list)
+        struct.pack_into('<I', self.hbin, offset_data + 0x34, max_name_length)
+
+    def add_lh(self, l_subkeys: List[Tuple[int, str]]) -> int:
+        lh = struct.pack('<2sH', b'lh', len(l_subkeys)) + b''.join(struct.pack('<II', offset, get_lh_hash(name)) for offset, name in l_subkeys)
+        return self.add_cell(lh)
+
+    def add_cell(self, data: bytes) -> int:
+        """ the offset of the new cell, relative to the first hbin - cells are 8 byte aligned, the size is negative for allocated cells """
+        offset = len(self.hbin)
+        size = (len(data) + 4 + 7) & ~7
+        self.hbin += struct.pack('<i', -size) + data + bytes(size - 4 - len(data))
+        return offset
+
+    def close(self):
+        while self.l_stack:
+            self.close_key()
+        # the rest of the hbin (4 KiB blocks) is one free cell
+        size_free = -len(self.hbin) % 0x1000
+        if size_free:
+            self.hbin += struct.pack('<i', size_free) + bytes(size_free - 4)
+        struct.pack_into('<4sIIQQI', self.hbin, 0, b'hbin', 0, len(self.hbin), 0, self.timestamp, 0)
+        with open(self.f_hive, 'wb') as f_out:
+            f_out.write(get_base_block(self.offset_root, len(self.hbin), self.timestamp))
+            f_out.write(self.hbin)
+
+
+def get_base_block(offset_root: int, hbins_size: int, timestamp: int) -> bytes:
+    base_block = bytearray(0x1000)
+    struct.pack_into('<4sIIQIIIIIII', base_block, 0, b'regf', 1, 1, timestamp, 1, 5, 0, 1, offset_root, hbins_size, 1)
+    checksum = 0
+    for offset in range(0, 0x1FC, 4):
+        checksum ^= struct.unpack_from('<I', base_block, offset)[0]
+    struct.pack_into('<I', base_block, 0x1FC, checksum or 1)
+    return bytes(base_block)
+
+
+def encode_name(name: str) -> Tuple[bytes, bool]:
+    """
+    names in latin-1 are stored as single bytes (compressed), others as utf-16le
+
+    >>> encode_name('Software'), encode_name('Ω')
+    ((b'Software', True), (b'\\xa9\\x03', False))
+    """
+    try:
+        return name.encode('latin-1'), True
+    except UnicodeEncodeError:
+        return name.encode('utf-16le'), False
+
+
+def encode_sz(value: str) -> bytes:
+    """
+    >>> encode_sz('ab')
+    b'a\\x00b\\x00\\x00\\x00'
+    """
+    return (value + '\x00').encode('utf-16le')
+
+
+def get_lh_hash(name: str) -> int:
+    """
+    the name hash of lh subkey lists
+
+    >>> get_lh_hash('Software')
+    3925742691
+    """
+    name_hash = 0
+    for char in name.upper():
+        name_hash = (name_hash * 37 + ord(char)) & 0xFFFFFFFF
+    return name_hash
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
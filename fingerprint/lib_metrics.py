@@ -0,0 +1,148 @@
+import heapq
+import json
+import lib_doctest_pycharm
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+METRICS_PHASES = ('walk', 'stat', 'hash', 'write', 'sort')
+N_SLOWEST_FILES: int = 10
+
+
+class FPMetrics(object):
+    """
+    throughput instrumentation of a fingerprint run - a progress line every progress_interval seconds while running,
+    a report at the end, optionally written as json (fp files --metrics_out), so scan performance can be tracked over time.
+
+    phases (seconds, summed over all threads and processes working on that phase) :
+        walk  : listing the directories (main process)
+        stat  : stat of the files during the walk (main process)
+        hash  : fingerprinting the files, including the hash cache lookups (workers)
+        write : writing the fingerprint (main process)
+    bytes_hashed : the size of the files which went through the hashing (hash cache hits included, reused hard links not)
+    worker_utilization : busy time of the workers / (elapsed time * number of workers)
+    queue_depth : the number of submitted but not yet written tasks, sampled whenever a task is submitted
+
+    >>> metrics = FPMetrics(n_workers=2, progress_interval=0)
+    >>> metrics.add_phase_seconds('walk', 0.5)
+    >>> metrics.add_file('./a.txt', size=100, seconds=0.2)
+    >>> metrics.add_file('./b.txt', size=300, seconds=0.1)
+    >>> metrics.add_file('./b_hard_link.txt', size=300, seconds=0.0, hashed=False)
+    >>> metrics.add_worker_busy_seconds(0.3)
+    >>> metrics.sample_queue_depth(4)
+    >>> metrics.sample_queue_depth(2)
+    >>> metrics.stop()
+    >>> dict_report = metrics.get_report()
+    >>> dict_report['n_files'], dict_report['bytes_hashed'], dict_report['phase_seconds']['hash'], dict_report['queue_depth']
+    (3, 400, 0.3, {'max': 4, 'mean': 3.0})
+    >>> [dict_file['path'] for dict_file in dict_report['slowest_files']]
+    ['./a.txt', './b.txt']
+    """
+    def __init__(self, n_workers: int = 1, progress_interval: float = 10.0, n_slowest: int = N_SLOWEST_FILES):
+        self.n_workers = max(1, n_workers)
+        self.progress_interval = progress_interval        # seconds, 0 = no progress line
+        self.n_slowest = n_slowest
+        self.time_start: float = time.perf_counter()
+        self.time_stop: float = 0.0
+        self.time_last_progress: float = self.time_start
+        self.n_files: int = 0
+        self.n_bytes_hashed: int = 0
+        self.dict_phase_seconds: Dict[str, float] = dict.fromkeys(METRICS_PHASES, 0.0)
+        self.worker_busy_seconds: float = 0.0
+        self.queue_depth_max: int = 0
+        self.queue_depth_sum: int = 0
+        self.n_queue_depth_samples: int = 0
+        self.queue_depth_last: int = 0
+        self.l_slowest_files: List[Tuple[float, str, int]] = list()     # min heap of (seconds, path, size)
+
+    def add_phase_seconds(self, phase: str, seconds: float):
+        self.dict_phase_seconds[phase] += seconds
+
+    def add_file(self, path: str, size: int, seconds: float, hashed: bool = True):
+        """ one fingerprinted file - seconds it took to fingerprint it """
+        self.n_files += 1
+        if hashed:
+            self.n_bytes_hashed += size
+        self.dict_phase_seconds['hash'] += seconds
+        if seconds > 0:
+            if len(self.l_slowest_files) < self.n_slowest:
+                heapq.heappush(self.l_slowest_files, (seconds, path, size))
+            elif seconds > self.l_slowest_files[0][0]:
+                heapq.heapreplace(self.l_slowest_files, (seconds, path, size))
+        self.maybe_log_progress()
+
+    def add_worker_busy_seconds(self, seconds: float):
+        self.worker_busy_seconds += seconds
+
+    def sample_queue_depth(self, queue_depth: int):
+        self.queue_depth_last = queue_depth
+        self.queue_depth_max = max(self.queue_depth_max, queue_depth)
+        self.queue_depth_sum += queue_depth
+        self.n_queue_depth_samples += 1
+
+    def maybe_log_progress(self):
+        if not self.progress_interval:
+            return
+        now = time.perf_counter()
+        if now - self.time_last_progress >= self.progress_interval:
+            self.time_last_progress = now
+            self.log_progress()
+
+    def log_progress(self):
+        seconds = self.get_elapsed_seconds()
+        logger.info('progress: {} files, {:.1f} MiB hashed in {:.0f} seconds, {:.1f} files/s, {:.1f} MiB/s, queue depth {}'.format(
+            self.n_files, self.n_bytes_hashed / 1048576, seconds, self.n_files / seconds, self.n_bytes_hashed / 1048576 / seconds,
+            self.queue_depth_last))
+
+    def stop(self):
+        self.time_stop = time.perf_counter()
+
+    def get_elapsed_seconds(self) -> float:
+        time_stop = self.time_stop or time.perf_counter()
+        return max(time_stop - self.time_start, 1e-6)
+
+    def get_report(self) -> dict:
+        seconds = self.get_elapsed_seconds()
+        dict_report: Dict[str, Any] = dict()
+        dict_report['timestamp'] = time.time()
+        dict_report['seconds'] = round(seconds, 3)
+        dict_report['n_files'] = self.n_files
+        dict_report['bytes_hashed'] = self.n_bytes_hashed
+        dict_report['files_per_second'] = round(self.n_files / seconds, 1)
+        dict_report['bytes_hashed_per_second'] = round(self.n_bytes_hashed / seconds)
+        dict_report['phase_seconds'] = {phase: round(phase_seconds, 3) for phase, phase_seconds in self.dict_phase_seconds.items()}
+        dict_report['n_workers'] = self.n_workers
+        dict_report['worker_utilization'] = round(self.worker_busy_seconds / (seconds * self.n_workers), 3)
+        dict_report['queue_depth'] = {'max': self.queue_depth_max,
+                                      'mean': round(self.queue_depth_sum / max(self.n_queue_depth_samples, 1), 1)}
+        dict_report['slowest_files'] = [{'path': path, 'size': size, 'seconds': round(file_seconds, 3)}
+                                        for file_seconds, path, size in sorted(self.l_slowest_files, reverse=True)]
+        return dict_report
+
+    def log_report(self, dict_report: dict):
+        logger.info('{} files, {:.1f} MiB hashed in {:.1f} seconds : {} files/s, {:.1f} MiB/s'.format(
+            dict_report['n_files'], dict_report['bytes_hashed'] / 1048576, dict_report['seconds'], dict_report['files_per_second'],
+            dict_report['bytes_hashed_per_second'] / 1048576))
+        logger.info('phase seconds : {}'.format(', '.join('{} {:.1f}'.format(phase, seconds) for phase, seconds in dict_report['phase_seconds'].items())))
+        logger.info('workers : {}, utilization {:.0%}, queue depth max {} mean {}'.format(
+            dict_report['n_workers'], dict_report['worker_utilization'], dict_report['queue_depth']['max'], dict_report['queue_depth']['mean']))
+        for dict_file in dict_report['slowest_files'][:3]:
+            logger.info('slow file : {:.2f} seconds, {:.1f} MiB, {}'.format(dict_file['seconds'], dict_file['size'] / 1048576, dict_file['path']))
+
+
+def write_metrics_report(f_metrics: str, dict_report: dict):
+    """
+    >>> write_metrics_report('./testresults/fp_files_metrics.json', {'n_files': 1})
+    >>> json.load(open('./testresults/fp_files_metrics.json'))
+    {'n_files': 1}
+    """
+    with open(f_metrics, 'w', encoding='utf-8') as f_out:
+        json.dump(dict_report, f_out, indent=4)
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
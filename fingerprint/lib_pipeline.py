@@ -0,0 +1,94 @@
+import collections
+import concurrent.futures
+import lib_doctest_pycharm
+import logging
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+
+def iter_batches(iterable: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    >>> list(iter_batches(range(7), batch_size=3))
+    [[0, 1, 2], [3, 4, 5], [6]]
+    >>> list(iter_batches([], batch_size=3))
+    []
+    """
+    batch = list()
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def bounded_executor_map(executor: concurrent.futures.Executor,
+                         function: Callable,
+                         batches: Iterable[List],
+                         max_in_flight: int,
+                         ordered: bool = False,
+                         queue_depth_callback: Optional[Callable[[int], None]] = None,
+                         **kwargs) -> Iterator[Tuple[List, Any]]:
+    """
+    submits function(batch, **kwargs) for every batch to the executor and yields (batch, result) as the results come in.
+    batches are consumed lazily - never more than max_in_flight batches are submitted but not yet yielded,
+    so neither the pending futures nor the pickled arguments can pile up in memory.
+    ordered: the results are yielded in the order of the batches - the window of submitted futures works as reorder buffer,
+             finished batches wait there until all batches before them are yielded.
+    queue_depth_callback: called with the number of submitted but not yet yielded batches, after new batches were submitted
+
+    >>> def square_batch(batch, offset=0):
+    ...     return [item * item + offset for item in batch]
+
+    >>> with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+    ...     l_results = list(bounded_executor_map(executor, square_batch, iter_batches(range(10), 3), max_in_flight=2, ordered=True, offset=1))
+    >>> l_results
+    [([0, 1, 2], [1, 2, 5]), ([3, 4, 5], [10, 17, 26]), ([6, 7, 8], [37, 50, 65]), ([9], [82])]
+
+    >>> with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+    ...     l_results = list(bounded_executor_map(executor, square_batch, iter_batches(range(10), 3), max_in_flight=2))
+    >>> sorted(l_results)
+    [([0, 1, 2], [0, 1, 4]), ([3, 4, 5], [9, 16, 25]), ([6, 7, 8], [36, 49, 64]), ([9], [81])]
+
+    >>> l_queue_depths = list()
+    >>> with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+    ...     l_results = list(bounded_executor_map(executor, square_batch, iter_batches(range(10), 3), max_in_flight=2,
+    ...                                           queue_depth_callback=l_queue_depths.append))
+    >>> max(l_queue_depths)
+    2
+    """
+    max_in_flight = max(1, max_in_flight)
+    batch_iterator = iter(batches)
+    dict_futures: 'collections.OrderedDict[concurrent.futures.Future, Any]' = collections.OrderedDict()    # future -> batch, in order of submission
+    batches_exhausted = False
+
+    while True:
+        while not batches_exhausted and len(dict_futures) < max_in_flight:
+            batch = next(batch_iterator, None)
+            if batch is None:
+                batches_exhausted = True
+            else:
+                dict_futures[executor.submit(function, batch, **kwargs)] = batch
+
+        if queue_depth_callback is not None:
+            queue_depth_callback(len(dict_futures))
+
+        if not dict_futures:
+            break
+
+        if ordered:
+            future, batch = dict_futures.popitem(last=False)
+            yield batch, future.result()
+        else:
+            done, not_done = concurrent.futures.wait(dict_futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                batch = dict_futures.pop(future)
+                yield batch, future.result()
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
@@ -0,0 +1,151 @@
+import collections
+import lib_doctest_pycharm
+import lib_detect_encoding
+import logging
+from typing import Dict, List, Tuple, Union
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# decoding of the registry values the backend can not decode (python-registry value(), lib_regf.get_value_data),
+# dispatched on the value type instead of a charset detection of every failing value :
+#   string types : utf-16le if the data looks like it, code units that can not be decoded are replaced. otherwise an 8 bit string :
+#                  the encoding is detected on a sample of the data and cached for the key subtree, the next values there try it first
+#   other types  : hex
+# a value decoded here is counted by type and decoding, the counts are logged once at the end - no traceback per value
+
+SAMPLE_SIZE: int = 4096             # bytes the encoding is detected on
+SUBTREE_DEPTH: int = 4              # the detected encodings are cached per subtree of this depth, e.g. HKLM\SOFTWARE\Vendor\Product
+ENCODING_CACHE_SIZE: int = 256      # subtrees in the cache, the oldest one is dropped
+STRING_TYPES = ('RegSZ', 'RegExpandSZ', 'RegMultiSZ')
+
+
+class DecodeStats(object):
+    """
+    the values decoded by ValueDecoder by (value type, decoding), with the first key of each - the workers of
+    lib_fp_registry_parallel return them with their RegistryStats
+
+    >>> decode_stats, decode_stats_2 = DecodeStats(), DecodeStats()
+    >>> decode_stats.add('RegSZ', 'utf-16le', 'key_a')
+    >>> decode_stats_2.add('RegSZ', 'utf-16le', 'key_b')
+    >>> decode_stats_2.add('RegBin', 'hex', 'key_c')
+    >>> decode_stats.merge(decode_stats_2)
+    >>> decode_stats.counter, decode_stats.dict_first_keys
+    (Counter({('RegSZ', 'utf-16le'): 2, ('RegBin', 'hex'): 1}), {('RegSZ', 'utf-16le'): 'key_a', ('RegBin', 'hex'): 'key_c'})
+    """
+    def __init__(self):
+        self.counter: collections.Counter = collections.Counter()
+        self.dict_first_keys: Dict[Tuple[str, str], str] = dict()
+        self.n_detections: int = 0
+
+    def add(self, value_type: str, decoding: str, key_path: str):
+        self.counter[(value_type, decoding)] += 1
+        self.dict_first_keys.setdefault((value_type, decoding), key_path)
+
+    def merge(self, decode_stats: 'DecodeStats'):
+        """ adds the stats of the next hive """
+        self.counter.update(decode_stats.counter)
+        for type_decoding, key_path in decode_stats.dict_first_keys.items():
+            self.dict_first_keys.setdefault(type_decoding, key_path)
+        self.n_detections += decode_stats.n_detections
+
+    def log(self):
+        if not self.counter:
+            return
+        logger.warning('{} registry values could not be decoded by the registry backend, decoded by their type ({} charset detections):'.format(
+            sum(self.counter.values()), self.n_detections))
+        for (value_type, decoding), n_values in self.counter.most_common():
+            logger.warning('    {} {} values as {}, first key: {}'.format(n_values, value_type, decoding, self.dict_first_keys[(value_type, decoding)]))
+
+
+class ValueDecoder(object):
+    """
+    >>> value_decoder = ValueDecoder()
+    >>> # utf-16le with a lone surrogate and an odd length
+    >>> value_decoder.decode('HKLM\\\\SOFTWARE\\\\Vendor', 'RegSZ', 'abc'.encode('utf-16le') + b'\\x00\\xd8x\\x00\\x00\\x00!')
+    'abc\\ufffdx'
+    >>> value_decoder.decode('HKLM\\\\SOFTWARE\\\\Vendor', 'RegMultiSZ', 'a\\x00b\\x00'.encode('utf-16le') + b'\\x00\\xdc')
+    ['a', 'b', '\\ufffd']
+    >>> value_decoder.decode('HKLM\\\\SOFTWARE\\\\Vendor', 'Unknown type: 0x12', b'\\x01\\x02\\xff')
+    '0102ff'
+
+    >>> # 8 bit strings take the encoding cached for their subtree
+    >>> value_decoder.dict_encodings['HKLM\\\\SOFTWARE\\\\Vendor\\\\Product'] = 'windows-1252'
+    >>> value_decoder.decode('HKLM\\\\SOFTWARE\\\\Vendor\\\\Product\\\\Settings', 'RegSZ', 'café crème'.encode('windows-1252') + b'\\x00')
+    'café crème'
+    >>> value_decoder.decode_stats.counter  # doctest: +NORMALIZE_WHITESPACE
+    Counter({('RegSZ', 'utf-16le'): 1, ('RegMultiSZ', 'utf-16le'): 1, ('Unknown type: 0x12', 'hex'): 1, ('RegSZ', 'windows-1252'): 1})
+    """
+    def __init__(self):
+        self.decode_stats = DecodeStats()
+        # subtree path : the encoding last detected there
+        self.dict_encodings: Dict[str, str] = dict()
+
+    def decode(self, key_path: str, value_type: str, raw_data: bytes) -> Union[str, List[str]]:
+        """ the value as python-registry would return it for its type : a list of strings for RegMultiSZ, otherwise a string """
+        if value_type not in STRING_TYPES:
+            self.decode_stats.add(value_type, 'hex', key_path)
+            return raw_data.hex()
+        if is_utf16(raw_data[:SAMPLE_SIZE]):
+            decoding = 'utf-16le'
+            # an odd last byte is dropped
+            text = raw_data[:len(raw_data) & ~1].decode('utf-16-le', errors='replace')
+        else:
+            decoding, text = self.decode_8bit(key_path, raw_data)
+        self.decode_stats.add(value_type, decoding, key_path)
+        if value_type == 'RegMultiSZ':
+            return text.split('\x00')
+        return text.partition('\x00')[0]
+
+    def decode_8bit(self, key_path: str, raw_data: bytes) -> Tuple[str, str]:
+        """
+        (decoding, text) - the encoding cached for the subtree of the key, or the one detected on a sample.
+        an encoding python does not know is not cached, the value falls back to hex
+
+        >>> value_decoder = ValueDecoder()
+        >>> get_file_encoding, lib_detect_encoding.get_file_encoding = lib_detect_encoding.get_file_encoding, lambda sample: 'x-unknown'
+        >>> value_decoder.dict_encodings['HKLM\\\\SOFTWARE\\\\Vendor\\\\Product'] = 'x-unknown'
+        >>> value_decoder.decode_8bit('HKLM\\\\SOFTWARE\\\\Vendor\\\\Product\\\\Settings', b'caf\\xe9\\x00')
+        ('hex', '636166e900')
+        >>> value_decoder.dict_encodings
+        {}
+        >>> lib_detect_encoding.get_file_encoding = get_file_encoding
+        """
+        subtree = '\\'.join(key_path.split('\\', SUBTREE_DEPTH)[:SUBTREE_DEPTH])
+        encoding = self.dict_encodings.get(subtree)
+        if encoding:
+            try:
+                return encoding, raw_data.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                del self.dict_encodings[subtree]
+        encoding = lib_detect_encoding.get_file_encoding(raw_data[:SAMPLE_SIZE])
+        self.decode_stats.n_detections += 1
+        try:
+            text = raw_data.decode(encoding)
+            decoding = encoding
+        except UnicodeDecodeError:
+            # the sample did not tell the whole story
+            text = raw_data.decode(encoding, errors='replace')
+            decoding = encoding + ' with replacement characters'
+        except LookupError:
+            return 'hex', raw_data.hex()
+        if len(self.dict_encodings) >= ENCODING_CACHE_SIZE:
+            del self.dict_encodings[next(iter(self.dict_encodings))]
+        self.dict_encodings[subtree] = encoding
+        return decoding, text
+
+
+def is_utf16(sample: bytes) -> bool:
+    """
+    text in utf-16le has a zero in every second byte, at least for the most part - 8 bit strings only have one at the end
+
+    >>> is_utf16('Software'.encode('utf-16le')), is_utf16(b'Software\\x00'), is_utf16(b'')
+    (True, False, False)
+    """
+    high_bytes = sample[1::2]
+    return bool(high_bytes) and high_bytes.count(0) * 2 >= len(high_bytes)
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
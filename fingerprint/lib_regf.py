@@ -0,0 +1,316 @@
+import datetime
+import lib_doctest_pycharm
+import logging
+import mmap
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+from Registry import SettingsParse
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# a lean reader for registry hive files (regf) - the mmap backend of the registry fingerprint (fp reg --reg_backend=mmap).
+# the hive is mapped, not read into memory, and the cells are read where they are : nk (key), vk (value), the value lists
+# and the subkey lists lf, lh, li and ri. a key is a tuple (raw path, timestamp, offset), a value a tuple (name, type, raw data),
+# no objects per key or value, the paths are built from the path of the parent. the values of a key are read on request,
+# the keys of a walk can be skipped by their path and timestamp without touching their values.
+#
+# the raw data of a value and its decoding (get_value_data) are the ones of python-registry (RegistryValue.raw_data() and .value()),
+# including its quirks, so both backends write the same fingerprint. the AppContainer types of settings.dat (0x101 - 0x11F)
+# are decoded with the SettingsParse module of python-registry.
+#
+# offsets in the cells are relative to the first hbin at 0x1000, a cell starts with its size (negative if allocated)
+
+HBIN_START: int = 0x1000
+BIG_DATA_SEGMENT: int = 0x3fd8          # values bigger than this are stored in db records, in segments of this size
+RESIDENT: int = 0x80000000              # data length flag : the data is in the data offset field of the vk record
+NO_COUNT: int = 0xFFFFFFFF
+
+# value types, see winnt.h
+REG_NONE, REG_SZ, REG_EXPAND_SZ, REG_BINARY, REG_DWORD, REG_DWORD_BIG_ENDIAN, REG_LINK, REG_MULTI_SZ = 0, 1, 2, 3, 4, 5, 6, 7
+REG_RESOURCE_LIST, REG_FULL_RESOURCE_DESCRIPTOR, REG_RESOURCE_REQUIREMENTS_LIST, REG_QWORD, REG_FILETIME = 8, 9, 10, 11, 16
+VALUE_TYPE_MASK: int = 0xFFF
+# the type names of python-registry
+VALUE_TYPE_NAMES = {REG_NONE: 'RegNone', REG_SZ: 'RegSZ', REG_EXPAND_SZ: 'RegExpandSZ', REG_BINARY: 'RegBin', REG_DWORD: 'RegDWord',
+                    REG_DWORD_BIG_ENDIAN: 'RegBigEndian', REG_LINK: 'RegLink', REG_MULTI_SZ: 'RegMultiSZ', REG_RESOURCE_LIST: 'RegResourceList',
+                    REG_FULL_RESOURCE_DESCRIPTOR: 'RegFullResourceDescriptor', REG_RESOURCE_REQUIREMENTS_LIST: 'RegResourceRequirementsList',
+                    REG_QWORD: 'RegQWord', REG_FILETIME: 'RegFileTime'}
+# the AppContainer types of settings.dat
+APPCONTAINER_TYPE_NAMES = ['RegUint8', 'RegInt16', 'RegUint16', 'RegInt32', 'RegUint32', 'RegInt64', 'RegUint64', 'RegFloat', 'RegDouble',
+                           'RegUnicodeChar', 'RegBoolean', 'RegUnicodeString', 'RegCompositeValue', 'RegDateTimeOffset', 'RegTimeSpan', 'RegGUID',
+                           'RegUnk111', 'RegUnk112', 'RegUnk113', 'RegBytesArray', 'RegInt16Array', 'RegUint16Array', 'RegInt32Array',
+                           'RegUInt32Array', 'RegInt64Array', 'RegUInt64Array', 'RegFloatArray', 'RegDoubleArray', 'RegUnicodeCharArray',
+                           'RegBooleanArray', 'RegUnicodeStringArray']
+VALUE_TYPE_NAMES.update({0x101 + index: name for index, name in enumerate(APPCONTAINER_TYPE_NAMES)})
+APPCONTAINER_TYPES = range(0x101, 0x101 + len(APPCONTAINER_TYPE_NAMES))
+
+RegfValue = Tuple[str, int, bytes]                  # name ('' for the default value), type, raw data
+RegfKey = Tuple[str, int, int]                      # raw path (starting with the name of the root key), FILETIME, offset of the nk record
+
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
+
+
+class RegfParseError(Exception):
+    pass
+
+
+class RegfUnknownTypeError(Exception):
+    pass
+
+
+class RegfHive(object):
+    """
+    >>> regf_hive = RegfHive('./testfiles_source/test_registry_hklm_sam.hive')
+    >>> l_keys = list(regf_hive.iter_keys())
+    >>> len(l_keys), l_keys[0][0], l_keys[1][0]
+    (82, 'ROOT', 'ROOT\\\\SAM')
+
+    >>> # the same keys, timestamps and values as python-registry
+    >>> from Registry import Registry
+    >>> def iter_keys_recursive(key):
+    ...     yield key
+    ...     for subkey in key.subkeys():
+    ...         yield from iter_keys_recursive(subkey)
+    >>> key_root = Registry.Registry('./testfiles_source/test_registry_hklm_sam.hive').root()
+    >>> l_keys_python_registry = [(key.path(), key.timestamp(), [(value.name(), value.value_type_str(), value.raw_data(), value.value())
+    ...                            for value in key.values()]) for key in iter_keys_recursive(key_root)]
+    >>> l_keys_regf = [(key_path, get_datetime(timestamp), [(value_name or '(default)', get_value_type_name(value_type), raw_data,
+    ...                 get_value_data(value_type, raw_data)) for value_name, value_type, raw_data in regf_hive.get_key_values(offset_nk)])
+    ...                for key_path, timestamp, offset_nk in l_keys]
+    >>> l_keys_regf == l_keys_python_registry
+    True
+    >>> regf_hive.close()
+    """
+    def __init__(self, f_hive: str):
+        self.f_hive = f_hive
+        with open(f_hive, 'rb') as f_in:
+            self.buffer = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[0:4] != b'regf':
+            self.buffer.close()
+            raise RegfParseError('{} is not a registry hive'.format(f_hive))
+        self.offset_root: int = self.get_record(self.unpack_dword(0x24), b'nk')
+        self.dict_subkeys: Dict[str, Dict[str, int]] = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.buffer.close()
+
+    def unpack_dword(self, offset: int) -> int:
+        return struct.unpack_from('<I', self.buffer, offset)[0]
+
+    def get_record(self, offset_cell: int, record_id: bytes) -> int:
+        """ the offset of the record in the cell, relative to the first hbin """
+        offset_record = HBIN_START + offset_cell + 4
+        if self.buffer[offset_record:offset_record + 2] != record_id:
+            raise RegfParseError('{}: no {} record at 0x{:x}'.format(self.f_hive, record_id.decode(), offset_record))
+        return offset_record
+
+    def iter_keys(self, offset_nk: int = 0, key_path_parent: str = '', max_depth: int = 512) -> Iterator[RegfKey]:
+        """
+        the keys depth first, each key before its subkeys - the subtree of the key at offset_nk, default the whole hive.
+        key_path_parent : the raw path of the parent of that key
+        """
+        l_stack: List[Tuple[Iterator[int], str]] = [(iter([offset_nk or self.offset_root]), key_path_parent)]
+        depth_parent = key_path_parent.count('\\') + 1 if key_path_parent else 0
+        while l_stack:
+            offsets_nk, key_path_parent = l_stack[-1]
+            offset_nk = next(offsets_nk, None)
+            if offset_nk is None:
+                l_stack.pop()
+                continue
+            timestamp = struct.unpack_from('<Q', self.buffer, offset_nk + 0x4)[0]
+            n_subkeys, _, offset_subkeys = struct.unpack_from('<III', self.buffer, offset_nk + 0x14)
+            key_path = key_path_parent + '\\' + self.get_key_name(offset_nk) if key_path_parent else self.get_key_name(offset_nk)
+            yield key_path, timestamp, offset_nk
+            if n_subkeys in (0, NO_COUNT):
+                continue
+            if depth_parent + len(l_stack) > max_depth:
+                logger.warning('registry key "{}" is nested deeper than {} levels - the hive is damaged, subkeys skipped'.format(key_path, max_depth))
+                continue
+            l_stack.append((self.iter_subkeys(offset_subkeys), key_path))
+
+    def get_key_name(self, offset_nk: int) -> str:
+        name_length = struct.unpack_from('<H', self.buffer, offset_nk + 0x48)[0]
+        name = self.buffer[offset_nk + 0x4C:offset_nk + 0x4C + name_length]
+        # flags 0x20 : the name is stored in single bytes
+        return name.decode('windows-1252') if self.buffer[offset_nk + 0x2] & 0x20 else name.decode('utf-16le')
+
+    def iter_subkeys(self, offset_list: int) -> Iterator[int]:
+        """ the offsets of the nk records of a subkey list - lf and lh with name hints, li without, ri is a list of lists """
+        offset_record = HBIN_START + offset_list + 4
+        list_id = self.buffer[offset_record:offset_record + 2]
+        n_items = struct.unpack_from('<H', self.buffer, offset_record + 2)[0]
+        if list_id in (b'lf', b'lh'):
+            for offset_cell in struct.unpack_from('<{}I'.format(2 * n_items), self.buffer, offset_record + 4)[::2]:
+                yield self.get_record(offset_cell, b'nk')
+        elif list_id == b'li':
+            for offset_cell in struct.unpack_from('<{}I'.format(n_items), self.buffer, offset_record + 4):
+                yield self.get_record(offset_cell, b'nk')
+        elif list_id == b'ri':
+            for offset_cell in struct.unpack_from('<{}I'.format(n_items), self.buffer, offset_record + 4):
+                yield from self.iter_subkeys(offset_cell)
+        else:
+            raise RegfParseError('{}: unsupported subkey list {!r} at 0x{:x}'.format(self.f_hive, list_id, offset_record))
+
+    def get_key_values(self, offset_nk: int) -> List[RegfValue]:
+        """ the values of the key at offset_nk """
+        n_values, offset_list = struct.unpack_from('<II', self.buffer, offset_nk + 0x24)
+        if n_values in (0, NO_COUNT):
+            return list()
+        l_values = list()
+        for offset_cell in struct.unpack_from('<{}I'.format(n_values), self.buffer, HBIN_START + offset_list + 4):
+            offset_vk = self.get_record(offset_cell, b'vk')
+            name_length, data_length, data_offset, value_type, flags = struct.unpack_from('<HIIIH', self.buffer, offset_vk + 0x2)
+            name_raw = self.buffer[offset_vk + 0x14:offset_vk + 0x14 + name_length]
+            name = name_raw.decode('windows-1252') if flags & 1 else name_raw.decode('utf-16le')
+            value_type &= VALUE_TYPE_MASK
+            l_values.append((name, value_type, self.get_raw_data(offset_vk, value_type, data_length, data_offset)))
+        return l_values
+
+    def get_raw_data(self, offset_vk: int, value_type: int, data_length: int, data_offset: int) -> bytes:
+        """ the raw data like python-registry reads it (VKRecord.raw_data) - for some types more or less than the data length """
+        buffer = self.buffer
+        offset_field = offset_vk + 0x8
+        # python-registry takes the field as a cell if the length is below 5 without the resident flag
+        offset_data = offset_field if data_length < 5 or data_length >= RESIDENT else HBIN_START + data_offset
+        if value_type == REG_DWORD:
+            return buffer[offset_field:offset_field + 4]
+        if value_type in (REG_QWORD, REG_DWORD_BIG_ENDIAN):
+            return buffer[offset_data + 4:offset_data + 4 + (8 if value_type == REG_QWORD else 4)]
+        if value_type == REG_FILETIME:
+            return buffer[offset_data + 4:offset_data + 4 + data_length]
+        if value_type in (REG_SZ, REG_EXPAND_SZ) and data_length >= RESIDENT:
+            return buffer[offset_field:offset_field + 4]
+        if value_type == REG_MULTI_SZ and data_length >= RESIDENT:
+            return b''
+        if value_type not in VALUE_TYPE_NAMES and (data_length < 5 or data_length >= RESIDENT):
+            return buffer[offset_field:offset_field + 4]
+        if data_length >= RESIDENT:
+            return buffer[offset_field:offset_field + data_length - RESIDENT]
+        if data_length > BIG_DATA_SEGMENT:
+            return self.get_big_data(offset_data, data_length)
+        return buffer[offset_data + 4:offset_data + 4 + data_length]
+
+    def get_big_data(self, offset_data: int, data_length: int) -> bytes:
+        """ a db record : a list of segments of BIG_DATA_SEGMENT bytes - other cells are taken as they are """
+        buffer = self.buffer
+        if buffer[offset_data + 4:offset_data + 6] != b'db':
+            return buffer[offset_data + 4:offset_data + 4 + min(data_length, get_cell_size(buffer, offset_data))]
+        offset_segments = HBIN_START + self.unpack_dword(offset_data + 8) + 4
+        l_segments = list()
+        n_segment = 0
+        while data_length > 0:
+            offset_segment = HBIN_START + self.unpack_dword(offset_segments + 4 * n_segment)
+            size = min(BIG_DATA_SEGMENT, data_length, get_cell_size(buffer, offset_segment))
+            l_segments.append(buffer[offset_segment + 4:offset_segment + 4 + size])
+            n_segment += 1
+            data_length -= min(BIG_DATA_SEGMENT, data_length)
+        return b''.join(l_segments)
+
+    def find_key(self, key_path: str) -> int:
+        """
+        the offset of the nk record of a raw key path - the path starts with the name of the root key. the subkeys of a parent
+        are indexed by their exact name when the first of them is looked up
+
+        >>> with RegfHive('./testfiles_source/test_registry_hklm_sam.hive') as regf_hive:
+        ...     l_keys = list(regf_hive.iter_keys(regf_hive.find_key('ROOT\\\\SAM\\\\Domains'), key_path_parent='ROOT\\\\SAM'))
+        >>> l_keys[0][0], l_keys[1][0]
+        ('ROOT\\\\SAM\\\\Domains', 'ROOT\\\\SAM\\\\Domains\\\\Account')
+        """
+        key_path_parent, _, name = key_path.rpartition('\\')
+        if not key_path_parent:
+            return self.offset_root
+        if key_path_parent not in self.dict_subkeys:
+            n_subkeys, _, offset_subkeys = struct.unpack_from('<III', self.buffer, self.find_key(key_path_parent) + 0x14)
+            offsets_nk = self.iter_subkeys(offset_subkeys) if n_subkeys not in (0, NO_COUNT) else iter([])
+            self.dict_subkeys[key_path_parent] = {self.get_key_name(offset_nk): offset_nk for offset_nk in offsets_nk}
+        return self.dict_subkeys[key_path_parent][name]
+
+
+def get_cell_size(buffer: mmap.mmap, offset_cell: int) -> int:
+    """ the size stored in the cell header, including the header - it is negative for allocated cells """
+    return abs(struct.unpack_from('<i', buffer, offset_cell)[0])
+
+
+def get_value_type_name(value_type: int) -> str:
+    """
+    >>> get_value_type_name(REG_SZ), get_value_type_name(0x12)
+    ('RegSZ', 'Unknown type: 0x12')
+    """
+    return VALUE_TYPE_NAMES.get(value_type) or 'Unknown type: {}'.format(hex(value_type))
+
+
+def get_value_data(value_type: int, raw_data: bytes):
+    """
+    the value like python-registry decodes it (RegistryValue.value)
+
+    >>> get_value_data(REG_SZ, 'abc'.encode('utf-16le') + bytes(4)), get_value_data(REG_DWORD, bytes([1, 0, 0, 0]))
+    ('abc', 1)
+    >>> get_value_data(REG_MULTI_SZ, 'a\\x00b\\x00\\x00'.encode('utf-16le')), get_value_data(REG_BINARY, b'\\x01')
+    (['a', 'b', '', ''], b'\\x01')
+    >>> get_value_data(0x12, bytes(8))
+    Traceback (most recent call last):
+        ...
+    lib_regf.RegfUnknownTypeError: unknown value type 0x12
+    """
+    if value_type in (REG_SZ, REG_EXPAND_SZ):
+        return decode_sz(raw_data)
+    if value_type in (REG_NONE, REG_BINARY, REG_LINK, REG_RESOURCE_LIST, REG_FULL_RESOURCE_DESCRIPTOR, REG_RESOURCE_REQUIREMENTS_LIST):
+        return raw_data
+    if value_type == REG_DWORD:
+        return struct.unpack_from('<I', raw_data)[0]
+    if value_type == REG_MULTI_SZ:
+        return raw_data.decode('utf16').split('\x00')
+    if value_type == REG_QWORD:
+        return struct.unpack_from('<Q', raw_data)[0]
+    if value_type == REG_DWORD_BIG_ENDIAN:
+        return struct.unpack_from('>I', raw_data)[0]
+    if value_type in APPCONTAINER_TYPES:
+        # the data ends with a timestamp
+        return SettingsParse.ParseAppDataCompositeValue(value_type & 0xEFF, raw_data[:-8], len(raw_data[:-8]))
+    if value_type == REG_FILETIME:
+        return get_datetime(struct.unpack_from('<Q', raw_data)[0])
+    if len(raw_data) == 4:
+        # unknown types with resident data - read from the data offset field
+        return struct.unpack_from('<I', raw_data)[0]
+    raise RegfUnknownTypeError('unknown value type 0x{:x}'.format(value_type))
+
+
+def decode_sz(raw_data: bytes) -> str:
+    """
+    a string value up to the first null character - the terminator is searched like python-registry does it,
+    it is not always aligned to two bytes
+
+    >>> decode_sz('abc'.encode('utf-16le') + bytes(2) + 'garbage'.encode('utf-16le')), decode_sz(b'a\\x00b')
+    ('abc', 'ab')
+    """
+    index = raw_data.find(b'\x00\x00')
+    if index > 2:
+        raw_data = raw_data[:index + 2] if raw_data[index - 2] != 0 else raw_data[:index + 3]
+    if len(raw_data) % 2:
+        raw_data += b'\x00'
+    return raw_data.decode('utf16').partition('\x00')[0]
+
+
+def get_datetime(filetime: int) -> datetime.datetime:
+    """
+    a FILETIME (100 ns since 1601-01-01) in microseconds, rounded half to even like python-registry
+
+    >>> get_datetime(131000000000000005), get_datetime(131000000000000015)
+    (datetime.datetime(2016, 2, 15, 8, 53, 20), datetime.datetime(2016, 2, 15, 8, 53, 20, 2))
+    """
+    microseconds, remainder = divmod(filetime, 10)
+    if remainder > 5 or (remainder == 5 and microseconds % 2):
+        microseconds += 1
+    return FILETIME_EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
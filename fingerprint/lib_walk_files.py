@@ -0,0 +1,191 @@
+import lib_doctest_pycharm
+import lib_metrics
+import lib_walk_rules
+import logging
+import os
+import stat
+import time
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# a file record is the path of the file and its stat result - the stat result is None if the file could not be stat'ed (access denied)
+FileRecord = Tuple[str, Optional[os.stat_result]]
+
+
+def iter_file_records(fp_dir: str, full_stat: bool = False, walk_rules: Optional[lib_walk_rules.WalkRules] = None,
+                      metrics: Optional[lib_metrics.FPMetrics] = None) -> Iterator[FileRecord]:
+    """
+    walks fp_dir with os.scandir and yields a (path, stat_result) record for every file - directories are not yielded.
+    the stat result is taken from the DirEntry, on windows it comes for free with the directory listing,
+    on posix it is one os.stat per file. the files and the order are the same as glob.iglob(fp_dir + '**', recursive=True),
+    depth first, subdirectories are descended as soon as they are found :
+    names starting with '.' are skipped, symlinks to directories are followed - but not into a directory we are already in,
+    so we can not run into loops.
+    full_stat: on windows the stat result of a DirEntry has st_ino, st_dev and st_nlink set to zero -
+               if we need them (hash cache), the file is os.stat'ed once.
+    walk_rules: excluded directories are not descended, excluded files are not stat'ed, see lib_walk_rules
+    metrics: the time spent listing directories and stat'ing files is added to the phases 'walk' and 'stat'
+
+    >>> import test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> l_file_records = list(iter_file_records('./testfiles/'))
+    >>> sorted([os.path.basename(path) for path, stat_result in l_file_records])  # doctest: +NORMALIZE_WHITESPACE
+    ['file1_no_changes.txt', 'file3_change_data.txt', 'file4_change_data_silently.txt', 'file5_change_creation_date.txt',
+     'file6_change_modified_date.txt', 'file7_change_accessed_date.txt', 'file8_deleted.txt', ...]
+    >>> all([stat_result.st_mtime == round(timestamp, 6) for path, stat_result in l_file_records if path.endswith('.txt')])
+    True
+    >>> list(iter_file_records('./does_not_exist/'))
+    []
+    >>> walk_rules = lib_walk_rules.WalkRules(l_exclude=['file3*'], l_include=['*.txt'])
+    >>> l_file_records = list(iter_file_records('./testfiles/', walk_rules=walk_rules))
+    >>> len(l_file_records), walk_rules.l_rules[0].n_files_matched
+    (6, 1)
+
+    >>> # like glob : no dot files, symlinked directories followed, a symlink loop is not followed
+    >>> import shutil
+    >>> shutil.rmtree('./testresults/walk_test', ignore_errors=True)
+    >>> for dir_path in ('./testresults/walk_test/dir/.hidden', './testresults/walk_test/linked'):
+    ...     os.makedirs(dir_path)
+    >>> for f_path in ('dir/file.txt', 'dir/.dot.txt', 'dir/.hidden/file.txt', 'linked/file.txt'):
+    ...     open(os.path.join('./testresults/walk_test', f_path), 'w').close()
+    >>> os.symlink(os.path.abspath('./testresults/walk_test/linked'), './testresults/walk_test/dir/link', target_is_directory=True)
+    >>> os.symlink(os.path.abspath('./testresults/walk_test/dir'), './testresults/walk_test/dir/loop', target_is_directory=True)
+    >>> import glob
+    >>> l_paths_glob = [path for path in glob.iglob('./testresults/walk_test/**', recursive=True) if os.path.isfile(path)]
+    >>> l_paths = [path.replace('\\\\', '/') for path, stat_result in iter_file_records('./testresults/walk_test/')]
+    >>> sorted(l_paths)
+    ['./testresults/walk_test/dir/file.txt', './testresults/walk_test/dir/link/file.txt', './testresults/walk_test/linked/file.txt']
+    >>> set(l_paths) <= set(path.replace('\\\\', '/') for path in l_paths_glob)
+    True
+    >>> shutil.rmtree('./testresults/walk_test')
+    """
+    l_dir_iterators = list()
+    # (st_dev, st_ino) of the directories we are in - a symlinked directory among them is a loop, None = could not be stat'ed
+    l_dir_ids: List[Optional[Tuple[int, int]]] = list()
+    dir_iterator = get_dir_iterator(fp_dir)
+    if dir_iterator is not None:
+        l_dir_iterators.append(dir_iterator)
+        l_dir_ids.append(get_dir_id(fp_dir))
+
+    while l_dir_iterators:
+        dir_iterator = l_dir_iterators[-1]
+        time_start = time.perf_counter()
+        try:
+            dir_entry = next(dir_iterator, None)
+        except OSError:
+            # the directory became unreadable while we iterate it
+            dir_entry = None
+        if metrics is not None:
+            metrics.add_phase_seconds('walk', time.perf_counter() - time_start)
+        if dir_entry is None:
+            dir_iterator.close()
+            l_dir_iterators.pop()
+            l_dir_ids.pop()
+            continue
+
+        if dir_entry.name.startswith('.'):
+            # glob skips hidden names
+            continue
+
+        if is_dir_entry_directory(dir_entry):
+            if walk_rules is not None and walk_rules.is_dir_excluded(lib_walk_rules.get_rel_path(fp_dir, dir_entry.path)):
+                continue
+            dir_id = get_dir_id(dir_entry.path) if dir_entry.is_symlink() else get_dir_entry_id(dir_entry)
+            if dir_id is not None and dir_id in l_dir_ids:
+                logger.debug('symlink loop, not followed: {}'.format(dir_entry.path))
+                continue
+            dir_iterator = get_dir_iterator(dir_entry.path)
+            if dir_iterator is not None:
+                l_dir_iterators.append(dir_iterator)
+                l_dir_ids.append(dir_id)
+            continue
+
+        if walk_rules is not None and walk_rules.is_file_excluded(lib_walk_rules.get_rel_path(fp_dir, dir_entry.path)):
+            continue
+        time_start = time.perf_counter()
+        file_record = get_file_record(dir_entry, full_stat=full_stat)
+        if metrics is not None:
+            metrics.add_phase_seconds('stat', time.perf_counter() - time_start)
+        if file_record is not None:
+            yield file_record
+
+
+def get_dir_iterator(dir_path: str):
+    """
+    >>> get_dir_iterator('./does_not_exist/') is None
+    True
+    """
+    try:
+        return os.scandir(dir_path)
+    except OSError:
+        logger.debug('can not read directory {}'.format(dir_path))
+        return None
+
+
+def is_dir_entry_directory(dir_entry: os.DirEntry) -> bool:
+    """ directories and symlinks to directories """
+    try:
+        return dir_entry.is_dir()
+    except OSError:
+        return False
+
+
+def get_dir_id(dir_path: str) -> Optional[Tuple[int, int]]:
+    """
+    (st_dev, st_ino) of the directory, the target of a symlink - None if it can not be stat'ed, it is left out of the loop detection
+
+    >>> get_dir_id('./does_not_exist/') is None, get_dir_id('./') is None
+    (True, False)
+    """
+    try:
+        stat_result = os.stat(dir_path)
+    except OSError:
+        return None
+    return stat_result.st_dev, stat_result.st_ino
+
+
+def get_dir_entry_id(dir_entry: os.DirEntry) -> Optional[Tuple[int, int]]:
+    """ like get_dir_id - on posix from the DirEntry without an extra stat, on windows its st_ino is zero """
+    try:
+        stat_result = dir_entry.stat(follow_symlinks=False)
+    except OSError:
+        return None
+    if stat_result.st_ino == 0:
+        return get_dir_id(dir_entry.path)
+    return stat_result.st_dev, stat_result.st_ino
+
+
+def get_file_record(dir_entry: os.DirEntry, full_stat: bool = False) -> Optional[FileRecord]:
+    """
+    returns None for vanished files and for symlinks pointing to directories
+
+    >>> import test
+    >>> timestamp = time.time()
+    >>> test.create_testfiles_fingerprint_1(timestamp)
+    >>> dir_entry = [dir_entry for dir_entry in os.scandir('./testfiles/') if dir_entry.name == 'file1_no_changes.txt'][0]
+    >>> path, stat_result = get_file_record(dir_entry)
+    >>> os.path.basename(path), stat_result.st_size
+    ('file1_no_changes.txt', 0)
+    >>> path, stat_result = get_file_record(dir_entry, full_stat=True)
+    >>> stat_result.st_ino == os.stat(path).st_ino != 0
+    True
+    """
+    try:
+        stat_result = dir_entry.stat()
+        if full_stat and stat_result.st_ino == 0:
+            stat_result = os.stat(dir_entry.path)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        return dir_entry.path, None
+    if stat.S_ISDIR(stat_result.st_mode):
+        return None
+    return dir_entry.path, stat_result
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
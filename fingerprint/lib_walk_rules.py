@@ -0,0 +1,255 @@
+import lib_doctest_pycharm
+import logging
+import os
+import re
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger()
+lib_doctest_pycharm.setup_doctest_logger_for_pycharm()
+
+# include / exclude rules for the directory walk.
+# a rule is a glob (default, or with the prefix 'glob:') or a regular expression (prefix 're:').
+# the rules are matched against the path relative to the fingerprinted directory, with '/' as separator.
+# a glob without '/' matches the name of the file or directory in every depth (like .gitignore), e.g. '*.tmp', '.git'
+# a glob with '/' matches the relative path, '**' matches across directories, e.g. 'users/*/appdata/local/temp', '**/__pycache__'
+# a regular expression is searched in the relative path, e.g. 're:(^|/)cache(/|$)'
+#
+# exclude rules are checked for directories before they are descended - an excluded directory is never listed,
+# nothing below it is stat'ed or hashed. exclude rules win over include rules.
+# include rules are only checked for files - if there are include rules, only the files matching one of them are fingerprinted.
+#
+# rules file : one rule per line, 'exclude <rule>' or 'include <rule>', empty lines and lines starting with '#' are ignored
+
+
+class WalkRule(object):
+    def __init__(self, action: str, rule: str):
+        self.action = action                            # 'include' or 'exclude'
+        self.rule = rule
+        self.is_regex = rule.startswith('re:')
+        self.regex = get_rule_regex(rule)
+        self.n_dirs_pruned: int = 0
+        self.n_files_matched: int = 0
+
+
+class WalkRules(object):
+    """
+    the rules of each action are compiled once (see RuleMatcher) - the matcher tells us which rule matched, so we can count the hits per rule
+
+    >>> walk_rules = WalkRules(l_exclude=['.git', '*.tmp', 're:(^|/)cache(/|$)'], l_include=['*.txt', '*.tmp'])
+    >>> walk_rules.is_dir_excluded('project/.git'), walk_rules.is_dir_excluded('project/src'), walk_rules.is_dir_excluded('app/cache')
+    (True, False, True)
+    >>> walk_rules.is_file_excluded('project/readme.txt'), walk_rules.is_file_excluded('project/setup.py')
+    (False, True)
+    >>> walk_rules.is_file_excluded('project/readme.tmp')      # exclude wins
+    True
+    >>> [(walk_rule.rule, walk_rule.n_dirs_pruned, walk_rule.n_files_matched) for walk_rule in walk_rules.l_rules]
+    [('.git', 1, 0), ('*.tmp', 0, 1), ('re:(^|/)cache(/|$)', 1, 0), ('*.txt', 0, 1), ('*.tmp', 0, 0)]
+    >>> walk_rules.n_files_not_included
+    1
+
+    >>> WalkRules(l_exclude=['re:('])
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid rule "re:(": missing ), unterminated subpattern at position 0
+
+    >>> # backreferences and group names of the regular expressions keep working
+    >>> walk_rules = WalkRules(l_exclude=['*.tmp', 're:^([^/]+)/\\\\1$', 're:(?P<name>^a)/b$', 're:(?P<name>^c)/d$'])
+    >>> walk_rules.is_dir_excluded('build/build'), walk_rules.is_dir_excluded('build/src'), walk_rules.is_dir_excluded('c/d')
+    (True, False, True)
+    """
+    def __init__(self, l_exclude: Iterable[str] = (), l_include: Iterable[str] = ()):
+        self.l_rules: List[WalkRule] = [WalkRule('exclude', rule) for rule in l_exclude] + [WalkRule('include', rule) for rule in l_include]
+        self.exclude_matcher = get_matcher(self.get_rules('exclude'))
+        self.include_matcher = get_matcher(self.get_rules('include'))
+        self.n_files_not_included: int = 0
+
+    def get_rules(self, action: str) -> List[Tuple[int, WalkRule]]:
+        return [(index, walk_rule) for index, walk_rule in enumerate(self.l_rules) if walk_rule.action == action]
+
+    def is_dir_excluded(self, rel_path: str) -> bool:
+        walk_rule = self.match(self.exclude_matcher, rel_path)
+        if walk_rule is None:
+            return False
+        walk_rule.n_dirs_pruned += 1
+        return True
+
+    def is_file_excluded(self, rel_path: str) -> bool:
+        walk_rule = self.match(self.exclude_matcher, rel_path)
+        if walk_rule is not None:
+            walk_rule.n_files_matched += 1
+            return True
+        if self.include_matcher is None:
+            return False
+        walk_rule = self.match(self.include_matcher, rel_path)
+        if walk_rule is None:
+            self.n_files_not_included += 1
+            return True
+        walk_rule.n_files_matched += 1
+        return False
+
+    def match(self, matcher: Optional['RuleMatcher'], rel_path: str) -> Optional[WalkRule]:
+        if matcher is None:
+            return None
+        index = matcher.search(rel_path)
+        if index is None:
+            return None
+        return self.l_rules[index]
+
+    def log_statistics(self):
+        for walk_rule in self.l_rules:
+            if walk_rule.action == 'exclude':
+                logger.info('rule exclude {} : {} directories pruned, {} files excluded'.format(
+                    walk_rule.rule, walk_rule.n_dirs_pruned, walk_rule.n_files_matched))
+            else:
+                logger.info('rule include {} : {} files included'.format(walk_rule.rule, walk_rule.n_files_matched))
+        if self.include_matcher is not None:
+            logger.info('{} files did not match an include rule'.format(self.n_files_not_included))
+
+
+class RuleMatcher(object):
+    """
+    the globs are compiled into a single regular expression, one named group per rule - the group r<index> tells which rule matched.
+    the user regular expressions are compiled one by one, in one alternation their backreferences and group names would break
+    """
+    def __init__(self, l_rules: List[Tuple[int, WalkRule]]):
+        l_globs = [(index, walk_rule) for index, walk_rule in l_rules if not walk_rule.is_regex]
+        self.glob_matcher: Optional[Pattern] = None
+        if l_globs:
+            pattern = '|'.join('(?P<r{}>{})'.format(index, walk_rule.regex) for index, walk_rule in l_globs)
+            self.glob_matcher = re.compile(pattern, get_regex_flags())
+        self.l_regex_matchers: List[Tuple[int, Pattern]] = [(index, re.compile(walk_rule.regex, get_regex_flags()))
+                                                            for index, walk_rule in l_rules if walk_rule.is_regex]
+
+    def search(self, rel_path: str) -> Optional[int]:
+        """ returns the index of the matching rule or None """
+        if self.glob_matcher is not None:
+            match = self.glob_matcher.search(rel_path)
+            if match is not None:
+                return int(match.lastgroup[1:])
+        for index, regex_matcher in self.l_regex_matchers:
+            if regex_matcher.search(rel_path):
+                return index
+        return None
+
+
+def get_matcher(l_rules: List[Tuple[int, WalkRule]]) -> Optional[RuleMatcher]:
+    if not l_rules:
+        return None
+    return RuleMatcher(l_rules)
+
+
+def get_rule_regex(rule: str) -> str:
+    """
+    >>> get_rule_regex('*.tmp')
+    '(?:^|/)[^/]*\\\\.tmp$'
+    >>> get_rule_regex('glob:**/__pycache__')
+    '^(?:.*/)?__pycache__$'
+    >>> get_rule_regex('re:cache$')
+    '(?:cache$)'
+    >>> get_rule_regex('')
+    Traceback (most recent call last):
+    ...
+    ValueError: empty rule
+    """
+    if rule.startswith('re:'):
+        regex = rule[3:]
+        try:
+            re.compile(regex)
+        except re.error as exc:
+            raise ValueError('invalid rule "{}": {}'.format(rule, exc))
+        return '(?:{})'.format(regex)
+
+    if rule.startswith('glob:'):
+        rule = rule[5:]
+    glob = rule.replace('\\', '/').strip('/')
+    if not glob:
+        raise ValueError('empty rule')
+    if '/' in glob:
+        return '^' + translate_glob(glob) + '$'
+    return '(?:^|/)' + translate_glob(glob) + '$'
+
+
+def translate_glob(glob: str) -> str:
+    """
+    '**/' matches zero or more directories, '**' anything, '*' anything but '/', '?' one character but '/'
+
+    >>> translate_glob('a/**/b*.?')
+    'a/(?:.*/)?b[^/]*\\\\.[^/]'
+    """
+    l_regex = list()
+    index = 0
+    while index < len(glob):
+        if glob.startswith('**/', index):
+            l_regex.append('(?:.*/)?')
+            index += 3
+        elif glob.startswith('**', index):
+            l_regex.append('.*')
+            index += 2
+        elif glob[index] == '*':
+            l_regex.append('[^/]*')
+            index += 1
+        elif glob[index] == '?':
+            l_regex.append('[^/]')
+            index += 1
+        else:
+            l_regex.append(re.escape(glob[index]))
+            index += 1
+    return ''.join(l_regex)
+
+
+def get_regex_flags() -> int:
+    """ windows paths are not case sensitive """
+    if os.name == 'nt':
+        return re.IGNORECASE
+    return 0
+
+
+def read_rules_file(rules_file: str) -> Tuple[List[str], List[str]]:
+    """
+    returns the exclude and include rules from a rules file
+
+    >>> with open('./testresults/fp_files_rules.txt', 'w') as f_rules:
+    ...     _ = f_rules.write('# caches\\nexclude .git\\n\\nexclude re:(^|/)temp(/|$)\\ninclude *.txt\\n')
+    >>> read_rules_file('./testresults/fp_files_rules.txt')
+    (['.git', 're:(^|/)temp(/|$)'], ['*.txt'])
+
+    >>> with open('./testresults/fp_files_rules.txt', 'w') as f_rules:
+    ...     _ = f_rules.write('skip .git\\n')
+    >>> read_rules_file('./testresults/fp_files_rules.txt')
+    Traceback (most recent call last):
+    ...
+    ValueError: ./testresults/fp_files_rules.txt line 1: expected "exclude <rule>" or "include <rule>", got "skip .git"
+    """
+    l_exclude = list()
+    l_include = list()
+    with open(rules_file, 'r', encoding='utf-8') as f_rules:
+        for line_number, line in enumerate(f_rules, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            action, _, rule = line.partition(' ')
+            rule = rule.strip()
+            if action == 'exclude' and rule:
+                l_exclude.append(rule)
+            elif action == 'include' and rule:
+                l_include.append(rule)
+            else:
+                raise ValueError('{} line {}: expected "exclude <rule>" or "include <rule>", got "{}"'.format(rules_file, line_number, line))
+    return l_exclude, l_include
+
+
+def get_rel_path(fp_dir: str, path: str) -> str:
+    """
+    the path relative to the fingerprinted directory, with '/' as separator
+
+    >>> get_rel_path('c:\\\\', 'c:\\\\users\\\\test\\\\.git')
+    'users/test/.git'
+    >>> get_rel_path('./testfiles/', './testfiles/sub/file.txt')
+    'sub/file.txt'
+    """
+    return path[len(fp_dir):].replace('\\', '/').lstrip('/')
+
+
+if __name__ == '__main__':
+    logger.info('this is a library and not intended to run stand alone')
+    lib_doctest_pycharm.testmod()
@@ -97,6 +97,8 @@ setup(name=package_name,
 
       # specify what a project minimally needs to run correctly
       install_requires=['typing', 'pathlib'] + required + required_for_tests,
+      # optional - the numpy columnar diff engine (--diff_engine=columnar)
+      extras_require={'columnar': ['numpy']},
       # minimally needs to run the setup script, dependencies must not put here
       setup_requires=['typing',
                       'pathlib',